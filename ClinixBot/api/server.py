@@ -0,0 +1,239 @@
+import asyncio
+import json
+import os
+import sys
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+# 从ClinixBot目录运行: uvicorn api.server:app --workers 4
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.index_rebuilder import IndexRebuilder
+from utils.language_detector import LanguageDetector
+from utils.telemetry import telemetry
+
+# 批量请求的最大条数和单个进程内同时执行的模型调用数
+MAX_BATCH_SIZE = int(os.getenv("CLINIXBOT_MAX_BATCH_SIZE", "32"))
+MODEL_CONCURRENCY = int(os.getenv("CLINIXBOT_MODEL_CONCURRENCY", "8"))
+
+
+class DiagnosisRequest(BaseModel):
+    symptoms: str = Field(..., min_length=1)
+    language: Optional[str] = None  # 为空时根据症状描述自动识别
+    retrieval_query: Optional[str] = None  # 多轮对话时的检索查询(当前消息加简短摘要)，为空时使用symptoms
+    message: Optional[str] = None  # 多轮对话时患者当前这条消息，本地分类只针对它，为空时使用symptoms
+
+
+class TriageCondition(BaseModel):
+    condition: str
+    name: str
+    confidence: float
+
+
+class DiagnosisResponse(BaseModel):
+    diagnosis: str
+    sources: List[str]
+    language: str
+    has_diagnosis: bool
+    triage: List[TriageCondition] = []
+
+
+class TriageRequest(BaseModel):
+    text: str = Field(..., min_length=1)
+    language: Optional[str] = None
+
+
+class TriageResponse(BaseModel):
+    conditions: List[TriageCondition]
+    provisional: Optional[TriageCondition] = None
+    red_flag: bool = False  # 出现胸痛、卒中表现等危险信号，此时不给出快速答复
+
+
+class MedicationRequest(BaseModel):
+    diagnosis: str = Field(..., min_length=1)
+    language: Optional[str] = None
+
+
+class MedicationResponse(BaseModel):
+    medications: str
+    language: str
+
+
+class BatchRequest(BaseModel):
+    items: List[DiagnosisRequest]
+
+
+class BatchResponse(BaseModel):
+    results: List[DiagnosisResponse]
+
+
+class SummaryRequest(BaseModel):
+    summary: str = ""
+    turns: List[List[str]]
+    language: Optional[str] = None
+
+
+class SummaryResponse(BaseModel):
+    summary: str
+
+
+app = FastAPI(title="ClinixBot API")
+detector = LanguageDetector()
+
+
+def _load_model():
+    """每个工作进程持有一个模型实例，CLINIXBOT_MODEL_FACTORY可指定其他构造函数(模块:函数)"""
+    factory = os.getenv("CLINIXBOT_MODEL_FACTORY")
+    if factory:
+        module_name, _, function_name = factory.partition(":")
+        module = __import__(module_name, fromlist=[function_name])
+        return getattr(module, function_name)()
+
+    from models.rag_model import MedicalRAGModel
+    return MedicalRAGModel()
+
+
+@app.on_event("startup")
+async def startup():
+    # 模型构建(加载数据、建立向量库)是阻塞操作，放到线程池执行
+    app.state.model = await run_in_threadpool(_load_model)
+    app.state.model_slots = asyncio.Semaphore(MODEL_CONCURRENCY)
+    # 各工作进程都运行重建器，构建锁保证只有一个进程实际重建，其余进程从CURRENT获取新版本
+    if hasattr(app.state.model, "index_store"):
+        app.state.rebuilder = IndexRebuilder.from_env(app.state.model).start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    rebuilder = getattr(app.state, "rebuilder", None)
+    if rebuilder is not None:
+        rebuilder.stop()
+
+
+def _model():
+    model = getattr(app.state, "model", None)
+    if model is None:
+        raise HTTPException(status_code=503, detail="model is loading")
+    return model
+
+
+def _language(model, language, text):
+    return model.resolve_language(language or detector.detect(text))
+
+
+async def _call_model(func, *args, **kwargs):
+    """在线程池中执行阻塞的模型调用，并限制进程内的并发数"""
+    async with app.state.model_slots:
+        return await run_in_threadpool(func, *args, **kwargs)
+
+
+async def _diagnose(request):
+    model = _model()
+    language = _language(model, request.language, request.message or request.symptoms)
+    result = await _call_model(
+        model.get_diagnosis, request.symptoms, language=language,
+        retrieval_query=request.retrieval_query, message=request.message,
+    )
+    return DiagnosisResponse(
+        diagnosis=result["diagnosis"],
+        sources=result["sources"],
+        language=language,
+        has_diagnosis=model.has_diagnosis(result["diagnosis"]),
+        triage=result.get("triage", []),
+    )
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok" if getattr(app.state, "model", None) is not None else "loading"}
+
+
+@app.get("/v1/languages")
+async def languages():
+    """已注册提示词的语言及其诊断标记和错误提示，供瘦客户端使用"""
+    from models.rag_model import DEFAULT_LANGUAGE, LANGUAGE_PROFILES
+    return {
+        "default": DEFAULT_LANGUAGE,
+        "languages": {
+            code: {
+                "diagnosis_marker": profile["diagnosis_marker"],
+                "diagnosis_error": profile["diagnosis_error"],
+                "medication_error": profile["medication_error"],
+            }
+            for code, profile in LANGUAGE_PROFILES.items()
+        },
+    }
+
+
+@app.get("/v1/router/stats")
+async def router_stats():
+    """分级模型路由各层的调用次数、升级率、耗时、token和费用估算"""
+    router = getattr(_model(), "model_router", None)
+    return router.stats() if router is not None else {}
+
+
+@app.post("/v1/triage", response_model=TriageResponse)
+async def triage(request: TriageRequest):
+    """本地分类器的快速结果，不调用大模型，直接在事件循环中执行"""
+    model = _model()
+    return model.triage(request.text, language=_language(model, request.language, request.text))
+
+
+@app.post("/v1/diagnosis", response_model=DiagnosisResponse)
+async def diagnosis(request: DiagnosisRequest):
+    with telemetry.span("api.diagnosis"):
+        return await _diagnose(request)
+
+
+@app.post("/v1/medications", response_model=MedicationResponse)
+async def medications(request: MedicationRequest):
+    model = _model()
+    language = _language(model, request.language, request.diagnosis)
+    with telemetry.span("api.medications"):
+        text = await _call_model(model.get_medication_recommendations, request.diagnosis, language=language)
+    return MedicationResponse(medications=text, language=language)
+
+
+@app.post("/v1/diagnosis/batch", response_model=BatchResponse)
+async def diagnosis_batch(request: BatchRequest):
+    if len(request.items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"batch size exceeds {MAX_BATCH_SIZE}")
+    with telemetry.span("api.diagnosis_batch", items=len(request.items)):
+        results = await asyncio.gather(*(_diagnose(item) for item in request.items))
+    return BatchResponse(results=results)
+
+
+@app.post("/v1/diagnosis/stream")
+async def diagnosis_stream(request: DiagnosisRequest):
+    """以Server-Sent Events返回诊断：triage事件、sources事件、逐段的token事件和最终的done事件"""
+    model = _model()
+    language = _language(model, request.language, request.message or request.symptoms)
+
+    async def events():
+        # 整个流式生成期间占用一个模型槽位，流式请求与普通请求共用同一并发上限；
+        # 客户端断开时生成器被关闭，槽位随之释放
+        async with app.state.model_slots:
+            stream = model.stream_diagnosis(
+                request.symptoms, language=language,
+                retrieval_query=request.retrieval_query, message=request.message,
+            )
+            # 同步生成器在线程池中逐步迭代，不阻塞事件循环
+            async for event, data in iterate_in_threadpool(stream):
+                if event == "done":
+                    data = {"diagnosis": data, "language": language, "has_diagnosis": model.has_diagnosis(data)}
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.post("/v1/summaries", response_model=SummaryResponse)
+async def summaries(request: SummaryRequest):
+    model = _model()
+    language = model.resolve_language(request.language)
+    turns = [tuple(turn[:2]) for turn in request.turns]
+    summary = await _call_model(model.summarize_conversation, request.summary, turns, language=language)
+    return SummaryResponse(summary=summary)
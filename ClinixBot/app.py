@@ -1,18 +1,13 @@
 # app.py
 
-import streamlit as st
-import pandas as pd
-import numpy as np
 import os
+import streamlit as st
 from dotenv import load_dotenv
-from components.chat_interface import ChatInterface
-from components.visualization_dashboard import VisualizationDashboard
-from components.pharmacy_finder import PharmacyFinder
-from components.hospital_finder import HospitalFinder
-from utils.data_processor import DataProcessor
-from models.rag_model import MedicalRAGModel
 from utils.language_utils import LanguageUtils
 
+# 组件、模型及其依赖(langchain、plotly、folium等)在首次进入对应视图时才导入，
+# 启动时只加载页面框架；各视图的导入耗时可用 python -m benchmarks.profile_imports 查看
+
 # 加载环境变量
 load_dotenv()
 
@@ -100,6 +95,14 @@ if 'recommended_medications' not in st.session_state:
 if 'active_view' not in st.session_state:
     st.session_state.active_view = "chat"
 
+# 导航菜单的翻译键 -> 视图
+NAV_VIEWS = {
+    "chat_option": "chat",
+    "data_option": "data",
+    "pharmacy_option": "pharmacy",
+    "hospital_option": "hospital",
+}
+
 # 初始化语言设置 (默认为英文)
 if 'language' not in st.session_state:
     st.session_state.language = "en"
@@ -125,17 +128,40 @@ with top_col2:
 # 加载模型和数据
 @st.cache_resource
 def load_rag_model():
-    return MedicalRAGModel()
+    # 设置CLINIXBOT_API_URL时诊断交给独立部署的API服务(api/server.py)，界面只作为客户端
+    api_url = os.getenv("CLINIXBOT_API_URL")
+    if api_url:
+        from models.remote_model import RemoteMedicalModel
+        return RemoteMedicalModel(api_url)
+    from models.rag_model import MedicalRAGModel
+    from utils.index_rebuilder import IndexRebuilder
+    model = MedicalRAGModel()
+    # 数据更新后在后台重建索引并热替换，不需要重启应用或清除缓存
+    model.index_rebuilder = IndexRebuilder.from_env(model).start()
+    return model
 
 @st.cache_data
 def load_medical_data():
+    import pandas as pd
+    from utils.data_processor import DataProcessor
     data = pd.read_csv("data/hospital_records_2021_2024_with_bills.csv")
     processor = DataProcessor()
     return processor.preprocess_data(data)
 
-# 加载数据和模型
-rag_model = load_rag_model()
-medical_data = load_medical_data()
+@st.cache_resource
+def load_database():
+    from utils.database import DatabaseManager
+    return DatabaseManager()
+
+@st.cache_resource
+def load_log_writer():
+    from utils.log_writer import AsyncLogWriter
+    return AsyncLogWriter(load_database())
+
+@st.cache_resource
+def load_analytics_engine():
+    from utils.analytics_engine import AnalyticsEngine
+    return AnalyticsEngine(load_medical_data())
 
 # 应用标题
 with top_col1:
@@ -150,40 +176,35 @@ with st.sidebar:
     # 导航菜单
     selected_view = st.radio(
         ":",
-        [
-            LanguageUtils.get_text("general", "chat_option", st.session_state.language),
-            LanguageUtils.get_text("general", "data_option", st.session_state.language),
-            LanguageUtils.get_text("general", "pharmacy_option", st.session_state.language),
-            LanguageUtils.get_text("general", "hospital_option", st.session_state.language)
-        ]
+        [LanguageUtils.get_text("general", key, st.session_state.language) for key in NAV_VIEWS]
     )
     
-    if selected_view == LanguageUtils.get_text("general", "chat_option", st.session_state.language):
-        st.session_state.active_view = "chat"
-    elif selected_view == LanguageUtils.get_text("general", "data_option", st.session_state.language):
-        st.session_state.active_view = "data"
-    elif selected_view == LanguageUtils.get_text("general", "pharmacy_option", st.session_state.language):
-        st.session_state.active_view = "pharmacy"
-    elif selected_view == LanguageUtils.get_text("general", "hospital_option", st.session_state.language):
-        st.session_state.active_view = "hospital"
+    # 通过反查索引把选中的文本映射回视图
+    st.session_state.active_view = NAV_VIEWS.get(
+        LanguageUtils.key_for_label("general", selected_view), st.session_state.active_view
+    )
     
     st.divider()
     st.caption(LanguageUtils.get_text("general", "copyright", st.session_state.language))
 
 # 主内容区域
 if st.session_state.active_view == "chat":
-    chat_interface = ChatInterface(rag_model, st.session_state.language)
+    from components.chat_interface import ChatInterface
+    chat_interface = ChatInterface(load_rag_model(), st.session_state.language, db=load_database(), log_writer=load_log_writer())
     chat_interface.render()
     
 elif st.session_state.active_view == "data":
-    visualization_dashboard = VisualizationDashboard(medical_data, st.session_state.language)
+    from components.visualization_dashboard import VisualizationDashboard
+    visualization_dashboard = VisualizationDashboard(load_medical_data(), st.session_state.language, engine=load_analytics_engine())
     visualization_dashboard.render()
     
 elif st.session_state.active_view == "pharmacy":
+    from components.pharmacy_finder import PharmacyFinder
     pharmacy_finder = PharmacyFinder(st.session_state.language)
     pharmacy_finder.render()
     
 elif st.session_state.active_view == "hospital":
+    from components.hospital_finder import HospitalFinder
     hospital_finder = HospitalFinder(st.session_state.language)
     hospital_finder.render()
 
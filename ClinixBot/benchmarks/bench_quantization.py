@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+# 从ClinixBot目录运行: python -m benchmarks.bench_quantization
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_rag import _git_commit, _percentiles
+from utils.vector_index import QUANTIZATIONS, VectorIndexStore
+
+
+def synthetic_vectors(rows, dimensions, clusters, seed=0):
+    """成簇的单位向量，近似真实向量化结果中相似记录聚集的分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, rows)] + 0.35 * rng.standard_normal((rows, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_published(root):
+    """读取已发布索引的当前版本(float32向量和文档)"""
+    store = VectorIndexStore(root)
+    index = store.current()
+    if index is None:
+        raise SystemExit(f"{root} 中没有已发布的索引")
+    return np.asarray(index.vectors, dtype=np.float32), [index.document(i) for i in range(len(index))]
+
+
+def make_queries(vectors, count, noise, seed=1):
+    """在随机选取的记录向量上加噪声作为查询"""
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.integers(0, len(vectors), count)]
+    queries = picked + noise * rng.standard_normal(picked.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def evaluate(vectors, documents, queries, k, rerank_factors):
+    """对每种量化方式和精排倍数测量recall@k、检索耗时和内存占用"""
+    workdir = tempfile.mkdtemp(prefix="clinixbot-quant-")
+    try:
+        exact_store = VectorIndexStore(os.path.join(workdir, "none"))
+        exact_store.publish(vectors, documents)
+        exact = exact_store.current()
+        truth = [{i for i, _ in exact.search(query, k)} for query in queries]
+
+        results = []
+        for quantization in QUANTIZATIONS:
+            store = VectorIndexStore(os.path.join(workdir, quantization), quantization=quantization)
+            store.publish(vectors, documents)
+            index = store.current()
+            footprint = index.memory_footprint()
+            for rerank_factor in (rerank_factors if quantization != "none" else [1]):
+                latencies, hits = [], 0
+                for query, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    found = index.search(query, k, rerank_factor=rerank_factor)
+                    latencies.append(time.perf_counter() - started)
+                    hits += len(expected & {i for i, _ in found})
+                results.append({
+                    "quantization": quantization,
+                    "rerank_factor": rerank_factor if quantization != "none" else None,
+                    f"recall_at_{k}": round(hits / (len(queries) * k), 4),
+                    "search_bytes": footprint["search_bytes"],
+                    "search_bytes_per_row": round(footprint["search_bytes"] / len(vectors), 1),
+                    "compression": round(exact.memory_footprint()["search_bytes"] / footprint["search_bytes"], 2),
+                    "latency": _percentiles(latencies),
+                })
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量化向量存储的内存/召回率对比")
+    parser.add_argument("--index", help="已发布的索引目录(如vector_store)；未指定时使用合成数据")
+    parser.add_argument("--rows", type=int, default=20000, help="合成数据的行数")
+    parser.add_argument("--dimensions", type=int, default=1536, help="合成数据的维度(与OpenAI向量一致)")
+    parser.add_argument("--clusters", type=int, default=50, help="合成数据的簇数")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--noise", type=float, default=0.05, help="查询相对记录向量的噪声")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank-factors", type=int, nargs="+", default=[1, 4, 10])
+    parser.add_argument("--output", help="结果JSON路径，默认benchmarks/results/quantization_<commit>_<时间>.json")
+    args = parser.parse_args()
+
+    if args.index:
+        vectors, documents = load_published(args.index)
+        source = {"index": args.index}
+    else:
+        from langchain.docstore.document import Document
+        vectors = synthetic_vectors(args.rows, args.dimensions, args.clusters)
+        documents = [Document(page_content=f"row {i}", metadata={"row": i}) for i in range(len(vectors))]
+        source = {"synthetic": {"rows": args.rows, "dimensions": args.dimensions, "clusters": args.clusters}}
+
+    queries = make_queries(vectors, args.queries, args.noise)
+    report = {
+        "benchmark": "vector_quantization",
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "data": {**source, "rows": int(len(vectors)), "dimensions": int(vectors.shape[1])},
+        "config": {"queries": args.queries, "noise": args.noise, "k": args.k},
+        "results": evaluate(vectors, documents, queries, args.k, args.rerank_factors),
+    }
+
+    output = args.output
+    if not output:
+        results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"quantization_{report['commit'] or 'nocommit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# 从ClinixBot目录运行: python -m benchmarks.bench_rag
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_server import StubOpenAIServer
+
+QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "queries.json")
+
+
+def _percentiles(values):
+    """返回均值和p50/p95/p99(毫秒)"""
+    if not values:
+        return {}
+    values = np.asarray(values) * 1000
+    return {
+        "count": int(len(values)),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class DirectEmbeddings:
+    """
+    直接把原文发给桩服务/v1/embeddings的向量化客户端
+
+    当前langchain版本的OpenAIEmbeddings总是先用tiktoken切分token，离线环境下无法下载编码表，
+    默认改用这个客户端；--embeddings openai仍使用OpenAIEmbeddings
+    """
+
+    def __init__(self, base_url, model="text-embedding-ada-002"):
+        self.base_url = base_url
+        self.model = model
+
+    def embed_documents(self, texts, batch_size=256):
+        import openai
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            response = openai.Embedding.create(
+                input=texts[start:start + batch_size], model=self.model, api_base=self.base_url, api_key="stub"
+            )
+            vectors.extend(item["embedding"] for item in sorted(response["data"], key=lambda item: item["index"]))
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def __call__(self, text):
+        return self.embed_query(text)
+
+
+def build_model(server, embeddings_backend="direct", small_model=None):
+    """构建指向桩服务的MedicalRAGModel，small_model不为空时在大模型前加一层小模型路由"""
+    # openai客户端和langchain都从这里读取服务地址和密钥
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["OPENAI_API_BASE"] = server.base_url
+
+    import openai
+    from langchain.chat_models import ChatOpenAI
+    from langchain.embeddings.openai import OpenAIEmbeddings
+    from models.model_router import ModelTier, TieredModelRouter, chat_completer
+    from models.rag_model import MedicalRAGModel
+
+    openai.api_base = server.base_url
+    llm = ChatOpenAI(model_name="gpt-4-turbo", temperature=0.2, openai_api_base=server.base_url, openai_api_key="stub")
+    if embeddings_backend == "openai":
+        embeddings = OpenAIEmbeddings(openai_api_base=server.base_url, openai_api_key="stub")
+    else:
+        embeddings = DirectEmbeddings(server.base_url)
+    model_router = None
+    if small_model:
+        small_llm = ChatOpenAI(model_name=small_model, temperature=0.2, openai_api_base=server.base_url, openai_api_key="stub")
+        model_router = TieredModelRouter([
+            ModelTier("small", chat_completer(small_llm), model_name=small_model),
+            ModelTier("large", chat_completer(llm), model_name="gpt-4-turbo"),
+        ])
+    # 向量库写到临时目录，不覆盖仓库中的vector_store
+    return MedicalRAGModel(llm=llm, embeddings=embeddings, model_router=model_router,
+                           vector_store_path=tempfile.mkdtemp(prefix="clinixbot-bench-"))
+
+
+def run_query(model, query):
+    """跑一次完整的诊断+用药推荐，返回(总耗时, 诊断各阶段耗时, 用药各阶段耗时)"""
+    diagnosis_timings, medication_timings = {}, {}
+    started = time.perf_counter()
+    result = model.get_diagnosis(query["text"], language=query["language"], timings=diagnosis_timings)
+    if model.has_diagnosis(result["diagnosis"]):
+        model.get_medication_recommendations(result["diagnosis"], language=query["language"], timings=medication_timings)
+    return time.perf_counter() - started, diagnosis_timings, medication_timings
+
+
+def run_benchmark(args):
+    with open(QUERIES_PATH, encoding="utf-8") as f:
+        queries = json.load(f)
+
+    server = StubOpenAIServer(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        embed_latency_ms=args.embed_latency_ms,
+        dimensions=args.dimensions,
+    ).start()
+
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        model = build_model(server, args.embeddings, args.small_model)
+        startup_seconds = time.perf_counter() - started
+
+        # 顺序执行，采集各阶段耗时
+        stages = {}
+        latencies = []
+        for _ in range(args.repeat):
+            for query in queries:
+                total, diagnosis_timings, medication_timings = run_query(model, query)
+                latencies.append(total)
+                for name, seconds in diagnosis_timings.items():
+                    stages.setdefault(f"diagnosis.{name}", []).append(seconds)
+                for name, seconds in medication_timings.items():
+                    stages.setdefault(f"medication.{name}", []).append(seconds)
+
+        # 不同并发度下的吞吐量
+        throughput = []
+        for concurrency in args.concurrency:
+            workload = queries * args.repeat
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                started = time.perf_counter()
+                results = list(pool.map(lambda query: run_query(model, query)[0], workload))
+                elapsed = time.perf_counter() - started
+            throughput.append({
+                "concurrency": concurrency,
+                "requests": len(workload),
+                "seconds": round(elapsed, 3),
+                "requests_per_second": round(len(workload) / elapsed, 3),
+                "latency": _percentiles(results),
+            })
+
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        server.stop()
+
+    # Linux上ru_maxrss单位为KB，macOS上为字节
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss_mb = max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+    return {
+        "benchmark": "rag_diagnosis",
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "latency_ms": args.latency_ms,
+            "tokens_per_second": args.tokens_per_second,
+            "embed_latency_ms": args.embed_latency_ms,
+            "dimensions": args.dimensions,
+            "embeddings": args.embeddings,
+            "small_model": args.small_model,
+            "queries": len(queries),
+            "repeat": args.repeat,
+        },
+        "startup_seconds": round(startup_seconds, 3),
+        "end_to_end": _percentiles(latencies),
+        "stages": {name: _percentiles(values) for name, values in sorted(stages.items())},
+        "throughput": throughput,
+        "memory": {
+            "python_peak_mb": round(peak / (1024 * 1024), 2),
+            "max_rss_mb": round(max_rss_mb, 2),
+        },
+        "stub_requests": server.requests,
+        "model_router": model.model_router.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用本地桩服务测量RAG诊断流程性能")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="每次对话补全的固定延迟")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="模拟的输出速度")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0, help="每次向量化请求的延迟")
+    parser.add_argument("--dimensions", type=int, default=256, help="桩向量维度")
+    parser.add_argument("--embeddings", choices=["direct", "openai"], default="direct",
+                        help="direct: 原文直接发给桩服务; openai: 使用langchain的OpenAIEmbeddings(需要tiktoken编码表)")
+    parser.add_argument("--small-model", help="在大模型前加一层该名称的小模型(同样由桩服务应答)，测量分级路由")
+    parser.add_argument("--repeat", type=int, default=1, help="查询集重复次数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8], help="吞吐量测试的并发度")
+    parser.add_argument("--output", help="结果JSON路径，默认benchmarks/results/rag_<commit>_<时间>.json")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+
+    output = args.output
+    if not output:
+        results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"rag_{report['commit'] or 'nocommit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import argparse
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 从ClinixBot目录运行: python -m benchmarks.eval_retrieval
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_rag import _git_commit
+from utils.triage_classifier import SYMPTOM_TERMS, TriageClassifier
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "data", "hospital_records_2021_2024_with_bills.csv")
+
+
+class HashingEmbeddings:
+    """
+    本地特征哈希向量化：字符n-gram哈希到固定维度后做L2归一化
+
+    不需要网络和模型文件，相似的文本得到相近的向量，用于离线比较检索配置；
+    绝对分数与OpenAI向量不同，应只比较同一后端下各配置的相对差异。
+    """
+
+    def __init__(self, dimensions=1024, ngram_range=(2, 4)):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self.model = f"hashing-char{ngram_range[0]}-{ngram_range[1]}-{dimensions}"
+        self._vectorizer = HashingVectorizer(analyzer="char_wb", ngram_range=ngram_range, n_features=dimensions,
+                                             alternate_sign=False, norm="l2")
+
+    def embed_documents(self, texts):
+        return self._vectorizer.transform(texts).toarray().astype(np.float32).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def __call__(self, text):
+        return self.embed_query(text)
+
+
+def _tokenize(text):
+    """英文按词、中文按字切分"""
+    return re.findall(r"[a-z0-9]+|[一-鿿]", text.lower())
+
+
+class BM25:
+    """文档集合上的BM25词法打分，用于混合检索配置"""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        tokenized = [_tokenize(doc) for doc in documents]
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.float32)
+        postings = {}
+        for i, tokens in enumerate(tokenized):
+            for term in set(tokens):
+                postings.setdefault(term, []).append((i, tokens.count(term)))
+
+        self.size = len(documents)
+        norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0))
+        self._postings = {}
+        for term, entries in postings.items():
+            rows = np.array([i for i, _ in entries], dtype=np.int64)
+            tf = np.array([count for _, count in entries], dtype=np.float32)
+            idf = np.log(1 + (self.size - len(rows) + 0.5) / (len(rows) + 0.5))
+            self._postings[term] = (rows, idf * tf * (k1 + 1) / (tf + norm[rows]))
+
+    def scores(self, text):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(_tokenize(text)):
+            if term in self._postings:
+                rows, weights = self._postings[term]
+                scores[rows] += weights
+        return scores
+
+
+def split_records(data_path, holdout, seed=0):
+    """
+    把记录分为建索引的部分和留出部分，留出记录只用来生成查询
+
+    按医生备注文本分组留出：同一备注的记录全部进入同一侧。记录中的备注大量重复，
+    按行随机抽样时留出的备注几乎都在索引中原样出现，notes查询就成了精确匹配
+    """
+    records = pd.read_csv(data_path).dropna(subset=["Medical Condition"]).reset_index(drop=True)
+    if not holdout:
+        return records, records.iloc[:0]
+    notes = pd.Series(records["Doctor's Notes"].fillna("").unique())
+    held_notes = set(notes.sample(frac=holdout, random_state=seed))
+    is_held = records["Doctor's Notes"].fillna("").isin(held_notes)
+    return records[~is_held].reset_index(drop=True), records[is_held].reset_index(drop=True)
+
+
+def split_symptom_terms(holdout, seed=0):
+    """
+    每个疾病每种语言的症状描述按比例留出(至少一条)，返回(训练词表, 留出词表)
+
+    分诊分类器只用训练词表训练，留出的描述作为查询，避免预筛选在训练过的短语上虚高
+    """
+    rng = np.random.default_rng(seed)
+    train, held = {}, {}
+    for condition, terms in SYMPTOM_TERMS.items():
+        for language, phrases in terms.items():
+            order = rng.permutation(len(phrases))
+            count = max(1, round(holdout * len(phrases))) if holdout and len(phrases) > 1 else 0
+            held.setdefault(condition, {})[language] = [phrases[i] for i in sorted(order[:count])]
+            train.setdefault(condition, {})[language] = [phrases[i] for i in sorted(order[count:])]
+    return train, held
+
+
+def generate_queries(indexed, held, held_terms):
+    """
+    自动生成带标注的查询，每条查询的期望疾病为label
+
+    notes: 留出记录的医生备注(按文本去重)，对应记录的疾病
+    symptoms_en / symptoms_zh: 留出的患者口语化症状描述，对应词表中的疾病
+    """
+    queries = []
+    for note, condition in dict.fromkeys(zip(held["Doctor's Notes"].fillna(""), held["Medical Condition"])):
+        if note:
+            queries.append({"set": "notes", "language": "en", "text": note, "label": condition})
+
+    conditions = set(indexed["Medical Condition"])
+    for condition, terms in held_terms.items():
+        if condition not in conditions:
+            continue
+        for language in ("en", "zh"):
+            for phrase in terms.get(language, []):
+                queries.append({"set": f"symptoms_{language}", "language": language, "text": phrase, "label": condition})
+    return queries
+
+
+def _hybrid_search(model, lexical, embedding, text, k, weight, conditions):
+    """向量距离和BM25分数分别做min-max归一化后按weight加权融合，返回文档行号"""
+    index = model.vector_store
+    candidates = model._candidate_rows(conditions)
+    size = len(index) if candidates is None else len(candidates)
+    found = index.search(embedding, k=size, candidates=candidates)
+    rows = np.array([i for i, _ in found], dtype=np.int64)
+    distances = np.array([d for _, d in found], dtype=np.float32)
+
+    vector = 1 - (distances - distances.min()) / max(float(np.ptp(distances)), 1e-12)
+    lexical_scores = lexical.scores(text)[rows]
+    lexical_scores = lexical_scores / max(float(lexical_scores.max()), 1e-12)
+    fused = (1 - weight) * vector + weight * lexical_scores
+    return rows[np.argsort(-fused, kind="stable")[:k]]
+
+
+def _metrics(ranks, latencies, ks):
+    """ranks: 每条查询第一个相关文档的名次(从1开始，未命中为None)"""
+    ranks = list(ranks)
+    result = {f"recall@{k}": round(sum(1 for r in ranks if r is not None and r <= k) / len(ranks), 4) for k in ks}
+    result["mrr"] = round(sum(1 / r for r in ranks if r is not None) / len(ranks), 4)
+    latencies = np.asarray(latencies) * 1000
+    result["search_p50_ms"] = round(float(np.percentile(latencies, 50)), 3)
+    result["search_p95_ms"] = round(float(np.percentile(latencies, 95)), 3)
+    return result
+
+
+def evaluate_config(model, lexical, labels, queries, ks, weight, prefilter):
+    """用一组检索配置跑全部查询，按查询集合分别统计"""
+    k = max(ks)
+    model.retrieval_k = k
+    index = model.vector_store
+    per_set = {}
+    for query in queries:
+        conditions = model.triage(query["text"], query["language"])["conditions"] if prefilter else None
+        if weight:
+            embedding = model.embeddings.embed_query(query["text"])
+            started = time.perf_counter()
+            rows = _hybrid_search(model, lexical, embedding, query["text"], k, weight, conditions)
+            seconds = time.perf_counter() - started
+            retrieved = [labels[index.document(int(i)).metadata["row"]] for i in rows]
+        else:
+            # 与线上诊断相同的检索路径(查询向量缓存 + 分诊预筛选 + 向量检索)，只计检索阶段耗时
+            timings = {}
+            documents = model._retrieve(query["text"], timings, conditions)
+            seconds = timings["search"]
+            retrieved = [labels[doc.metadata["row"]] for doc in documents]
+
+        rank = next((position + 1 for position, label in enumerate(retrieved) if label == query["label"]), None)
+        ranks, latencies = per_set.setdefault(query["set"], ([], []))
+        ranks.append(rank)
+        latencies.append(seconds)
+
+    results = {name: _metrics(ranks, latencies, ks) for name, (ranks, latencies) in per_set.items()}
+    all_ranks = [r for ranks, _ in per_set.values() for r in ranks]
+    all_latencies = [s for _, latencies in per_set.values() for s in latencies]
+    results["all"] = _metrics(all_ranks, all_latencies, ks)
+    return results
+
+
+def build_model(index_csv, workdir, embeddings, triage_classifier, chunk_size, chunk_overlap, quantization):
+    """在临时目录中按给定分块和量化方式建索引的MedicalRAGModel"""
+    from langchain.chat_models import ChatOpenAI
+    from models.rag_model import MedicalRAGModel
+
+    # 检索评估不调用大模型，客户端只是构造参数
+    llm = ChatOpenAI(model_name="gpt-4-turbo", openai_api_key="offline")
+    return MedicalRAGModel(
+        llm=llm, embeddings=embeddings, data_path=index_csv, triage_classifier=triage_classifier,
+        vector_store_path=os.path.join(workdir, f"index_{chunk_size}_{chunk_overlap}_{quantization}"),
+        vector_quantization=quantization, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+    )
+
+
+def run_evaluation(args):
+    indexed, held = split_records(args.data, args.holdout, args.seed)
+    train_terms, held_terms = split_symptom_terms(args.holdout, args.seed)
+    queries = generate_queries(indexed, held, held_terms)
+    labels = indexed["Medical Condition"].tolist()
+    embeddings = HashingEmbeddings(args.dimensions)
+
+    workdir = tempfile.mkdtemp(prefix="clinixbot-eval-")
+    try:
+        index_csv = os.path.join(workdir, "records.csv")
+        indexed.to_csv(index_csv, index=False)
+        # 分诊分类器只用建索引的记录和训练词表训练，留出的查询对它同样是新数据
+        triage_classifier = TriageClassifier.from_records(index_csv, symptom_terms=train_terms)
+
+        results = []
+        for chunking, quantization in itertools.product(args.chunking, args.quantizations):
+            chunk_size, chunk_overlap = (int(part) for part in chunking.split(":"))
+            started = time.perf_counter()
+            model = build_model(index_csv, workdir, embeddings, triage_classifier, chunk_size, chunk_overlap, quantization)
+            build_seconds = time.perf_counter() - started
+            if model._fallback_store is not None:
+                raise SystemExit(f"分块{chunking}、量化{quantization}的索引构建失败")
+            index = model.vector_store
+            lexical = BM25([index.document(i).page_content for i in range(len(index))])
+            footprint = index.memory_footprint()
+
+            for weight, prefilter in itertools.product(args.hybrid_weights, args.prefilter):
+                results.append({
+                    "config": {
+                        "chunk_size": chunk_size,
+                        "chunk_overlap": chunk_overlap,
+                        "quantization": quantization,
+                        "hybrid_weight": weight,
+                        "prefilter": prefilter == "on",
+                    },
+                    "chunks": len(index),
+                    "search_bytes": footprint["search_bytes"],
+                    "build_s": round(build_seconds, 2),
+                    "metrics": evaluate_config(model, lexical, labels, queries, args.ks, weight, prefilter == "on"),
+                })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    query_sets = {}
+    for query in queries:
+        query_sets[query["set"]] = query_sets.get(query["set"], 0) + 1
+    return {
+        "benchmark": "retrieval_eval",
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "data": {
+            "path": args.data,
+            "indexed_records": len(indexed),
+            "held_out_records": len(held),
+            "methodology": "grouped holdout by unique Doctor's Notes text: no held-out note appears in the index; "
+                           "symptom phrases are held out from the triage classifier's training terms",
+        },
+        "queries": query_sets,
+        "config": {"embeddings": embeddings.model, "ks": args.ks, "holdout": args.holdout, "seed": args.seed},
+        "results": results,
+    }
+
+
+def print_table(report, query_set="all"):
+    """各配置并排输出一个查询集合的指标"""
+    ks = report["config"]["ks"]
+    header = f"{'chunk':>9} {'quant':>7} {'hybrid':>6} {'filter':>6} " + " ".join(f"{'R@' + str(k):>6}" for k in ks) \
+        + f" {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8}"
+    print(f"\n[{query_set}] {report['queries'].get(query_set, sum(report['queries'].values()))} 条查询")
+    print(header)
+    for result in report["results"]:
+        config, metrics = result["config"], result["metrics"].get(query_set)
+        if metrics is None:
+            continue
+        print(f"{config['chunk_size']:>5}:{config['chunk_overlap']:<3} {config['quantization']:>7} "
+              f"{config['hybrid_weight']:>6} {'on' if config['prefilter'] else 'off':>6} "
+              + " ".join(f"{metrics[f'recall@{k}']:>6.3f}" for k in ks)
+              + f" {metrics['mrr']:>6.3f} {metrics['search_p50_ms']:>8.3f} {metrics['search_p95_ms']:>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线检索质量与耗时评估(recall@k、MRR、p50/p95检索耗时)")
+    parser.add_argument("--data", default=DATA_PATH, help="就诊记录CSV")
+    parser.add_argument("--holdout", type=float, default=0.2, help="留出用于生成查询的记录和症状描述比例，留出部分不参与建索引和分诊训练")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dimensions", type=int, default=1024, help="哈希向量维度")
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5, 10], help="统计recall@k的k值，检索取最大值")
+    parser.add_argument("--chunking", nargs="+", default=["1000:200", "300:50"], help="分块配置，格式为 大小:重叠")
+    parser.add_argument("--quantizations", nargs="+", default=["none", "float16", "int8"],
+                        choices=["none", "float16", "int8"])
+    parser.add_argument("--hybrid-weights", type=float, nargs="+", default=[0.0, 0.3, 0.6],
+                        help="BM25分数在混合检索中的权重，0为纯向量检索(线上的检索方式)")
+    parser.add_argument("--prefilter", nargs="+", default=["off", "on"], choices=["off", "on"], help="是否按分诊结果预筛选")
+    parser.add_argument("--output", help="结果JSON路径，默认benchmarks/results/retrieval_eval_<commit>_<时间>.json")
+    args = parser.parse_args()
+
+    report = run_evaluation(args)
+
+    output = args.output
+    if not output:
+        results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"retrieval_eval_{report['commit'] or 'nocommit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"留出方式: {report['data']['methodology']}")
+    for query_set in ["all"] + sorted(report["queries"]):
+        print_table(report, query_set)
+    print(f"\n结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
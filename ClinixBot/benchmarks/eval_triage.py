@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+# 从ClinixBot目录运行: python -m benchmarks.eval_triage
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_rag import _git_commit
+from benchmarks.eval_retrieval import DATA_PATH, split_records
+from utils.triage_classifier import SYMPTOM_TERMS, TriageClassifier, has_red_flag
+
+# 不在SYMPTOM_TERMS中的患者口语化描述，包括分类器最容易给出危险错误答复的危险信号描述
+PATIENT_QUERIES = [
+    ("I've had chest pain since this morning", "Heart Disease"),
+    ("my chest feels tight and heavy when I climb stairs", "Heart Disease"),
+    ("胸口痛了一上午", "Heart Disease"),
+    ("my dad's face is drooping and he can't lift his arm", "Stroke"),
+    ("突然说话含糊，右手没力气", "Stroke"),
+    ("I can't stop sneezing and my eyes itch every spring", "Allergies"),
+    ("每到春天就打喷嚏，眼睛痒", "Allergies"),
+    ("my knees ache and feel stiff when I get up", "Arthritis"),
+    ("早上起来膝盖又僵又疼", "Arthritis"),
+    ("I keep wheezing at night and use my inhaler a lot", "Asthma"),
+    ("晚上老是喘，要用吸入器", "Asthma"),
+    ("I've been coughing up green phlegm for a week", "Bronchitis"),
+    ("咳嗽一周了，痰是绿色的", "Bronchitis"),
+    ("I spilled boiling water on my arm and it blistered", "Burns"),
+    ("开水洒在胳膊上起泡了", "Burns"),
+    ("fever and I can't taste food anymore", "COVID-19"),
+    ("发烧，吃东西没味道", "COVID-19"),
+    ("runny nose and scratchy throat for two days", "Common Cold"),
+    ("流鼻涕，嗓子有点疼，两天了", "Common Cold"),
+    ("I feel empty and can't get out of bed most days", "Depression"),
+    ("最近总是提不起精神，什么都不想做", "Depression"),
+    ("I'm thirsty all the time and pee constantly", "Diabetes"),
+    ("老是口渴，一直跑厕所", "Diabetes"),
+    ("I think I broke my wrist, it's bent and swollen", "Fracture"),
+    ("手腕摔了以后变形了，肿得厉害", "Fracture"),
+    ("I've been throwing up and have diarrhea since dinner", "Gastroenteritis"),
+    ("吃完晚饭就开始吐，还拉肚子", "Gastroenteritis"),
+    ("my blood pressure reading was 170/105", "Hypertension"),
+    ("量血压170/105", "Hypertension"),
+    ("aching all over with a high temperature and chills", "Influenza"),
+    ("浑身疼，高烧发冷", "Influenza"),
+    ("pounding headache on the left side and light hurts my eyes", "Migraine"),
+    ("左边头一跳一跳地疼，见光更疼", "Migraine"),
+    ("my hands shake when I'm resting", "Parkinson's Disease"),
+    ("手休息的时候一直抖", "Parkinson's Disease"),
+    ("pressure behind my cheeks and thick green snot", "Sinusitis"),
+    ("脸颊胀痛，鼻涕又黄又稠", "Sinusitis"),
+    ("a cut on my leg is red, hot and oozing", "Skin Infection"),
+    ("腿上的伤口红肿发烫，还流脓", "Skin Infection"),
+    ("rolled my ankle playing basketball", "Sprain"),
+    ("打球崴了脚", "Sprain"),
+    ("it burns when I pee", "Urinary Tract Infection"),
+    ("小便的时候火辣辣地疼", "Urinary Tract Infection"),
+    ("I worry about everything and my heart races", "Anxiety"),
+    ("整天紧张焦虑，心慌", "Anxiety"),
+    ("grandma keeps forgetting where she is", "Alzheimer's Disease"),
+    ("奶奶经常忘事，出门找不到家", "Alzheimer's Disease"),
+]
+
+
+def _phrase_folds(folds, seed=0):
+    """把每个疾病每种语言的症状描述分到folds折中，每条描述恰好留出一次"""
+    rng = np.random.default_rng(seed)
+    assignments = []
+    for condition, terms in SYMPTOM_TERMS.items():
+        for language, phrases in terms.items():
+            for position, i in enumerate(rng.permutation(len(phrases))):
+                assignments.append((position % folds, condition, language, phrases[i]))
+    return assignments
+
+
+def _without(assignments, fold):
+    """去掉第fold折描述后的训练词表"""
+    terms = {condition: {"en": [], "zh": []} for condition in SYMPTOM_TERMS}
+    for assigned, condition, language, phrase in assignments:
+        if assigned != fold:
+            terms[condition][language].append(phrase)
+    return terms
+
+
+def collect_predictions(index_csv, folds, seed):
+    """
+    交叉验证：每折只用记录和其余描述训练，预测留出的描述；PATIENT_QUERIES用全部描述训练的分类器预测
+
+    返回[{set, language, text, label, predicted, confidence, red_flag}]
+    """
+    assignments = _phrase_folds(folds, seed)
+    predictions = []
+
+    def record(classifier, query_set, language, text, label):
+        condition, confidence = classifier.predict(text, top_k=1)[0]
+        predictions.append({
+            "set": query_set, "language": language, "text": text, "label": label,
+            "predicted": condition, "confidence": confidence, "red_flag": has_red_flag(text),
+        })
+
+    for fold in range(folds):
+        classifier = TriageClassifier.from_records(index_csv, symptom_terms=_without(assignments, fold))
+        for assigned, condition, language, phrase in assignments:
+            if assigned == fold and condition in classifier.classes:
+                record(classifier, f"symptoms_{language}", language, phrase, condition)
+
+    classifier = TriageClassifier.from_records(index_csv)
+    for text, condition in PATIENT_QUERIES:
+        if condition in classifier.classes:
+            language = "zh" if any("一" <= char <= "鿿" for char in text) else "en"
+            record(classifier, "patient", language, text, condition)
+    return predictions
+
+
+def reliability(predictions, bins=10):
+    """按置信度分箱的准确率和期望校准误差(ECE)"""
+    confidence = np.array([p["confidence"] for p in predictions])
+    correct = np.array([p["predicted"] == p["label"] for p in predictions], dtype=float)
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    table, ece = [], 0.0
+    for low, high in zip(edges[:-1], edges[1:]):
+        mask = (confidence >= low) & ((confidence < high) | (high == 1.0))
+        if not mask.any():
+            continue
+        accuracy, mean_confidence = correct[mask].mean(), confidence[mask].mean()
+        ece += mask.mean() * abs(accuracy - mean_confidence)
+        table.append({"bin": f"{low:.1f}-{high:.1f}", "count": int(mask.sum()),
+                      "confidence": round(float(mean_confidence), 3), "accuracy": round(float(accuracy), 3)})
+    return {"ece": round(float(ece), 4), "accuracy": round(float(correct.mean()), 4), "bins": table}
+
+
+def threshold_table(predictions, thresholds):
+    """各阈值下给出快速答复的比例(coverage)和快速答复的准确率(precision)，危险信号描述不给快速答复"""
+    rows = []
+    for threshold in thresholds:
+        shown = [p for p in predictions if p["confidence"] >= threshold and not p["red_flag"]]
+        wrong = [p for p in shown if p["predicted"] != p["label"]]
+        rows.append({
+            "threshold": threshold,
+            "coverage": round(len(shown) / max(len(predictions), 1), 3),
+            "precision": round(1 - len(wrong) / len(shown), 3) if shown else None,
+            "wrong": len(wrong),
+        })
+    return rows
+
+
+def run_evaluation(args):
+    indexed, _ = split_records(args.data, args.holdout, args.seed)
+    workdir = tempfile.mkdtemp(prefix="clinixbot-triage-")
+    try:
+        index_csv = os.path.join(workdir, "records.csv")
+        indexed.to_csv(index_csv, index=False)
+        predictions = collect_predictions(index_csv, args.folds, args.seed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    sets = sorted({p["set"] for p in predictions})
+    return {
+        "benchmark": "triage_eval",
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {"folds": args.folds, "holdout": args.holdout, "seed": args.seed},
+        "reliability": {query_set: reliability([p for p in predictions if p["set"] == query_set]) for query_set in sets}
+        | {"all": reliability(predictions)},
+        "thresholds": threshold_table(predictions, args.thresholds),
+        "red_flag_queries": [p for p in predictions if p["red_flag"]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分诊分类器在留出的患者口语化描述上的校准和快速答复阈值评估")
+    parser.add_argument("--data", default=DATA_PATH, help="就诊记录CSV")
+    parser.add_argument("--holdout", type=float, default=0.0, help="训练时去掉的记录比例")
+    parser.add_argument("--folds", type=int, default=4, help="症状描述交叉验证的折数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95])
+    parser.add_argument("--output", help="结果JSON路径，默认benchmarks/results/triage_eval_<commit>_<时间>.json")
+    args = parser.parse_args()
+
+    report = run_evaluation(args)
+
+    output = args.output
+    if not output:
+        results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"triage_eval_{report['commit'] or 'nocommit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for query_set, result in report["reliability"].items():
+        print(f"\n[{query_set}] accuracy {result['accuracy']:.3f}  ECE {result['ece']:.3f}")
+        for row in result["bins"]:
+            print(f"  {row['bin']}  n={row['count']:<4} confidence {row['confidence']:.3f}  accuracy {row['accuracy']:.3f}")
+    print(f"\n{'threshold':>9} {'coverage':>8} {'precision':>9} {'wrong':>5}")
+    for row in report["thresholds"]:
+        precision = f"{row['precision']:.3f}" if row["precision"] is not None else "-"
+        print(f"{row['threshold']:>9} {row['coverage']:>8.3f} {precision:>9} {row['wrong']:>5}")
+    print(f"\n结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
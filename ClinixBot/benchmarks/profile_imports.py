@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+import numpy as np
+
+# 从ClinixBot目录运行: python -m benchmarks.profile_imports
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from benchmarks.bench_rag import _git_commit
+
+# app.py启动时和首次进入各视图时导入的模块，需与app.py中的导入保持一致
+STARTUP_MODULES = ["streamlit", "dotenv", "utils.language_utils"]
+VIEW_MODULES = {
+    "chat": ["components.chat_interface", "models.rag_model", "utils.index_rebuilder",
+             "utils.database", "utils.log_writer"],
+    "data": ["components.visualization_dashboard", "utils.data_processor", "utils.analytics_engine"],
+    "pharmacy": ["components.pharmacy_finder"],
+    "hospital": ["components.hospital_finder"],
+}
+
+PHASE_MARKER = "clinixbot-import-phase"
+
+# 子进程中依次导入各阶段的模块，阶段之间向stderr写入标记以便切分-X importtime的输出
+_CHILD_SCRIPT = """
+import importlib, json, sys, time
+phases = json.loads(sys.argv[1])
+seconds = []
+for name, modules in phases:
+    sys.stderr.write("{marker} " + name + "\\n")
+    sys.stderr.flush()
+    started = time.perf_counter()
+    for module in modules:
+        importlib.import_module(module)
+    seconds.append(time.perf_counter() - started)
+print(json.dumps(seconds))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    把-X importtime的输出按阶段切分
+
+    返回 {阶段: [(模块, 自身微秒, 累计微秒, 层级)]}，层级0为该阶段中直接导入的模块
+    """
+    phases, current = {}, None
+    for line in stderr.splitlines():
+        if line.startswith(PHASE_MARKER):
+            current = phases.setdefault(line[len(PHASE_MARKER):].strip(), [])
+            continue
+        if current is None or not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        current.append((stripped.strip(), int(self_us), int(cumulative_us), depth))
+    return phases
+
+
+def run_phases(phases):
+    """在新的解释器中按顺序导入各阶段的模块，返回(各阶段墙钟秒数, importtime记录)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD_SCRIPT.format(marker=PHASE_MARKER), json.dumps(phases)],
+        cwd=APP_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"导入失败:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def summarize(records, top):
+    """一个阶段的汇总：累计耗时最高的模块，以及按顶层包合计的自身耗时"""
+    packages = {}
+    for name, self_us, _, _ in records:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    modules = sorted(records, key=lambda r: r[2], reverse=True)[:top]
+    return {
+        "modules_imported": len(records),
+        "top_modules": [{"module": name, "cumulative_ms": round(cumulative / 1000, 2), "self_ms": round(self_us / 1000, 2)}
+                        for name, self_us, cumulative, _ in modules],
+        "top_packages": [{"package": name, "self_ms": round(us / 1000, 2)}
+                         for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]],
+    }
+
+
+def profile(views, repeat, top):
+    """
+    测量启动阶段和每个视图首次进入时新增的导入耗时，以及一次性导入全部模块(原先的启动方式)的耗时
+
+    每个视图在单独的进程中先导入启动模块再导入视图模块，只统计视图阶段新增的部分；
+    墙钟时间取repeat次的中位数，模块明细取最后一次。
+    """
+    plans = {"eager": [["eager", STARTUP_MODULES + [m for modules in VIEW_MODULES.values() for m in modules]]]}
+    plans.update({view: [["startup", STARTUP_MODULES], [view, VIEW_MODULES[view]]] for view in views})
+
+    report = {}
+    for plan, phases in plans.items():
+        runs = [run_phases(phases) for _ in range(repeat)]
+        records = runs[-1][1]
+        for position, (name, _) in enumerate(phases):
+            if name in report:
+                continue
+            seconds = [run[0][position] for run in runs]
+            report[name] = {"wall_ms": round(float(np.median(seconds)) * 1000, 1), **summarize(records.get(name, []), top)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py启动和各视图的导入耗时分析")
+    parser.add_argument("--views", nargs="+", choices=list(VIEW_MODULES), default=list(VIEW_MODULES))
+    parser.add_argument("--repeat", type=int, default=3, help="每种导入方式重复的次数(取中位数)")
+    parser.add_argument("--top", type=int, default=15, help="每个阶段列出的模块/包数")
+    parser.add_argument("--output", help="结果JSON路径，默认benchmarks/results/import_profile_<commit>_<时间>.json")
+    args = parser.parse_args()
+
+    phases = profile(args.views, args.repeat, args.top)
+    report = {
+        "benchmark": "import_profile",
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": {"views": args.views, "repeat": args.repeat},
+        "phases": phases,
+    }
+
+    output = args.output
+    if not output:
+        results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"import_profile_{report['commit'] or 'nocommit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name, phase in phases.items():
+        print(f"\n[{name}] {phase['wall_ms']} ms, {phase['modules_imported']} 个模块")
+        for module in phase["top_modules"]:
+            print(f"  {module['cumulative_ms']:>10.2f} ms  {module['module']}")
+    print(f"\n结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# 固定的模型回复，包含诊断标记以走完整的诊断+用药推荐流程
+CANNED_RESPONSES = {
+    "zh": (
+        "1. 初步诊断：普通感冒(60%)，流感(30%)\n"
+        "2. 症状分析：发热、咳嗽和咽痛符合上呼吸道感染的表现。\n"
+        "3. 建议检查：如症状持续超过一周，建议进行血常规检查。\n"
+        "4. 用药建议：对乙酰氨基酚退热，多饮水并注意休息。\n"
+        "5. 就医建议：如出现呼吸困难请立即前往急诊科。"
+    ),
+    "en": (
+        "1. Preliminary Diagnosis: Common Cold (60%), Influenza (30%)\n"
+        "2. Symptom Analysis: Fever, cough and sore throat are consistent with an upper respiratory infection.\n"
+        "3. Recommended Tests: A complete blood count if symptoms last more than a week.\n"
+        "4. Medication Recommendations: Acetaminophen for fever, fluids and rest.\n"
+        "5. Medical Advice: Seek emergency care if breathing becomes difficult."
+    ),
+}
+
+
+def _estimate_tokens(text):
+    """粗略估算token数：中文每字一个，其余每4个字符一个"""
+    cjk = sum(1 for char in text if "一" <= char <= "鿿")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def stub_embedding(text, dimensions):
+    """由文本哈希生成的确定性单位向量，相同文本得到相同向量"""
+    seed = int.from_bytes(hashlib.sha256(str(text).encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class StubOpenAIServer:
+    """
+    本地OpenAI兼容桩服务
+
+    提供/v1/chat/completions(支持stream=True)和/v1/embeddings两个接口，用于在不调用真实API的情况下测量诊断流程的性能。
+    每次请求先等待latency_ms，对话补全再按tokens_per_second模拟逐token生成的耗时。
+    在后台线程运行，start()后通过base_url访问。
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=200.0, tokens_per_second=50.0,
+                 embed_latency_ms=20.0, dimensions=256):
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.embed_latency_ms = embed_latency_ms
+        self.dimensions = dimensions
+        self.requests = {"chat": 0, "embeddings": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    @staticmethod
+    def _canned_response(body):
+        prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        language = "zh" if "中文" in prompt else "en"
+        return prompt, CANNED_RESPONSES[language]
+
+    def _chat_completion(self, body):
+        self._count("chat")
+        prompt, content = self._canned_response(body)
+
+        completion_tokens = _estimate_tokens(content)
+        time.sleep(self.latency_ms / 1000 + completion_tokens / self.tokens_per_second)
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": _estimate_tokens(prompt),
+                "completion_tokens": completion_tokens,
+                "total_tokens": _estimate_tokens(prompt) + completion_tokens,
+            },
+        }
+
+    def _chat_completion_chunks(self, body, chunk_chars=8):
+        """stream=True时按SSE分段返回，首段前等待latency_ms，之后按输出速度间隔发送"""
+        self._count("chat")
+        _, content = self._canned_response(body)
+        time.sleep(self.latency_ms / 1000)
+        for start in range(0, len(content), chunk_chars):
+            piece = content[start:start + chunk_chars]
+            time.sleep(_estimate_tokens(piece) / self.tokens_per_second)
+            yield {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+        yield {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+
+    def _embeddings(self, body):
+        self._count("embeddings")
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+
+        time.sleep(self.embed_latency_ms / 1000)
+        return {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": stub_embedding(text, self.dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.endswith("/chat/completions") and body.get("stream"):
+                    self._send_stream(server._chat_completion_chunks(body))
+                    return
+                elif self.path.endswith("/chat/completions"):
+                    payload = server._chat_completion(body)
+                elif self.path.endswith("/embeddings"):
+                    payload = server._embeddings(body)
+                else:
+                    self.send_error(404)
+                    return
+
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="openai-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -2,13 +2,136 @@
 import streamlit as st
 import time
 import random
-import re
+import uuid
+import textwrap
 from utils.language_utils import LanguageUtils
+from utils.language_detector import LanguageDetector
+from utils.conversation_memory import ConversationMemory
+from utils.telemetry import telemetry
 
 class ChatInterface:
-    def __init__(self, rag_model, language="en"):
+    # 会话内存中最多保留的消息数，更早的消息已持久化到数据库
+    MAX_SESSION_MESSAGES = 50
+    # 默认只渲染最近的RENDER_WINDOW条消息，每次"加载更早的消息"增加HISTORY_PAGE_SIZE条
+    RENDER_WINDOW = 20
+    HISTORY_PAGE_SIZE = 20
+    # 从数据库翻页加载的更早消息在会话中最多保留的条数
+    MAX_EARLIER_MESSAGES = 200
+    
+    def __init__(self, rag_model, language="en", db=None, log_writer=None):
         self.rag_model = rag_model
         self.language = language
+        # db只用于读取历史，写入全部交给后台批量写入器，用户请求不等待磁盘
+        self.db = db
+        self.log_writer = log_writer
+        self.language_detector = LanguageDetector(default=language)
+    
+    def _get_user_id(self):
+        """
+        获取用户ID
+
+        用户ID只由服务端生成，不接受客户端指定。URL中保存的是服务端签发的随机会话令牌，
+        数据库中只存令牌哈希；令牌无效或过期时分配新用户，看不到任何已有记录。
+        """
+        if 'user_id' not in st.session_state:
+            params = st.experimental_get_query_params()
+            token = params.get("session", [None])[0]
+            user_id = self.db.resolve_session(token) if self.db else None
+            if user_id is None:
+                user_id = uuid.uuid4().hex
+                token = self.db.create_session(user_id) if self.db else None
+            if token:
+                st.experimental_set_query_params(session=token)
+            else:
+                st.experimental_set_query_params()
+            st.session_state.user_id = user_id
+        return st.session_state.user_id
+    
+    @staticmethod
+    def _to_markdown(message):
+        """消息只在加入历史时转换一次，模型回复常带缩进，不去掉会被当作代码块渲染"""
+        return textwrap.dedent(str(message)).strip()
+    
+    def _make_entry(self, message, is_user, timestamp, turn_timestamp=None, chat_id=None):
+        entry = {
+            "message": message,
+            "markdown": self._to_markdown(message),
+            "is_user": is_user,
+            "timestamp": timestamp
+        }
+        if turn_timestamp is not None:
+            entry["turn_timestamp"] = turn_timestamp
+        if chat_id is not None:
+            entry["chat_id"] = chat_id
+        return entry
+    
+    def _turns_to_entries(self, turns):
+        """把数据库按时间倒序返回的对话轮次转换为正序的消息列表"""
+        entries = []
+        for turn in reversed(turns):
+            if turn["user_message"]:
+                entries.append(self._make_entry(turn["user_message"], True, turn["timestamp"]))
+            entries.append(self._make_entry(
+                turn["bot_response"], False, turn["timestamp"],
+                turn_timestamp=turn["timestamp"], chat_id=turn["chat_id"]
+            ))
+        return entries
+    
+    def _get_memory(self):
+        """当前会话的对话记忆(摘要状态随会话保存)"""
+        if 'conversation_memory' not in st.session_state:
+            summarizer = getattr(self.rag_model, "summarize_conversation", None)
+            st.session_state.conversation_memory = ConversationMemory(summarizer=summarizer)
+        return st.session_state.conversation_memory
+    
+    def _load_persisted_history(self):
+        """从数据库恢复最近一屏的对话，更早的对话按需翻页加载"""
+        if not self.db:
+            return
+        
+        turns = self.db.get_chat_history(self._get_user_id(), limit=self.RENDER_WINDOW // 2)
+        st.session_state.chat_history.extend(self._turns_to_entries(turns))
+        
+        # 恢复的对话同时放入对话记忆，刷新后追问仍有上下文；不调用模型生成摘要
+        memory = self._get_memory()
+        for turn in reversed(turns):
+            memory.add_turn(turn["user_message"] or "", turn["bot_response"], summarize=False)
+    
+    def _history_cursor(self):
+        """会话中最早一条已持久化消息的(timestamp, chat_id)，作为向前翻页的键集起点"""
+        for entry in st.session_state.earlier_history + st.session_state.chat_history:
+            if entry.get("turn_timestamp"):
+                return (entry["turn_timestamp"], entry.get("chat_id", 0))
+        return None
+    
+    def _can_load_earlier(self):
+        return (
+            self.db is not None
+            and not st.session_state.history_exhausted
+            and len(st.session_state.earlier_history) < self.MAX_EARLIER_MESSAGES
+            and self._history_cursor() is not None
+        )
+    
+    def _load_earlier(self):
+        """扩大渲染窗口，内存中的消息不够时从数据库加载更早的一页"""
+        st.session_state.chat_window += self.HISTORY_PAGE_SIZE
+        in_memory = len(st.session_state.earlier_history) + len(st.session_state.chat_history)
+        if st.session_state.chat_window <= in_memory or not self._can_load_earlier():
+            return
+        
+        page_turns = self.HISTORY_PAGE_SIZE // 2
+        turns = self.db.get_chat_history(self._get_user_id(), limit=page_turns, before=self._history_cursor())
+        if len(turns) < page_turns:
+            st.session_state.history_exhausted = True
+        st.session_state.earlier_history = self._turns_to_entries(turns) + st.session_state.earlier_history
+    
+    def _init_history_state(self):
+        if 'earlier_history' not in st.session_state:
+            st.session_state.earlier_history = []
+        if 'history_exhausted' not in st.session_state:
+            st.session_state.history_exhausted = False
+        if 'chat_window' not in st.session_state:
+            st.session_state.chat_window = self.RENDER_WINDOW
     
     def _get_avatar(self, is_user):
         """获取头像URL"""
@@ -19,23 +142,40 @@ class ChatInterface:
         if 'chat_history' not in st.session_state:
             st.session_state.chat_history = []
         
-        st.session_state.chat_history.append({
-            "message": message,
-            "is_user": is_user,
-            "timestamp": time.time()
-        })
+        entry = self._make_entry(message, is_user, time.time())
+        
+        # 用户消息和随后的回复作为一轮对话异步持久化
+        if self.log_writer:
+            if is_user:
+                st.session_state.pending_user_message = message
+            elif st.session_state.get("pending_user_message"):
+                entry["turn_timestamp"] = self.log_writer.log_chat_turn(
+                    self._get_user_id(),
+                    st.session_state.pending_user_message,
+                    message
+                )
+                st.session_state.pending_user_message = None
+        
+        st.session_state.chat_history.append(entry)
+        
+        # 已持久化的旧消息移出会话内存；翻页加载的更早消息与保留部分不再连续，一并释放
+        if self.log_writer and len(st.session_state.chat_history) > self.MAX_SESSION_MESSAGES:
+            st.session_state.chat_history = st.session_state.chat_history[-self.MAX_SESSION_MESSAGES:]
+            st.session_state.earlier_history = []
+            st.session_state.history_exhausted = False
+            st.session_state.chat_window = min(st.session_state.get("chat_window", self.RENDER_WINDOW), self.MAX_SESSION_MESSAGES)
+        
+        return entry.get("turn_timestamp")
     
     def _get_initial_greeting(self):
         """获取初始欢迎消息"""
         return LanguageUtils.get_text("chat", "greeting", self.language)
     
     def _detect_language(self, text):
-        """检测输入文本的语言"""
-        # 简单的中文检测 - 检查是否包含中文字符
-        if re.search("[\u4e00-\u9FFF]", text):
-            return "zh"
-        return "en"
+        """检测输入文本的语言，映射到模型已注册提示词的语言"""
+        return self.rag_model.resolve_language(self.language_detector.detect(text))
     
+    @telemetry.traced("chat.handle_input")
     def _handle_user_input(self):
         """处理用户输入"""
         user_input = st.session_state.user_input
@@ -50,36 +190,79 @@ class ChatInterface:
             # 检测输入语言
             input_language = self._detect_language(user_input)
             
+            # 结合对话摘要和最近几轮构建提示词中的问题，追问时不丢失上下文；
+            # 检索只用当前消息加简短摘要，避免之前讨论过的疾病干扰检索结果
+            memory = self._get_memory()
+            query = memory.build_query(user_input)
+            retrieval_query = memory.build_retrieval_query(user_input)
+            
+            # 本地分类只针对当前消息，结果同时用于快速评估、检索预筛选和分级路由的校验；
+            # 分类器足够确定时，先给出快速评估，等待大模型期间显示
+            triage = self.rag_model.triage(user_input, language=input_language)
+            provisional = triage["provisional"]
+            status = st.empty()
+            if provisional:
+                status.info(LanguageUtils.get_text(
+                    "chat", "provisional_diagnosis", self.language,
+                    provisional["name"], round(provisional["confidence"] * 100)
+                ))
+            
             # 获取诊断结果
             with st.spinner(LanguageUtils.get_text("chat", "analyzing", self.language)):
-                diagnosis_result = self.rag_model.get_diagnosis(user_input, language=input_language)
+                diagnosis_result = self.rag_model.get_diagnosis(
+                    query, language=input_language, retrieval_query=retrieval_query,
+                    message=user_input, triage=triage
+                )
+            status.empty()
+            # 旧对话的摘要在后台线程中生成，不延长这一轮的等待
+            memory.add_turn(user_input, diagnosis_result["diagnosis"], language=input_language)
             
             # 保存当前诊断
             st.session_state.current_diagnosis = diagnosis_result["diagnosis"]
             
             # 添加机器人回复
-            self._add_message(diagnosis_result["diagnosis"], is_user=False)
+            turn_timestamp = self._add_message(diagnosis_result["diagnosis"], is_user=False)
             
             # 如果有诊断结果，获取药物推荐
-            if ("初步诊断" in diagnosis_result["diagnosis"]) or ("Preliminary Diagnosis" in diagnosis_result["diagnosis"]):
+            if self.rag_model.has_diagnosis(diagnosis_result["diagnosis"]):
                 with st.spinner(LanguageUtils.get_text("chat", "generating_recommendations", self.language)):
                     medications = self.rag_model.get_medication_recommendations(diagnosis_result["diagnosis"], language=input_language)
                     st.session_state.recommended_medications = medications
+                
+                # 保存诊断记录
+                if self.log_writer:
+                    self.log_writer.log_diagnosis(
+                        self._get_user_id(),
+                        user_input,
+                        diagnosis_result["diagnosis"],
+                        recommended_treatments=medications,
+                        chat_timestamp=turn_timestamp
+                    )
     
     def render(self):
         """渲染聊天界面"""
-        # 初始化聊天历史
+        self._init_history_state()
+        
+        # 初始化聊天历史，优先恢复已持久化的对话
         if 'chat_history' not in st.session_state or not st.session_state.chat_history:
+            st.session_state.chat_history = []
+            self._load_persisted_history()
+        if not st.session_state.chat_history:
             self._add_message(self._get_initial_greeting(), is_user=False)
         
         # 聊天容器
         chat_container = st.container()
         
         with chat_container:
-            # 显示聊天历史
-            for message in st.session_state.chat_history:
+            # 只渲染最近chat_window条消息，更早的消息按需加载
+            messages = st.session_state.earlier_history + st.session_state.chat_history
+            window = st.session_state.chat_window
+            if len(messages) > window or self._can_load_earlier():
+                st.button(LanguageUtils.get_text("chat", "load_earlier", self.language), on_click=self._load_earlier)
+            
+            for message in messages[-window:]:
                 with st.chat_message(name="user" if message["is_user"] else "assistant", avatar=self._get_avatar(message["is_user"])):
-                    st.write(message["message"])
+                    st.markdown(message.get("markdown") or self._to_markdown(message["message"]))
         
         # 用户输入
         st.text_input(LanguageUtils.get_text("chat", "symptom_input", self.language), key="user_input", on_change=self._handle_user_input)
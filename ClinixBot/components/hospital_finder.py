@@ -1,21 +1,48 @@
 import streamlit as st
 import pandas as pd
-import folium
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
 import requests
 import json
 import random
+import numpy as np
+from utils.geo_index import FacilityIndex
+from utils.map_renderer import MapRenderer
+from utils.capacity_feed import CapacityFeed
+from utils.department_router import DepartmentRouter
+from utils.telemetry import telemetry
+
+@st.cache_resource
+def load_hospital_index(path="data/hospitals.csv"):
+    """加载医院数据并构建空间索引(进程内共享)"""
+    return FacilityIndex.from_csv(path)
+
+@st.cache_resource
+def load_capacity_feed(feed_dir="data/capacity_feed"):
+    """启动床位和等待时间的实时数据接入(进程内共享)"""
+    return CapacityFeed(load_hospital_index().facilities, feed_dir=feed_dir).start()
+
+@st.cache_resource
+def load_department_router(records_path="data/hospital_records_2021_2024_with_bills.csv"):
+    """构建症状/疾病到科室的路由索引(进程内共享)"""
+    return DepartmentRouter.from_records(records_path)
+
+@st.cache_resource
+def load_hospital_map_renderer():
+    """医院地图HTML缓存(进程内共享)"""
+    return MapRenderer()
 
 class HospitalFinder:
-    def __init__(self):
+    # 单次搜索最多返回的医院数量，地图按页加载，列表只显示前LIST_LIMIT家
+    MAX_RESULTS = 2000
+    LIST_LIMIT = 20
+    
+    def __init__(self, language="en"):
         self.api_key = "HOSPITAL_API_KEY"  # 需要替换为实际API密钥
-        self.hospitals = [
-            {"name": "General Hospital", "address": "123 Health St", "distance": 1.2, "lat": 40.7120, "lng": -74.0050, "beds_available": 5, "specialty": "综合医院", "wait_time": "30分钟"},
-            {"name": "City Medical Center", "address": "456 Care Ave", "distance": 2.3, "lat": 40.7150, "lng": -74.0080, "beds_available": 2, "specialty": "急诊中心", "wait_time": "45分钟"},
-            {"name": "University Hospital", "address": "789 Research Blvd", "distance": 3.1, "lat": 40.7180, "lng": -74.0020, "beds_available": 8, "specialty": "教学医院", "wait_time": "15分钟"},
-            {"name": "Children's Hospital", "address": "101 Pediatric Way", "distance": 3.5, "lat": 40.7100, "lng": -74.0100, "beds_available": 3, "specialty": "儿科医院", "wait_time": "20分钟"},
-            {"name": "Community Health Center", "address": "202 Wellness Dr", "distance": 1.8, "lat": 40.7140, "lng": -74.0070, "beds_available": 0, "specialty": "社区医疗", "wait_time": "60分钟"},
-        ]
+        self.language = language
+        self.hospital_index = load_hospital_index()
+        self.map_renderer = load_hospital_map_renderer()
+        self.capacity_feed = load_capacity_feed()
+        self.department_router = load_department_router()
     
     def _get_user_location(self):
         """获取用户位置"""
@@ -23,43 +50,70 @@ class HospitalFinder:
         # 这里使用模拟数据
         return {"lat": 40.7128, "lng": -74.0060}
     
+    @telemetry.traced("hospital.search")
     def _search_nearby_hospitals(self, location, specialty=None, radius=10):
-        """搜索附近的医院"""
-        # 真实情况下应调用外部API查询附近医院
-        # 这里使用模拟数据
-        
-        # 模拟搜索逻辑
+        """搜索附近的医院，返回(医院下标数组, 距离数组)"""
+        mask = None
         if specialty and specialty != "所有科室":
             # 过滤指定科室的医院
-            filtered_hospitals = [h for h in self.hospitals if specialty.lower() in h["specialty"].lower()]
-            return filtered_hospitals if filtered_hospitals else self.hospitals
+            mask = self.hospital_index.contains_mask("specialty", specialty)
+        
+        positions, distances = self.hospital_index.query(
+            location["lat"], location["lng"], radius, k=self.MAX_RESULTS, mask=mask
+        )
         
-        return self.hospitals
+        # 指定科室在范围内没有医院时，返回范围内的所有医院
+        if mask is not None and not len(positions):
+            positions, distances = self.hospital_index.query(
+                location["lat"], location["lng"], radius, k=self.MAX_RESULTS
+            )
+        
+        return positions, distances
+    
+    def _rank_hospitals(self, positions, distances, snapshot, beds_filter=False, sort_by="距离"):
+        """基于容量快照的数值数组筛选和排序"""
+        beds = snapshot.beds_available[positions]
+        wait = snapshot.wait_minutes[positions]
+        
+        # 应用筛选器
+        if beds_filter:
+            keep = beds > 0
+            positions, distances, beds, wait = positions[keep], distances[keep], beds[keep], wait[keep]
+        
+        # 应用排序，距离作为次要排序键
+        if sort_by == "等待时间":
+            order = np.lexsort((distances, wait))
+        elif sort_by == "可用床位":
+            order = np.lexsort((distances, -beds))
+        else:
+            order = np.argsort(distances, kind="stable")
+        
+        return positions[order], distances[order]
     
-    def _create_hospital_map(self, user_location, hospitals):
-        """创建医院地图"""
-        # 创建地图对象
-        m = folium.Map(location=[user_location["lat"], user_location["lng"]], zoom_start=13)
-        
-        # 添加用户位置标记
-        folium.Marker(
-            [user_location["lat"], user_location["lng"]],
-            popup="您的位置",
-            icon=folium.Icon(color="red", icon="home")
-        ).add_to(m)
-        
-        # 添加医院标记
-        for hospital in hospitals:
-            # 根据床位可用性选择颜色
-            color = "green" if hospital["beds_available"] > 0 else "orange"
-            
-            folium.Marker(
-                [hospital["lat"], hospital["lng"]],
-                popup=f"{hospital['name']}<br>{hospital['specialty']}<br>可用床位: {hospital['beds_available']}<br>预计等待时间: {hospital['wait_time']}",
-                icon=folium.Icon(color=color, icon="plus-sign")
-            ).add_to(m)
-        
-        return m
+    def _hospital_records(self, positions, distances, snapshot):
+        """生成用于展示的医院信息"""
+        records = self.hospital_index.facilities.iloc[positions].to_dict("records")
+        for record, position, distance in zip(records, positions, distances):
+            record["distance"] = round(float(distance), 1)
+            record["beds_available"] = int(snapshot.beds_available[position])
+            wait = snapshot.wait_minutes[position]
+            record["wait_time"] = f"{int(wait)}分钟" if np.isfinite(wait) else "未知"
+        return records
+    
+    def _create_hospital_map(self, user_location, hospitals, filters, pages=1):
+        """创建医院地图，返回可直接嵌入页面的HTML"""
+        points = [
+            (
+                hospital["lat"],
+                hospital["lng"],
+                f"{hospital['name']}<br>{hospital['specialty']}<br>可用床位: {hospital['beds_available']}<br>预计等待时间: {hospital['wait_time']}",
+                # 根据床位可用性选择颜色
+                "green" if hospital["beds_available"] > 0 else "orange",
+                hospital["id"],
+            )
+            for hospital in hospitals
+        ]
+        return self.map_renderer.render_html(user_location, filters, points, pages=pages)
     
     def render(self):
         """渲染医院查找界面"""
@@ -68,38 +122,16 @@ class HospitalFinder:
         # 用户输入
         st.write("查找附近医院和紧急护理中心")
         
-        # 获取当前诊断的医疗条件
-        medical_condition = None
-        if 'current_diagnosis' in st.session_state and st.session_state.current_diagnosis:
-            # 从诊断中提取医疗条件
-            import re
-            text = st.session_state.current_diagnosis
-            condition_match = re.search(r'初步诊断[:：]\s*([^\n]+)', text)
-            if condition_match:
-                medical_condition = condition_match.group(1).strip()
-        
         # 科室选择
-        specialties = ["所有科室", "急诊科", "内科", "外科", "儿科", "妇产科", "神经科", "心脏科", "骨科", "眼科", "皮肤科"]
+        specialties = ["所有科室"] + self.department_router.departments
         
-        # 如果有医疗条件，推荐相应科室
+        # 如果有当前诊断，对诊断全文(中英文均可)做一次扫描，按得分推荐科室
         recommended_specialty = None
-        if medical_condition:
-            # 简单的条件-科室映射逻辑
-            condition_to_specialty = {
-                "感冒": "内科",
-                "流感": "内科",
-                "骨折": "骨科",
-                "心脏病": "心脏科",
-                "头痛": "神经科",
-                "皮疹": "皮肤科",
-                "眼睛": "眼科",
-                "儿童": "儿科"
-            }
-            
-            for condition, specialty in condition_to_specialty.items():
-                if condition.lower() in medical_condition.lower() and specialty in specialties:
-                    recommended_specialty = specialty
-                    break
+        if 'current_diagnosis' in st.session_state and st.session_state.current_diagnosis:
+            ranked = self.department_router.route(st.session_state.current_diagnosis)
+            if ranked:
+                recommended_specialty = ranked[0][0]
+                st.caption("推荐科室: " + "、".join(department for department, _ in ranked[:3]))
         
         col1, col2 = st.columns(2)
         with col1:
@@ -124,48 +156,75 @@ class HospitalFinder:
                 user_location = self._get_user_location()
                 
                 # 搜索医院
-                hospitals = self._search_nearby_hospitals(user_location, selected_specialty, radius)
-                
-                # 应用筛选器
-                if beds_filter:
-                    hospitals = [h for h in hospitals if h["beds_available"] > 0]
+                positions, distances = self._search_nearby_hospitals(user_location, selected_specialty, radius)
                 
-                # 应用排序
-                if sort_by == "距离":
-                    hospitals = sorted(hospitals, key=lambda x: x["distance"])
-                elif sort_by == "等待时间":
-                    hospitals = sorted(hospitals, key=lambda x: int(x["wait_time"].replace("分钟", "")))
-                elif sort_by == "可用床位":
-                    hospitals = sorted(hospitals, key=lambda x: x["beds_available"], reverse=True)
-                
-                if hospitals:
-                    st.success(f"找到 {len(hospitals)} 家附近医院")
-                    
-                    # 显示地图
-                    st.subheader("附近医院地图")
-                    m = self._create_hospital_map(user_location, hospitals)
-                    folium_static(m)
-                    
-                    # 显示医院列表
-                    st.subheader("医院列表")
+                # 搜索结果保存在会话中，床位和等待时间每次渲染时从最新快照读取
+                st.session_state.hospital_search = {
+                    "location": user_location,
+                    "positions": positions,
+                    "distances": distances,
+                    "beds_filter": beds_filter,
+                    "filters": ("hospital", selected_specialty, radius, beds_filter),
+                    "map_pages": 1,
+                }
+        
+        search = st.session_state.get("hospital_search")
+        if not search:
+            return
+        
+        # 读取一次快照，本次渲染内的筛选、排序和展示都基于同一版本
+        snapshot = self.capacity_feed.snapshot
+        positions, distances = self._rank_hospitals(
+            search["positions"], search["distances"], snapshot, beds_filter=search["beds_filter"]
+        )
+        if not len(positions):
+            st.error(f"在半径 {search['filters'][2]}公里内未找到符合条件的医院")
+            st.info("请尝试增加搜索半径或更改科室选择")
+            return
+        
+        st.success(f"找到 {len(positions)} 家附近医院")
+        
+        # 显示地图(标记按距离由近及远分页加载)
+        st.subheader("附近医院地图")
+        shown = self.map_renderer.visible_count(len(positions), search["map_pages"])
+        if shown < len(positions):
+            if st.button("在地图上加载更多医院"):
+                search["map_pages"] += 1
+                shown = self.map_renderer.visible_count(len(positions), search["map_pages"])
+            st.caption(f"地图显示距离最近的 {shown} 家医院")
+        
+        # 地图弹窗包含床位信息，快照版本变化后重新生成
+        html = self._create_hospital_map(
+            search["location"],
+            self._hospital_records(positions[:shown], distances[:shown], snapshot),
+            search["filters"] + (snapshot.version,),
+            search["map_pages"]
+        )
+        components.html(html, height=510, width=700)
+        
+        # 应用排序
+        positions, distances = self._rank_hospitals(positions, distances, snapshot, sort_by=sort_by)
+        hospitals = self._hospital_records(positions[:self.LIST_LIMIT], distances[:self.LIST_LIMIT], snapshot)
+        
+        # 显示医院列表
+        st.subheader("医院列表")
+        if len(positions) > self.LIST_LIMIT:
+            st.caption(f"列表显示前 {self.LIST_LIMIT} 家医院")
+        
+        # 显示医院信息
+        for i, hospital in enumerate(hospitals):
+            with st.container():
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    st.write(f"#### {i+1}. {hospital['name']} ({hospital['specialty']})")
+                    st.write(f"地址: {hospital['address']}")
+                    st.write(f"距离: {hospital['distance']} 公里 | 等待时间: {hospital['wait_time']}")
+                    st.write(f"可用床位: {hospital['beds_available']}")
+                with col2:
+                    if st.button("导航", key=f"hosp_nav_{i}"):
+                        st.info(f"已开始导航至 {hospital['name']}")
                     
-                    # 显示医院信息
-                    for i, hospital in enumerate(hospitals):
-                        with st.container():
-                            col1, col2 = st.columns([3, 1])
-                            with col1:
-                                st.write(f"#### {i+1}. {hospital['name']} ({hospital['specialty']})")
-                                st.write(f"地址: {hospital['address']}")
-                                st.write(f"距离: {hospital['distance']} 公里 | 等待时间: {hospital['wait_time']}")
-                                st.write(f"可用床位: {hospital['beds_available']}")
-                            with col2:
-                                if st.button("导航", key=f"hosp_nav_{i}"):
-                                    st.info(f"已开始导航至 {hospital['name']}")
-                                
-                                if st.button("预约", key=f"hosp_book_{i}"):
-                                    st.success(f"已为您在 {hospital['name']} 预约挂号")
-                            
-                            st.divider()
-                else:
-                    st.error(f"在半径 {radius}公里内未找到符合条件的医院")
-                    st.info("请尝试增加搜索半径或更改科室选择")
\ No newline at end of file
+                    if st.button("预约", key=f"hosp_book_{i}"):
+                        st.success(f"已为您在 {hospital['name']} 预约挂号")
+                
+                st.divider()
\ No newline at end of file
@@ -1,21 +1,39 @@
 import streamlit as st
 import pandas as pd
-import folium
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
 import requests
 import json
-import random
+from utils.geo_index import FacilityIndex
+from utils.inventory_index import InventoryIndex
+from utils.map_renderer import DISTANCE_PLACEHOLDER, MapRenderer
+from utils.telemetry import telemetry
+
+@st.cache_resource
+def load_pharmacy_index(path="data/pharmacies.csv"):
+    """加载药房数据并构建空间索引(进程内共享)"""
+    return FacilityIndex.from_csv(path)
+
+@st.cache_resource
+def load_inventory_index(path="data/pharmacy_inventory.csv", synonyms_path="data/medication_synonyms.csv"):
+    """加载药房库存倒排索引(进程内共享，库存变化通过apply_updates增量更新)"""
+    return InventoryIndex.from_csv(path, synonyms_path)
+
+@st.cache_resource
+def load_pharmacy_map_renderer():
+    """药房地图HTML缓存(进程内共享)"""
+    return MapRenderer()
 
 class PharmacyFinder:
-    def __init__(self):
+    # 单次搜索最多返回的药房数量，地图按页加载，列表只显示前LIST_LIMIT家
+    MAX_RESULTS = 2000
+    LIST_LIMIT = 20
+    
+    def __init__(self, language="en"):
         self.api_key = "PHARMACY_API_KEY"  # 这里需要替换为真实的API密钥
-        self.pharmacies = [
-            {"name": "CVS Pharmacy", "address": "123 Main St", "distance": 0.7, "lat": 40.7128, "lng": -74.0060},
-            {"name": "Walgreens", "address": "456 Broadway", "distance": 1.2, "lat": 40.7168, "lng": -74.0030},
-            {"name": "Rite Aid", "address": "789 Park Ave", "distance": 1.8, "lat": 40.7148, "lng": -74.0090},
-            {"name": "Duane Reade", "address": "101 Fifth Ave", "distance": 2.1, "lat": 40.7108, "lng": -74.0040},
-            {"name": "Target Pharmacy", "address": "202 Madison Ave", "distance": 2.5, "lat": 40.7188, "lng": -74.0070},
-        ]
+        self.language = language
+        self.pharmacy_index = load_pharmacy_index()
+        self.inventory_index = load_inventory_index()
+        self.map_renderer = load_pharmacy_map_renderer()
     
     def _get_user_location(self):
         """获取用户位置"""
@@ -23,40 +41,42 @@ class PharmacyFinder:
         # 这里使用模拟数据
         return {"lat": 40.7128, "lng": -74.0060}
     
+    @telemetry.traced("pharmacy.search")
     def _search_nearby_pharmacies(self, location, medication=None, radius=5):
         """搜索附近的药房"""
-        # 真实情况下应调用外部API查询附近药房
-        # 例如Google Places API或CVS/药房的API
-        # 这里使用模拟数据
+        if not medication:
+            return self.pharmacy_index.query_records(
+                location["lat"], location["lng"], radius, k=self.MAX_RESULTS
+            )
         
-        # 模拟搜索逻辑
-        if medication:
-            # 过滤有特定药物的药房
-            return [p for p in self.pharmacies if random.random() > 0.3]
+        # 有库存的药房集合与空间查询的候选集求交集
+        stock = self.inventory_index.stock_for(medication)
+        if not stock:
+            return []
+        
+        mask = self.pharmacy_index.mask_for_ids(stock.keys())
+        pharmacies = self.pharmacy_index.query_records(
+            location["lat"], location["lng"], radius, k=self.MAX_RESULTS, mask=mask
+        )
         
-        return self.pharmacies
-    
-    def _create_pharmacy_map(self, user_location, pharmacies):
-        """创建药房地图"""
-        # 创建地图对象
-        m = folium.Map(location=[user_location["lat"], user_location["lng"]], zoom_start=14)
-        
-        # 添加用户位置标记
-        folium.Marker(
-            [user_location["lat"], user_location["lng"]],
-            popup="您的位置",
-            icon=folium.Icon(color="red", icon="home")
-        ).add_to(m)
-        
-        # 添加药房标记
         for pharmacy in pharmacies:
-            folium.Marker(
-                [pharmacy["lat"], pharmacy["lng"]],
-                popup=f"{pharmacy['name']}<br>{pharmacy['address']}<br>距离: {pharmacy['distance']}公里",
-                icon=folium.Icon(color="blue", icon="plus-sign")
-            ).add_to(m)
+            pharmacy["quantity"], pharmacy["price"], pharmacy["stock_updated_at"] = stock[pharmacy["id"]]
         
-        return m
+        return pharmacies
+    
+    def _create_pharmacy_map(self, user_location, pharmacies, filters, pages=1):
+        """创建药房地图，返回可直接嵌入页面的HTML"""
+        points = [
+            (
+                pharmacy["lat"],
+                pharmacy["lng"],
+                f"{pharmacy['name']}<br>{pharmacy['address']}<br>距离: {DISTANCE_PLACEHOLDER}公里",
+                "blue",
+                pharmacy["id"],
+            )
+            for pharmacy in sorted(pharmacies, key=lambda x: x["distance"])
+        ]
+        return self.map_renderer.render_html(user_location, filters, points, pages=pages, zoom_start=14)
     
     def render(self):
         """渲染药房查找界面"""
@@ -96,40 +116,72 @@ class PharmacyFinder:
                 # 搜索药房
                 pharmacies = self._search_nearby_pharmacies(user_location, medication, radius)
                 
-                if pharmacies:
-                    st.success(f"找到 {len(pharmacies)} 家附近药房")
-                    
-                    # 显示地图
-                    st.subheader("附近药房地图")
-                    m = self._create_pharmacy_map(user_location, pharmacies)
-                    folium_static(m)
-                    
-                    # 显示药房列表
-                    st.subheader("药房列表")
-                    
-                    # 根据选择的排序方式排序
-                    if sort_by == "距离":
-                        pharmacies = sorted(pharmacies, key=lambda x: x["distance"])
+                # 搜索结果保存在会话中，翻页、下单等按钮触发重跑时不会丢失
+                st.session_state.pharmacy_search = {
+                    "location": user_location,
+                    "pharmacies": pharmacies,
+                    "medication": medication,
+                    "filters": ("pharmacy", self.inventory_index.normalize(medication), radius),
+                    "map_pages": 1,
+                }
+        
+        search = st.session_state.get("pharmacy_search")
+        if not search:
+            return
+        
+        pharmacies = search["pharmacies"]
+        medication = search["medication"]
+        if not pharmacies:
+            st.error(f"在半径 {search['filters'][2]}公里内未找到提供{medication if medication else ''}的药房")
+            st.info("请尝试增加搜索半径或更改药物名称")
+            return
+        
+        st.success(f"找到 {len(pharmacies)} 家附近药房")
+        
+        # 显示地图(标记按距离由近及远分页加载)
+        st.subheader("附近药房地图")
+        shown = self.map_renderer.visible_count(len(pharmacies), search["map_pages"])
+        if shown < len(pharmacies):
+            if st.button("在地图上加载更多药房"):
+                search["map_pages"] += 1
+                shown = self.map_renderer.visible_count(len(pharmacies), search["map_pages"])
+            st.caption(f"地图显示距离最近的 {shown} 家药房")
+        
+        html = self._create_pharmacy_map(search["location"], pharmacies, search["filters"], search["map_pages"])
+        components.html(html, height=510, width=700)
+        
+        # 显示药房列表
+        st.subheader("药房列表")
+        
+        # 根据选择的排序方式排序，没有价格信息(未指定药物)时按距离
+        if sort_by == "评分":
+            pharmacies = sorted(pharmacies, key=lambda x: (-x["rating"], x["distance"]))
+        elif sort_by == "价格" and medication:
+            pharmacies = sorted(pharmacies, key=lambda x: (x["price"], x["distance"]))
+        else:
+            pharmacies = sorted(pharmacies, key=lambda x: x["distance"])
+        
+        if len(pharmacies) > self.LIST_LIMIT:
+            st.caption(f"列表显示前 {self.LIST_LIMIT} 家药房")
+        
+        # 显示药房信息
+        for i, pharmacy in enumerate(pharmacies[:self.LIST_LIMIT]):
+            with st.container():
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    st.write(f"#### {i+1}. {pharmacy['name']}")
+                    st.write(f"地址: {pharmacy['address']}")
+                    st.write(f"距离: {pharmacy['distance']} 公里 | 评分: {pharmacy['rating']}")
+                    if "price" in pharmacy:
+                        st.write(f"价格: ${pharmacy['price']:.2f} | 库存: {pharmacy['quantity']}")
+                with col2:
+                    if st.button("导航", key=f"nav_{i}"):
+                        st.info(f"已开始导航至 {pharmacy['name']}")
                     
-                    # 显示药房信息
-                    for i, pharmacy in enumerate(pharmacies):
-                        with st.container():
-                            col1, col2 = st.columns([3, 1])
-                            with col1:
-                                st.write(f"#### {i+1}. {pharmacy['name']}")
-                                st.write(f"地址: {pharmacy['address']}")
-                                st.write(f"距离: {pharmacy['distance']} 公里")
-                            with col2:
-                                if st.button("导航", key=f"nav_{i}"):
-                                    st.info(f"已开始导航至 {pharmacy['name']}")
-                                
-                                if st.button("下单", key=f"order_{i}"):
-                                    if medication:
-                                        st.success(f"已将 {medication} 添加到 {pharmacy['name']} 的购物车")
-                                    else:
-                                        st.info(f"请先选择药物")
-                            
-                            st.divider()
-                else:
-                    st.error(f"在半径 {radius}公里内未找到提供{medication if medication else ''}的药房")
-                    st.info("请尝试增加搜索半径或更改药物名称")
\ No newline at end of file
+                    if st.button("下单", key=f"order_{i}"):
+                        if medication:
+                            st.success(f"已将 {medication} 添加到 {pharmacy['name']} 的购物车")
+                        else:
+                            st.info(f"请先选择药物")
+                
+                st.divider()
\ No newline at end of file
@@ -2,17 +2,21 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 import numpy as np
+from utils.analytics_engine import AnalyticsEngine
 
 class VisualizationDashboard:
+    # 单条趋势序列在图表中显示的最大点数，超过时服务端降采样
+    MAX_TREND_POINTS = 120
+    
     # components/visualization_dashboard.py 中的 __init__ 方法
 
-    def __init__(self, data, language="en"):
+    def __init__(self, data, language="en", engine=None):
         self.data = data
         self.language = language
+        # 分析引擎通常由app.py缓存后传入，避免每次重跑都重新载入数据
+        self.engine = engine
         
     def _preprocess_data(self):
         """数据预处理"""
@@ -34,22 +38,19 @@ class VisualizationDashboard:
         
         return self.data
     
-    def _plot_medical_conditions_distribution(self):
+    def _plot_medical_conditions_distribution(self, condition_counts):
         """绘制医疗条件分布图"""
-        if 'Medical Condition' not in self.data.columns:
-            return st.error("数据中缺少'Medical Condition'列")
-        
-        # 统计Top 10医疗条件
-        condition_counts = self.data['Medical Condition'].value_counts().nlargest(10)
+        if condition_counts.empty:
+            return st.info("当前筛选条件下没有数据")
         
         # 使用Plotly创建条形图
         fig = px.bar(
-            x=condition_counts.values,
-            y=condition_counts.index,
+            x=condition_counts['patients'],
+            y=condition_counts['condition'],
             orientation='h',
             title='Top 10 医疗条件分布',
             labels={'x': '患者数量', 'y': '医疗条件'},
-            color=condition_counts.values,
+            color=condition_counts['patients'],
             color_continuous_scale='Blues'
         )
         
@@ -62,21 +63,18 @@ class VisualizationDashboard:
         
         st.plotly_chart(fig, use_container_width=True)
     
-    def _plot_billing_analysis(self):
+    def _plot_billing_analysis(self, avg_bill_by_condition):
         """绘制账单分析图表"""
-        if 'Bill Amount' not in self.data.columns or 'Medical Condition' not in self.data.columns:
-            return st.error("数据中缺少必要的列")
-        
-        # 按医疗条件统计平均账单金额
-        avg_bill_by_condition = self.data.groupby('Medical Condition')['Bill Amount'].mean().nlargest(10)
+        if avg_bill_by_condition.empty:
+            return st.info("当前筛选条件下没有数据")
         
         # 创建条形图
         fig = px.bar(
-            x=avg_bill_by_condition.index,
-            y=avg_bill_by_condition.values,
+            x=avg_bill_by_condition['condition'],
+            y=avg_bill_by_condition['avg_bill'],
             title='各医疗条件的平均账单金额',
             labels={'x': '医疗条件', 'y': '平均账单金额 ($)'},
-            color=avg_bill_by_condition.values,
+            color=avg_bill_by_condition['avg_bill'],
             color_continuous_scale='Blues'
         )
         
@@ -89,34 +87,139 @@ class VisualizationDashboard:
         
         st.plotly_chart(fig, use_container_width=True)
     
+    def _plot_trends(self, filters):
+        """绘制按月趋势图"""
+        metrics = {
+            "入院人数": ("admissions", "入院人数"),
+            "账单总额": ("bill", "账单总额 ($)"),
+            "平均住院天数": ("avg_stay", "平均住院天数"),
+        }
+        
+        col1, col2 = st.columns([1, 2])
+        with col1:
+            metric_label = st.radio("趋势指标", list(metrics.keys()), horizontal=True)
+        with col2:
+            # 默认展示筛选中的疾病，未筛选时展示入院人数最多的5种
+            default_conditions = filters.get("conditions") or self.engine.top_conditions(5)
+            conditions = st.multiselect(
+                "趋势疾病",
+                self.engine.options["conditions"],
+                default=default_conditions,
+                key="trend_conditions"
+            )
+        
+        if not conditions:
+            return st.info("请至少选择一种疾病")
+        
+        metric, y_label = metrics[metric_label]
+        trends = self.engine.monthly_trends(
+            metric=metric,
+            conditions=conditions,
+            date_range=filters.get("date_range"),
+            max_points=self.MAX_TREND_POINTS,
+            genders=filters.get("genders"),
+            age_groups=filters.get("age_groups"),
+            bill_range=filters.get("bill_range")
+        )
+        
+        if trends.empty:
+            return st.info("当前筛选条件下没有数据")
+        
+        fig = px.line(
+            trends,
+            x='year_month',
+            y='value',
+            color='condition',
+            markers=True,
+            title=f'各疾病月度{metric_label}趋势',
+            labels={'year_month': '入院年月', 'value': y_label, 'condition': '医疗条件'}
+        )
+        
+        fig.update_layout(
+            height=500,
+            xaxis_title="入院年月",
+            yaxis_title=y_label
+        )
+        
+        st.plotly_chart(fig, use_container_width=True)
+    
+    def _render_filters(self):
+        """渲染筛选控件，返回筛选条件字典"""
+        options = self.engine.options
+        filters = {}
+        
+        with st.expander("筛选条件", expanded=False):
+            col1, col2 = st.columns(2)
+            with col1:
+                min_date, max_date = options["date_range"]
+                if min_date and max_date:
+                    min_date = datetime.strptime(min_date, "%Y-%m-%d").date()
+                    max_date = datetime.strptime(max_date, "%Y-%m-%d").date()
+                    date_range = st.date_input(
+                        "入院日期范围",
+                        value=(min_date, max_date),
+                        min_value=min_date,
+                        max_value=max_date
+                    )
+                    # 用户只选了起始日期时date_input返回单个值
+                    if isinstance(date_range, (list, tuple)) and len(date_range) == 2:
+                        filters["date_range"] = (date_range[0].isoformat(), date_range[1].isoformat())
+                
+                filters["conditions"] = st.multiselect("医疗条件", options["conditions"])
+            
+            with col2:
+                filters["genders"] = st.multiselect("性别", options["genders"])
+                filters["age_groups"] = st.multiselect("年龄组", options["age_groups"])
+            
+            min_bill, max_bill = options["bill_range"]
+            if max_bill > min_bill:
+                bill_range = st.slider(
+                    "账单金额范围 ($)",
+                    min_value=float(np.floor(min_bill)),
+                    max_value=float(np.ceil(max_bill)),
+                    value=(float(np.floor(min_bill)), float(np.ceil(max_bill)))
+                )
+                # 覆盖全部范围时不下推金额条件，以便复用无筛选的缓存结果
+                if bill_range != (float(np.floor(min_bill)), float(np.ceil(max_bill))):
+                    filters["bill_range"] = bill_range
+        
+        return filters
+    
     def render(self):
         """渲染可视化仪表盘"""
         st.header("📊 医疗数据分析仪表盘")
         
-        # 预处理数据
-        self._preprocess_data()
+        # 未传入分析引擎时基于当前数据构建
+        if self.engine is None:
+            self._preprocess_data()
+            self.engine = AnalyticsEngine(self.data)
+        
+        # 筛选条件下推到分析引擎查询
+        filters = self._render_filters()
+        result = self.engine.query(filters)
+        summary = result["summary"]
         
         # 显示关键指标
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("患者总数", f"{len(self.data):,}")
+            st.metric("患者总数", f"{summary['total_patients']:,}")
         with col2:
-            avg_bill = self.data['Bill Amount'].mean()
+            avg_bill = summary['avg_bill'] or 0.0
             st.metric("平均账单金额", f"${avg_bill:.2f}")
         with col3:
-            if 'Stay Duration' in self.data.columns:
-                avg_stay = self.data['Stay Duration'].mean()
-                st.metric("平均住院天数", f"{avg_stay:.1f} 天")
+            if summary['avg_stay'] is not None:
+                st.metric("平均住院天数", f"{summary['avg_stay']:.1f} 天")
         with col4:
-            if 'Medical Condition' in self.data.columns:
-                unique_conditions = self.data['Medical Condition'].nunique()
-                st.metric("疾病种类数", f"{unique_conditions}")
+            st.metric("疾病种类数", f"{summary['unique_conditions']}")
         
         # 创建选项卡
-        tab1, tab2 = st.tabs(["疾病分布", "账单分析"])
+        tab1, tab2, tab3 = st.tabs(["疾病分布", "账单分析", "趋势分析"])
         
         with tab1:
-            self._plot_medical_conditions_distribution()
+            self._plot_medical_conditions_distribution(result["condition_counts"])
         
         with tab2:
-            self._plot_billing_analysis()
\ No newline at end of file
+            self._plot_billing_analysis(result["avg_bill_by_condition"])
+        
+        with tab3:
+            self._plot_trends(filters)
\ No newline at end of file
@@ -1,6 +1,6 @@
 import os
 import openai
-import pandas as pd
+from utils.training_data_builder import TrainingDataBuilder, DEFAULT_SYSTEM_PROMPT
 
 class FineTunedMedicalModel:
     def __init__(self, model_name=None):
@@ -10,57 +10,35 @@ class FineTunedMedicalModel:
         # 默认使用GPT-4，如果有微调模型则使用微调模型
         self.model_name = model_name if model_name else "gpt-4-turbo"
     
-    def prepare_training_data(self, csv_path):
-        """准备微调训练数据"""
-        df = pd.read_csv(csv_path)
-        
-        # 创建训练样本
-        training_data = []
-        
-        for _, row in df.iterrows():
-            # 创建合成的症状描述
-            symptoms = f"患者描述症状: {row['Medical Condition']}相关症状。{row['Doctor\'s Notes']}"
-            
-            # 创建理想的输出响应
-            response = f"""
-            初步诊断: {row['Medical Condition']}
-            建议治疗: {row['Treatments']}
-            """
-            
-            # 添加到训练数据
-            training_data.append({
-                "messages": [
-                    {"role": "system", "content": "你是ClinixBot，一个专业的医疗诊断助手，根据患者的症状提供初步诊断和治疗建议。"},
-                    {"role": "user", "content": symptoms},
-                    {"role": "assistant", "content": response}
-                ]
-            })
-        
-        return training_data
+    def prepare_training_data(self, csv_path, train_path="training_data.jsonl", validation_path="validation_data.jsonl",
+                              counts_path="training_counts.csv"):
+        """
+        准备微调训练数据，直接写入JSONL文件并返回统计信息(样本数、去重数、训练/验证集大小)
+
+        去重后每条样本的出现次数写入counts_path
+        """
+        builder = TrainingDataBuilder(system_prompt=DEFAULT_SYSTEM_PROMPT)
+        return builder.build(csv_path, train_path=train_path, validation_path=validation_path, counts_path=counts_path)
     
-    def create_fine_tuning_job(self, training_data, validation_data=None):
-        """创建微调任务"""
+    def create_fine_tuning_job(self, train_path="training_data.jsonl", validation_path=None):
+        """创建微调任务，上传prepare_training_data生成的JSONL文件"""
         try:
-            # 将训练数据保存为JSONL文件
-            import json
-            
-            with open("training_data.jsonl", "w") as f:
-                for entry in training_data:
-                    f.write(json.dumps(entry) + "\n")
-            
             # 上传训练文件
-            training_file = openai.File.create(
-                file=open("training_data.jsonl", "rb"),
-                purpose="fine-tune"
-            )
+            with open(train_path, "rb") as f:
+                training_file = openai.File.create(file=f, purpose="fine-tune")
+            
+            job_args = {"training_file": training_file.id}
+            if validation_path:
+                with open(validation_path, "rb") as f:
+                    job_args["validation_file"] = openai.File.create(file=f, purpose="fine-tune").id
             
             # 创建微调任务
             response = openai.FineTuningJob.create(
-                training_file=training_file.id,
                 model="gpt-3.5-turbo",
                 hyperparameters={
                     "n_epochs": 3
-                }
+                },
+                **job_args
             )
             
             return response
@@ -74,7 +52,7 @@ class FineTunedMedicalModel:
             response = openai.ChatCompletion.create(
                 model=self.model_name,
                 messages=[
-                    {"role": "system", "content": "你是ClinixBot，一个专业的医疗诊断助手，根据患者的症状提供初步诊断和治疗建议。"},
+                    {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
                     {"role": "user", "content": f"患者描述症状: {symptoms_description}"}
                 ],
                 temperature=0.3
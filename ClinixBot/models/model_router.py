@@ -0,0 +1,160 @@
+# models/model_router.py
+
+import os
+import threading
+import time
+
+from utils.conversation_memory import count_tokens
+from utils.telemetry import Histogram, telemetry
+
+# USD per 1K tokens (input, output), used for the per-tier cost estimate
+MODEL_PRICES = {
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+
+class ModelTier:
+    """
+    One rung of the routing ladder
+
+    complete(prompt, system_prompt=None) returns the model's text and raises on failure.
+    """
+
+    def __init__(self, name, complete, model_name=None, prices=None):
+        self.name = name
+        self.complete = complete
+        self.model_name = model_name or name
+        self.prices = prices or MODEL_PRICES.get(self.model_name, (0.0, 0.0))
+
+
+class TierStats:
+    def __init__(self):
+        self.calls = 0
+        self.accepted = 0
+        self.escalated = 0
+        self.errors = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.cost = 0.0
+        self.latency = Histogram()
+        self.reasons = {}
+
+
+class TieredModelRouter:
+    """
+    Send each request to the cheapest tier first and escalate only when its answer fails a check
+
+    Tiers are ordered cheapest first; the last tier's answer is always accepted. A check is a
+    function of the text returning None when the answer is acceptable or a short reason string,
+    which is counted per tier so the escalation causes can be inspected.
+    """
+
+    def __init__(self, tiers):
+        if not tiers:
+            raise ValueError("At least one model tier is required")
+        self.tiers = list(tiers)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _record(self, task, tier, seconds, tokens_in, tokens_out, outcome, reason=None):
+        with self._lock:
+            stats = self._stats.get((task, tier.name))
+            if stats is None:
+                stats = self._stats[(task, tier.name)] = TierStats()
+            stats.calls += 1
+            stats.latency.observe(seconds)
+            stats.tokens_in += tokens_in
+            stats.tokens_out += tokens_out
+            stats.cost += (tokens_in * tier.prices[0] + tokens_out * tier.prices[1]) / 1000
+            setattr(stats, outcome, getattr(stats, outcome) + 1)
+            if reason:
+                stats.reasons[reason] = stats.reasons.get(reason, 0) + 1
+
+    def complete(self, task, prompt, system_prompt=None, check=None):
+        """
+        Run the prompt through the tiers, returning (text, tier_name)
+
+        task: label for the stats, e.g. "diagnosis" or "medication"
+        """
+        last_error = None
+        for position, tier in enumerate(self.tiers):
+            final = position == len(self.tiers) - 1
+            tokens_in = count_tokens((system_prompt or "") + prompt)
+            started = time.perf_counter()
+            with telemetry.span(f"router.{task}.{tier.name}") as span:
+                try:
+                    text = tier.complete(prompt, system_prompt)
+                except Exception as e:
+                    last_error = e
+                    self._record(task, tier, time.perf_counter() - started, tokens_in, 0, "errors", type(e).__name__)
+                    continue
+
+                tokens_out = count_tokens(text)
+                reason = None if final or check is None else check(text)
+                if span.recording:
+                    span.set(tokens_in=tokens_in, tokens_out=tokens_out, escalated=reason is not None)
+            seconds = time.perf_counter() - started
+
+            if reason is None:
+                self._record(task, tier, seconds, tokens_in, tokens_out, "accepted")
+                return text, tier.name
+            self._record(task, tier, seconds, tokens_in, tokens_out, "escalated", reason)
+
+        raise last_error or RuntimeError("No model tier produced an answer")
+
+    def stats(self):
+        """Per task and tier: calls, acceptance/escalation rates, latency quantiles, tokens and cost"""
+        with self._lock:
+            report = {}
+            for (task, name), stats in self._stats.items():
+                report.setdefault(task, {})[name] = {
+                    "calls": stats.calls,
+                    "accepted": stats.accepted,
+                    "escalated": stats.escalated,
+                    "errors": stats.errors,
+                    "escalation_rate": round(stats.escalated / stats.calls, 4) if stats.calls else 0.0,
+                    "p50_ms": round(stats.latency.quantile(0.5) * 1000, 3),
+                    "p95_ms": round(stats.latency.quantile(0.95) * 1000, 3),
+                    "tokens_in": stats.tokens_in,
+                    "tokens_out": stats.tokens_out,
+                    "cost_usd": round(stats.cost, 6),
+                    "escalation_reasons": dict(stats.reasons),
+                }
+            return report
+
+    @classmethod
+    def from_env(cls, large_tier):
+        """
+        Build the ladder from the environment, ending with large_tier:
+            CLINIXBOT_SMALL_MODEL       smaller chat model (default gpt-3.5-turbo, "none" to skip)
+
+        The fine-tuned model (CLINIXBOT_FINE_TUNED_MODEL) is not a tier: it was trained to answer
+        "初步诊断: X\n建议治疗: Y" and can't produce the five-section diagnosis or medication answers,
+        so every call would fail the check and only add latency and cost before escalating.
+        """
+        from langchain.chat_models import ChatOpenAI
+
+        tiers = []
+        if os.getenv("CLINIXBOT_FINE_TUNED_MODEL"):
+            print("CLINIXBOT_FINE_TUNED_MODEL is ignored by the model router: "
+                  "the fine-tuned output format doesn't match the diagnosis and medication prompts")
+
+        small = os.getenv("CLINIXBOT_SMALL_MODEL", "gpt-3.5-turbo")
+        if small.lower() != "none":
+            tiers.append(ModelTier("small", chat_completer(ChatOpenAI(model_name=small, temperature=0.2)), model_name=small))
+
+        tiers.append(large_tier)
+        return cls(tiers)
+
+
+def chat_completer(llm):
+    """Adapt a langchain chat model to the ModelTier.complete signature"""
+    from langchain.schema import HumanMessage, SystemMessage
+
+    def complete(prompt, system_prompt=None):
+        if system_prompt is None:
+            return llm.predict(prompt)
+        return llm.predict_messages([SystemMessage(content=system_prompt), HumanMessage(content=prompt)]).content
+
+    return complete
@@ -2,49 +2,193 @@
 
 import os
 import openai
-from langchain.chains import RetrievalQA
 from langchain.chat_models import ChatOpenAI
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.vectorstores import FAISS
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.document_loaders import CSVLoader
 from langchain.prompts import PromptTemplate
+import numpy as np
 import pandas as pd
+import re
+import time
+from contextlib import contextmanager
+from utils.conversation_memory import count_tokens
+from utils.telemetry import telemetry
+from utils.vector_index import EmbeddingCache, VectorIndexStore
+from utils.triage_classifier import TriageClassifier, has_red_flag
+from models.model_router import ModelTier, TieredModelRouter
+
+DEFAULT_LANGUAGE = "en"
+
+DATA_PATH = "./data/hospital_records_2021_2024_with_bills.csv"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Retrieval is restricted to the records of the top triage conditions once their combined
+# confidence reaches this mass; below it the whole knowledge base is searched.
+TRIAGE_FILTER_MASS = 0.8
+
+# Answers from a cheaper model tier are escalated when the highest probability they state
+# for a condition is below this percentage.
+MIN_STATED_CONFIDENCE = 40
+
+# Per-language prompts and markers. Adding a language means adding an entry here;
+# languages without an entry fall back to DEFAULT_LANGUAGE.
+LANGUAGE_PROFILES = {
+    "en": {
+        "diagnosis_template": """
+You are ClinixBot, an experienced medical AI assistant. Based on the patient's symptom description and our medical knowledge base, please provide an accurate preliminary diagnosis.
+
+Medical Knowledge Context:
+{context}
+
+Patient's Symptom Description: {question}
+
+Please respond in English using the following format:
+1. Preliminary Diagnosis: [Possible conditions and their probabilities]
+2. Symptom Analysis: [Analyze the relationship between described symptoms and conditions]
+3. Recommended Tests: [If necessary, suggest medical tests]
+4. Medication Recommendations: [If applicable, suggest medication treatments]
+5. Medical Advice: [Whether medical attention is needed, and recommended departments]
+
+Important Note: If diagnosis is uncertain or symptoms are severe, always advise the patient to seek immediate medical attention. You are not a doctor, and your suggestions cannot replace professional medical consultation.
+""",
+        "diagnosis_marker": "Preliminary Diagnosis",
+        "medication_template": """
+Based on the following diagnosis results, recommend suitable over-the-counter medication treatment plans:
+
+{diagnosis}
+
+Please list in English:
+1. Recommended Medication Names
+2. Dosage and Administration
+3. Expected Effects
+4. Possible Side Effects
+5. Precautions
+""",
+        "pharmacist_system_prompt": "You are an experienced pharmacist, focused on providing accurate medication advice to patients. Please answer in English.",
+        "summary_template": """
+Update the running summary of a medical consultation. Keep symptoms, their onset and changes, relevant history and the conditions discussed. Reply in English with the summary only, in at most 120 words.
+
+Current summary:
+{summary}
+
+New conversation turns:
+{turns}
+""",
+        "uncertain_phrases": ["not sure", "cannot determine", "unable to determine", "cannot be determined"],
+        "diagnosis_error": "Error during diagnosis: ",
+        "medication_error": "Error getting medication recommendations: ",
+    },
+    "zh": {
+        "diagnosis_template": """
+你是一位经验丰富的医疗AI助手ClinixBot。基于患者的症状描述和我们的医疗知识库，请提供准确的初步诊断。
+
+医疗知识库上下文:
+{context}
+
+患者症状描述: {question}
+
+请用中文按照以下格式回答:
+1. 初步诊断：[可能的疾病及其概率]
+2. 症状分析：[分析患者描述的症状与疾病的关联]
+3. 建议检查：[如有必要，建议进行的医学检查]
+4. 用药建议：[如适用，建议的药物治疗]
+5. 就医建议：[是否需要就医，以及建议的科室]
+
+重要提示：如果无法确定诊断或症状严重，务必建议患者及时就医。你不是医生，你的建议不能替代专业医疗咨询。
+""",
+        "diagnosis_marker": "初步诊断",
+        "medication_template": """
+基于以下诊断结果，推荐合适的非处方药物治疗方案：
+
+{diagnosis}
+
+请用中文列出:
+1. 推荐药物名称
+2. 用法用量
+3. 预期效果
+4. 可能的副作用
+5. 注意事项
+""",
+        "pharmacist_system_prompt": "你是一位经验丰富的药剂师，专注于为患者提供准确的用药建议。请用中文回答。",
+        "summary_template": """
+更新一段医疗问诊的滚动摘要。保留症状、出现时间和变化、相关病史以及讨论过的疾病。请用中文只输出摘要，不超过200字。
+
+当前摘要:
+{summary}
+
+新增对话:
+{turns}
+""",
+        "uncertain_phrases": ["无法确定", "不确定", "难以判断", "无法判断"],
+        "diagnosis_error": "诊断过程中出现错误: ",
+        "medication_error": "获取药物推荐时出现错误: ",
+    },
+}
+
+@contextmanager
+def _stage(timings, name, span_name):
+    """Record the duration of a pipeline stage into timings (if given) and as a telemetry span"""
+    started = time.perf_counter()
+    with telemetry.span(span_name) as span:
+        try:
+            yield span
+        finally:
+            if timings is not None:
+                timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
 
 class MedicalRAGModel:
-    def __init__(self):
+    def __init__(self, llm=None, embeddings=None, vector_store_path="./vector_store", data_path=DATA_PATH,
+                 triage_classifier=None, model_router=None, vector_quantization=None,
+                 chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
         # Initialize OpenAI API key
         openai.api_key = os.getenv("OPENAI_API_KEY")
-        self.llm = ChatOpenAI(model_name="gpt-4-turbo", temperature=0.2)
-        self.embeddings = OpenAIEmbeddings()
+        # llm/embeddings can be injected, e.g. pointed at a local stub server for benchmarks
+        self.llm = llm or ChatOpenAI(model_name="gpt-4-turbo", temperature=0.2)
+        self.embeddings = embeddings or OpenAIEmbeddings()
+        self.vector_store_path = vector_store_path
+        self.data_path = data_path
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # Storage precision of the search vectors: none (float32), float16 or int8
+        self.vector_quantization = vector_quantization or os.getenv("CLINIXBOT_VECTOR_QUANTIZATION", "none")
+        # Repeated questions reuse their query embedding instead of calling the embeddings API
+        self.query_cache = EmbeddingCache()
         
         # Create vector store
         self._create_vector_store()
         
-        # Initialize retrieval QA chain
-        self._initialize_qa_chain()
+        # Local classifier used for the fast provisional answer and to pre-filter retrieval
+        self.triage_classifier = triage_classifier or self._create_triage_classifier()
+        
+        # Cheaper models answer first and escalate to gpt-4-turbo when the answer fails a check.
+        # An injected llm (e.g. a benchmark stub) is used alone unless a router is passed too.
+        large_tier = ModelTier("large", self._complete_large, model_name="gpt-4-turbo")
+        if model_router is None:
+            model_router = TieredModelRouter([large_tier]) if llm is not None else TieredModelRouter.from_env(large_tier)
+        self.model_router = model_router
+        
+        # Initialize the diagnosis pipeline
+        self._initialize_pipeline()
     
     def _create_vector_store(self):
-        """Create and load vector store"""
-        # For development purposes, always rebuild the vector store
-        # This avoids the pickle loading security issue
+        """Open the published memory-mapped index, building a new version if it is missing or stale"""
+        # Every worker process maps the same published files read-only, so the vectors and
+        # documents live once in the OS page cache instead of once per process.
+        self.index_store = VectorIndexStore(self.vector_store_path, quantization=self.vector_quantization)
+        self._fallback_store = None
         try:
-            # Load CSV data
-            loader = CSVLoader("./data/hospital_records_2021_2024_with_bills.csv")
-            documents = loader.load()
-            
-            # Split documents
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
-            texts = text_splitter.split_documents(documents)
-            
-            # Create vector store
-            self.vector_store = FAISS.from_documents(texts, self.embeddings)
-            
-            # Save vector store for future use
-            self.vector_store.save_local("./vector_store")
+            source = self.index_source()
+            if self.index_is_stale(source):
+                with self.index_store.build_lock():
+                    # Another worker may have published while this one waited for the lock
+                    if self.index_is_stale(source):
+                        self.publish_vector_store(source)
+            if self.index_store.current() is None:
+                raise RuntimeError(f"No vector index published in {self.vector_store_path}")
         except Exception as e:
             # Fallback to a simple in-memory vector store with minimal data
             print(f"Error creating vector store: {e}")
@@ -54,168 +198,372 @@ class MedicalRAGModel:
                 Document(page_content="Influenza: Symptoms include fever, body aches, fatigue, and respiratory symptoms."),
                 Document(page_content="Hypertension: High blood pressure, often asymptomatic but can cause headaches.")
             ]
-            self.vector_store = FAISS.from_documents(sample_texts, self.embeddings)
-    
-    def _initialize_qa_chain(self):
-        """Initialize retrieval QA chain"""
-        # Create medical diagnosis prompt template
-        template = """
-        You are ClinixBot, an experienced medical AI assistant. Based on the patient's symptom description and our medical knowledge base, please provide an accurate preliminary diagnosis.
-        
-        Medical Knowledge Context:
-        {context}
-        
-        Patient's Symptom Description: {question}
-        
-        Please respond using the following format:
-        1. Preliminary Diagnosis: [Possible conditions and their probabilities]
-        2. Symptom Analysis: [Analyze the relationship between described symptoms and conditions]
-        3. Recommended Tests: [If necessary, suggest medical tests]
-        4. Medication Recommendations: [If applicable, suggest medication treatments]
-        5. Medical Advice: [Whether medical attention is needed, and recommended departments]
-        
-        Important Note: If diagnosis is uncertain or symptoms are severe, always advise the patient to seek immediate medical attention. You are not a doctor, and your suggestions cannot replace professional medical consultation.
+            self._fallback_store = FAISS.from_documents(sample_texts, self.embeddings)
+
+    def _create_triage_classifier(self):
+        """
+        Load the triage classifier saved next to the index, training it if the records changed
+
+        Training takes seconds, so one worker trains under the index build lock and saves the
+        result in the store root; the others load it. Returns None if both fail.
         """
-        
-        QA_PROMPT = PromptTemplate(
-            template=template, 
-            input_variables=["context", "question"]
-        )
-        
-        # Initialize QA chain
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=self.vector_store.as_retriever(search_kwargs={"k": 5}),
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": QA_PROMPT}
-        )
-    
-    def get_diagnosis(self, symptoms_description, language="en"):
-        """Based on symptom description, get diagnosis results"""
         try:
-            # Create language-specific prompt template
-            if language == "zh":
-                prompt_template = """
-                你是一位经验丰富的医疗AI助手ClinixBot。基于患者的症状描述和我们的医疗知识库，请提供准确的初步诊断。
-                
-                医疗知识库上下文:
-                {context}
-                
-                患者症状描述: {question}
-                
-                请用中文按照以下格式回答:
-                1. 初步诊断：[可能的疾病及其概率]
-                2. 症状分析：[分析患者描述的症状与疾病的关联]
-                3. 建议检查：[如有必要，建议进行的医学检查]
-                4. 用药建议：[如适用，建议的药物治疗]
-                5. 就医建议：[是否需要就医，以及建议的科室]
-                
-                重要提示：如果无法确定诊断或症状严重，务必建议患者及时就医。你不是医生，你的建议不能替代专业医疗咨询。
-                """
-            else:
-                prompt_template = """
-                You are ClinixBot, an experienced medical AI assistant. Based on the patient's symptom description and our medical knowledge base, please provide an accurate preliminary diagnosis.
-                
-                Medical Knowledge Context:
-                {context}
-                
-                Patient's Symptom Description: {question}
-                
-                Please respond in English using the following format:
-                1. Preliminary Diagnosis: [Possible conditions and their probabilities]
-                2. Symptom Analysis: [Analyze the relationship between described symptoms and conditions]
-                3. Recommended Tests: [If necessary, suggest medical tests]
-                4. Medication Recommendations: [If applicable, suggest medication treatments]
-                5. Medical Advice: [Whether medical attention is needed, and recommended departments]
-                
-                Important Note: If diagnosis is uncertain or symptoms are severe, always advise the patient to seek immediate medical attention. You are not a doctor, and your suggestions cannot replace professional medical consultation.
-                """
-                
-            # Use language-specific prompt template
-            QA_PROMPT = PromptTemplate(
-                template=prompt_template,
+            with self.index_store.build_lock():
+                return TriageClassifier.from_records_cached(self.data_path, self.vector_store_path)
+        except Exception as e:
+            print(f"Error training triage classifier: {e}")
+            return None
+
+    @property
+    def vector_store(self):
+        """The index used for retrieval; picks up newly published versions"""
+        if self._fallback_store is not None:
+            return self._fallback_store
+        return self.index_store.current()
+
+    def index_source(self):
+        """Describe the inputs of the index, so a stale version can be detected"""
+        stat = os.stat(self.data_path)
+        return {
+            "data_path": self.data_path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "embeddings": f"{type(self.embeddings).__name__}:{getattr(self.embeddings, 'model', '')}",
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "quantization": self.vector_quantization,
+        }
+
+    def index_is_stale(self, source):
+        manifest = self.index_store.manifest()
+        return manifest is None or manifest.get("source") != source
+
+    def publish_vector_store(self, source=None, activate=True):
+        """
+        Embed the knowledge base and publish it as a new index version, returning the version
+
+        Chunks whose text is unchanged reuse their vectors from the current version, so a
+        rebuild after a CSV update only embeds new or edited records.
+        activate=False leaves CURRENT untouched so the version can be validated first.
+        """
+        source = source or self.index_source()
+        loader = CSVLoader(self.data_path)
+        documents = loader.load()
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap
+        )
+        texts = text_splitter.split_documents(documents)
+        contents = [doc.page_content for doc in texts]
+
+        cached = self._cached_vectors(source)
+        missing = [content for content in dict.fromkeys(contents) if content not in cached]
+        if missing:
+            cached.update(zip(missing, self.embeddings.embed_documents(missing)))
+        vectors = [cached[content] for content in contents]
+        return self.index_store.publish(vectors, texts, source=source, activate=activate)
+
+    def activate_index(self, version, index):
+        """Point CURRENT at a validated version and switch retrieval to it in this process"""
+        self.index_store.activate(version, index)
+        self._fallback_store = None
+
+    def _cached_vectors(self, source):
+        """Vectors of the current version keyed by chunk text, if it used the same embedding model"""
+        index = self.index_store.current()
+        if index is None or index.manifest.get("source", {}).get("embeddings") != source["embeddings"]:
+            return {}
+        return {index.document(i).page_content: index.vectors[i] for i in range(len(index))}
+
+    @staticmethod
+    def resolve_language(language):
+        """Map a detected language to one that has a registered profile"""
+        return language if language in LANGUAGE_PROFILES else DEFAULT_LANGUAGE
+
+    def _profile(self, language):
+        return LANGUAGE_PROFILES[self.resolve_language(language)]
+
+    def _initialize_pipeline(self):
+        """Initialize the per-language prompt cache used by the diagnosis pipeline"""
+        # Prompt templates are compiled once per language and reused across requests
+        self._prompt_templates = {}
+        self.retrieval_k = 5
+
+    def _get_prompt_template(self, language):
+        """Return the cached diagnosis prompt for a language, building it on first use"""
+        language = self.resolve_language(language)
+        template = self._prompt_templates.get(language)
+        if template is None:
+            template = PromptTemplate(
+                template=LANGUAGE_PROFILES[language]["diagnosis_template"],
                 input_variables=["context", "question"]
             )
-            
-            # Initialize temporary QA chain
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.vector_store.as_retriever(search_kwargs={"k": 5}),
-                return_source_documents=True,
-                chain_type_kwargs={"prompt": QA_PROMPT}
-            )
-            
-            result = qa_chain({"query": symptoms_description})
+            self._prompt_templates[language] = template
+        return template
+
+    def has_diagnosis(self, text):
+        """Whether a response contains a preliminary diagnosis section in any registered language"""
+        return any(profile["diagnosis_marker"] in text for profile in LANGUAGE_PROFILES.values())
+
+    # The diagnosis pipeline is split into stages so each one can be timed separately:
+    # retrieve (embed + search) -> build prompt -> generate -> parse.
+    def triage(self, text, language="en"):
+        """
+        Ranked conditions from the local classifier, available well before the LLM answers
+
+        Returns {"conditions": [{"condition", "name", "confidence"}, ...], "provisional": top item or None,
+        "red_flag": bool}; "provisional" is only set when the top confidence reaches the classifier
+        threshold and the text has no red-flag terms (chest pain, stroke signs, ...), where a fast
+        but wrong label is the most dangerous.
+        """
+        red_flag = has_red_flag(text)
+        if self.triage_classifier is None:
+            return {"conditions": [], "provisional": None, "red_flag": red_flag}
+        with telemetry.span("rag.triage"):
+            conditions = [
+                {
+                    "condition": condition,
+                    "name": TriageClassifier.condition_name(condition, self.resolve_language(language)),
+                    "confidence": confidence,
+                }
+                for condition, confidence in self.triage_classifier.predict(text)
+            ]
+        confident = conditions and conditions[0]["confidence"] >= self.triage_classifier.threshold
+        provisional = conditions[0] if confident and not red_flag else None
+        return {"conditions": conditions, "provisional": provisional, "red_flag": red_flag}
+
+    def _candidate_rows(self, conditions):
+        """Rows of the records for the top triage conditions, or None to search everything"""
+        index = self.vector_store
+        if not conditions or not hasattr(index, "field_rows"):
+            return None
+        selected, mass = [], 0.0
+        for item in conditions:
+            selected.append(item["condition"])
+            mass += item["confidence"]
+            if mass >= TRIAGE_FILTER_MASS:
+                break
+        else:
+            return None
+
+        groups = index.field_rows("Medical Condition")
+        rows = [groups[condition] for condition in selected if condition in groups]
+        if not rows or sum(len(r) for r in rows) < self.retrieval_k:
+            return None
+        return np.concatenate(rows)
+
+    def _retrieve(self, query, timings=None, conditions=None):
+        """
+        Embed the query and return the k most similar knowledge base documents
+
+        conditions: triage results; confident predictions narrow the search to their records
+        """
+        with _stage(timings, "embed", "rag.diagnosis.embed") as span:
+            embedding = self.query_cache.get(query)
+            if span.recording:
+                span.set(cache_hit=embedding is not None)
+            if embedding is None:
+                embedding = self.embeddings.embed_query(query)
+                self.query_cache.put(query, embedding)
+        with _stage(timings, "search", "rag.diagnosis.search") as span:
+            candidates = self._candidate_rows(conditions)
+            if span.recording:
+                span.set(prefiltered=candidates is not None)
+            if candidates is not None:
+                return self.vector_store.similarity_search_by_vector(embedding, k=self.retrieval_k, candidates=candidates)
+            return self.vector_store.similarity_search_by_vector(embedding, k=self.retrieval_k)
+
+    def _build_diagnosis_prompt(self, query, documents, language, timings=None):
+        """Stuff the retrieved documents into the language's diagnosis prompt"""
+        with _stage(timings, "prompt", "rag.diagnosis.prompt"):
+            context = "\n\n".join(doc.page_content for doc in documents)
+            return self._get_prompt_template(language).format(context=context, question=query)
+
+    def _generate(self, prompt, timings=None, check=None):
+        with _stage(timings, "llm", "rag.diagnosis.llm") as span:
+            text, tier = self.model_router.complete("diagnosis", prompt, check=check)
+            if span.recording:
+                span.set(tier=tier, tokens_in=count_tokens(prompt), tokens_out=count_tokens(text))
+            return text
+
+    @staticmethod
+    def _count_sections(text):
+        return len(re.findall(r"^\s*[1-5][.、]", text, re.MULTILINE))
+
+    def _check_diagnosis(self, text, language, triage=None):
+        """Why a cheaper tier's diagnosis should be escalated, or None if it is acceptable"""
+        profile = self._profile(language)
+        marker = profile["diagnosis_marker"]
+        if marker not in text:
+            return "missing_diagnosis"
+        if self._count_sections(text) < 4:
+            return "missing_sections"
+        lowered = text.lower()
+        if any(phrase in lowered for phrase in profile["uncertain_phrases"]):
+            return "uncertain"
+
+        # The first section lists conditions with probabilities; a low best guess means low confidence
+        diagnosis_line = next(line for line in text.splitlines() if marker in line)
+        stated = [int(value) for value in re.findall(r"(\d{1,3})\s*%", diagnosis_line)]
+        if stated and max(stated) < MIN_STATED_CONFIDENCE:
+            return "low_confidence"
+
+        # A confident local classifier that the answer disagrees with is a reason to ask the large model
+        provisional = (triage or {}).get("provisional")
+        if provisional and not self._mentions_condition(self._diagnosis_section(text, marker), provisional["condition"]):
+            return "disagrees_with_triage"
+        return None
+
+    @staticmethod
+    def _diagnosis_section(text, marker):
+        """The first section of an answer, from the diagnosis marker up to section 2"""
+        start = text.index(marker)
+        end = re.search(r"^\s*2[.、]", text[start:], re.MULTILINE)
+        return text[start:start + end.start()] if end else text[start:]
+
+    def _mentions_condition(self, section, condition):
+        """
+        Whether the diagnosis section names the condition
+
+        Exact English/Chinese names are checked first; otherwise the section is run through the
+        triage classifier, which also knows abbreviations and synonyms ("COPD", "慢阻肺").
+        """
+        lowered = section.lower()
+        if condition.lower() in lowered or TriageClassifier.condition_name(condition, "zh") in section:
+            return True
+        if self.triage_classifier is None:
+            return True
+        return condition in [predicted for predicted, _ in self.triage_classifier.predict(section)]
+
+    def _check_medication(self, text):
+        return None if self._count_sections(text) >= 4 else "missing_sections"
+
+    def _parse_diagnosis(self, text, documents, timings=None):
+        with _stage(timings, "parse", "rag.diagnosis.parse"):
             return {
-                "diagnosis": result["result"],
-                "sources": [doc.page_content for doc in result["source_documents"]]
+                "diagnosis": text.strip(),
+                "sources": [doc.page_content for doc in documents]
             }
+    
+    def get_diagnosis(self, symptoms_description, language="en", timings=None, retrieval_query=None,
+                      message=None, triage=None):
+        """
+        Based on symptom description, get diagnosis results
+
+        timings: optional dict that receives the duration in seconds of each stage
+        retrieval_query: text to search the knowledge base with, defaults to symptoms_description;
+            multi-turn callers pass the current message plus a short summary instead of the
+            full conversation so earlier topics don't pull retrieval off course
+        message: the patient's current message when symptoms_description is a multi-turn
+            composite; triage runs on it alone so earlier conditions don't leak into the result
+        triage: a result of self.triage() the caller already computed (e.g. for the provisional
+            answer), reused for the prefilter and the router check instead of classifying again
+        """
+        try:
+            with telemetry.span("rag.get_diagnosis", language=self.resolve_language(language)):
+                with _stage(timings, "triage", "rag.diagnosis.triage"):
+                    if triage is None:
+                        triage = self.triage(message or symptoms_description, language)
+                documents = self._retrieve(retrieval_query or symptoms_description, timings, triage["conditions"])
+                prompt = self._build_diagnosis_prompt(symptoms_description, documents, language, timings)
+                text = self._generate(prompt, timings, check=lambda text: self._check_diagnosis(text, language, triage))
+                result = self._parse_diagnosis(text, documents, timings)
+                result["triage"] = triage["conditions"]
+                return result
         except Exception as e:
-            error_msg = "诊断过程中出现错误: " if language == "zh" else "Error during diagnosis: "
+            error_msg = self._profile(language)["diagnosis_error"]
             return {
                 "diagnosis": f"{error_msg}{str(e)}",
-                "sources": []
+                "sources": [],
+                "triage": []
             }
     
-    def get_medication_recommendations(self, diagnosis, language="en"):
-        """Based on diagnosis results, recommend medications"""
+    def stream_diagnosis(self, symptoms_description, language="en", retrieval_query=None, message=None, triage=None):
+        """
+        Streaming variant of get_diagnosis
+
+        Takes the same retrieval_query, message and triage arguments as get_diagnosis.
+        Yields ("triage", {...}) from the local classifier first, ("sources", [...]) once retrieval
+        is done, then ("token", text) for each chunk from the LLM, and finally ("done", full_diagnosis).
+        """
+        try:
+            with telemetry.span("rag.stream_diagnosis", language=self.resolve_language(language)):
+                if triage is None:
+                    triage = self.triage(message or symptoms_description, language)
+                yield "triage", triage
+                documents = self._retrieve(retrieval_query or symptoms_description, conditions=triage["conditions"])
+                yield "sources", [doc.page_content for doc in documents]
+
+                prompt = self._build_diagnosis_prompt(symptoms_description, documents, language)
+                chunks = []
+                with _stage(None, "llm", "rag.diagnosis.llm"):
+                    for chunk in self.llm.stream(prompt):
+                        chunks.append(chunk.content)
+                        yield "token", chunk.content
+                yield "done", "".join(chunks).strip()
+        except Exception as e:
+            yield "done", f"{self._profile(language)['diagnosis_error']}{str(e)}"
+    
+    def summarize_conversation(self, summary, turns, language="en"):
+        """Fold older conversation turns into the running summary used by ConversationMemory"""
+        turns_text = "\n".join(f"Patient: {user}\nAssistant: {bot}" for user, bot in turns)
+        prompt = self._profile(language)["summary_template"].format(summary=summary or "-", turns=turns_text)
+        return self.llm.predict(prompt)
+    
+    def _complete_large(self, prompt, system_prompt=None):
+        """The gpt-4-turbo tier: the langchain model for diagnosis, the openai client with a system prompt"""
+        if system_prompt is None:
+            return self.llm.predict(prompt)
+        return self._complete_chat(system_prompt, prompt)
+
+    def _complete_chat(self, system_prompt, prompt):
+        """Single chat completion through the openai client, returning the raw response"""
+        # Try both new and old OpenAI API versions
+        try:
+            # New OpenAI API (>=1.0.0)
+            response = openai.chat.completions.create(
+                model="gpt-4-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3
+            )
+            return response.choices[0].message.content
+        except AttributeError:
+            # Old OpenAI API (<1.0.0)
+            response = openai.ChatCompletion.create(
+                model="gpt-4-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3
+            )
+            return response.choices[0].message["content"]
+    
+    def get_medication_recommendations(self, diagnosis, language="en", timings=None):
+        """
+        Based on diagnosis results, recommend medications
+
+        timings: optional dict that receives the duration in seconds of each stage
+        """
+        profile = self._profile(language)
         try:
-            # Create language-specific prompt
-            if language == "zh":
-                prompt = f"""
-                基于以下诊断结果，推荐合适的非处方药物治疗方案：
-                
-                {diagnosis}
-                
-                请用中文列出:
-                1. 推荐药物名称
-                2. 用法用量
-                3. 预期效果
-                4. 可能的副作用
-                5. 注意事项
-                """
-                system_prompt = "你是一位经验丰富的药剂师，专注于为患者提供准确的用药建议。请用中文回答。"
-            else:
-                prompt = f"""
-                Based on the following diagnosis results, recommend suitable over-the-counter medication treatment plans:
-                
-                {diagnosis}
-                
-                Please list in English:
-                1. Recommended Medication Names
-                2. Dosage and Administration
-                3. Expected Effects
-                4. Possible Side Effects
-                5. Precautions
-                """
-                system_prompt = "You are an experienced pharmacist, focused on providing accurate medication advice to patients. Please answer in English."
-            
-            # Try both new and old OpenAI API versions
-            try:
-                # New OpenAI API (>=1.0.0)
-                response = openai.chat.completions.create(
-                    model="gpt-4-turbo",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.3
-                )
-                return response.choices[0].message.content
-            except AttributeError:
-                # Old OpenAI API (<1.0.0)
-                response = openai.ChatCompletion.create(
-                    model="gpt-4-turbo",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.3
-                )
-                return response.choices[0].message["content"]
+            with telemetry.span("rag.get_medication_recommendations", language=self.resolve_language(language)):
+                with _stage(timings, "prompt", "rag.medication.prompt"):
+                    prompt = profile["medication_template"].format(diagnosis=diagnosis)
+                    system_prompt = profile["pharmacist_system_prompt"]
+                with _stage(timings, "llm", "rag.medication.llm") as span:
+                    content, tier = self.model_router.complete(
+                        "medication", prompt, system_prompt=system_prompt, check=self._check_medication
+                    )
+                    if span.recording:
+                        span.set(tier=tier, tokens_in=count_tokens(system_prompt + prompt), tokens_out=count_tokens(content))
+                with _stage(timings, "parse", "rag.medication.parse"):
+                    return content.strip()
         except Exception as e:
             # Fallback to mock data if API call fails
-            error_msg = "获取药物推荐时出现错误: " if language == "zh" else "Error getting medication recommendations: "
-            return f"{error_msg}{str(e)}"
\ No newline at end of file
+            error_msg = profile["medication_error"]
+            return f"{error_msg}{str(e)}"
@@ -0,0 +1,145 @@
+# models/remote_model.py
+
+import json
+import time
+
+import requests
+
+# Used until the service's /v1/languages answers, so a slow or unreachable API
+# degrades to the built-in languages instead of failing the chat turn
+LANGUAGES_RETRY_SECONDS = 30
+
+FALLBACK_LANGUAGES = {
+    "default": "en",
+    "languages": {
+        "en": {
+            "diagnosis_marker": "Preliminary Diagnosis",
+            "diagnosis_error": "Error during diagnosis: ",
+            "medication_error": "Error getting medication recommendations: ",
+        },
+        "zh": {
+            "diagnosis_marker": "初步诊断",
+            "diagnosis_error": "诊断过程中出现错误: ",
+            "medication_error": "获取药物推荐时出现错误: ",
+        },
+    },
+}
+
+
+class RemoteMedicalModel:
+    """
+    Thin client for the ClinixBot API service (api/server.py)
+
+    Exposes the same methods ChatInterface uses on MedicalRAGModel, so the Streamlit UI
+    can hand model work to separately scaled API workers.
+    """
+
+    def __init__(self, base_url, timeout=120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._languages = None
+        self._languages_retry_at = 0.0
+
+    def _post(self, path, payload):
+        response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _language_profiles(self):
+        """
+        Registered languages, diagnosis markers and error messages, fetched once from the service
+
+        Falls back to FALLBACK_LANGUAGES when the service can't be reached and retries
+        at most every LANGUAGES_RETRY_SECONDS, so an outage doesn't add a timeout to every call.
+        """
+        if self._languages is None:
+            if time.monotonic() < self._languages_retry_at:
+                return FALLBACK_LANGUAGES
+            try:
+                response = self.session.get(f"{self.base_url}/v1/languages", timeout=self.timeout)
+                response.raise_for_status()
+                self._languages = response.json()
+            except (requests.RequestException, ValueError) as e:
+                print(f"Error fetching language profiles: {e}")
+                self._languages_retry_at = time.monotonic() + LANGUAGES_RETRY_SECONDS
+                return FALLBACK_LANGUAGES
+        return self._languages
+
+    def resolve_language(self, language):
+        profiles = self._language_profiles()
+        return language if language in profiles["languages"] else profiles["default"]
+
+    def _error_message(self, language, key):
+        """Localized error prefix from the language profiles, falling back to the built-in defaults"""
+        profiles = self._language_profiles()
+        profile = profiles["languages"].get(language) or profiles["languages"].get(profiles["default"], {})
+        default = FALLBACK_LANGUAGES["languages"].get(language, FALLBACK_LANGUAGES["languages"]["en"])
+        return profile.get(key) or default[key]
+
+    def has_diagnosis(self, text):
+        return any(profile["diagnosis_marker"] in text for profile in self._language_profiles()["languages"].values())
+
+    def get_diagnosis(self, symptoms_description, language="en", retrieval_query=None, message=None, triage=None):
+        """
+        Based on symptom description, get diagnosis results
+
+        triage is accepted for parity with MedicalRAGModel but not sent: the service re-runs its
+        local classifier on message, which is cheap and can't be skewed by the client.
+        """
+        try:
+            result = self._post("/v1/diagnosis", {
+                "symptoms": symptoms_description,
+                "language": language,
+                "retrieval_query": retrieval_query,
+                "message": message,
+            })
+            return {"diagnosis": result["diagnosis"], "sources": result["sources"], "triage": result.get("triage", [])}
+        except Exception as e:
+            error_msg = self._error_message(language, "diagnosis_error")
+            return {"diagnosis": f"{error_msg}{str(e)}", "sources": [], "triage": []}
+
+    def triage(self, text, language="en"):
+        """Fast ranked conditions from the service's local classifier"""
+        try:
+            return self._post("/v1/triage", {"text": text, "language": language})
+        except Exception as e:
+            print(f"Error getting triage: {e}")
+            return {"conditions": [], "provisional": None, "red_flag": False}
+
+    def stream_diagnosis(self, symptoms_description, language="en", retrieval_query=None, message=None, triage=None):
+        """Yield (event, data) pairs from the SSE endpoint, mirroring MedicalRAGModel.stream_diagnosis"""
+        with self.session.post(
+            f"{self.base_url}/v1/diagnosis/stream",
+            json={
+                "symptoms": symptoms_description,
+                "language": language,
+                "retrieval_query": retrieval_query,
+                "message": message,
+            },
+            timeout=self.timeout,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: ") and event:
+                    data = json.loads(line[len("data: "):])
+                    yield event, data["diagnosis"] if event == "done" else data
+
+    def get_medication_recommendations(self, diagnosis, language="en"):
+        """Based on diagnosis results, recommend medications"""
+        try:
+            return self._post("/v1/medications", {"diagnosis": diagnosis, "language": language})["medications"]
+        except Exception as e:
+            error_msg = self._error_message(language, "medication_error")
+            return f"{error_msg}{str(e)}"
+
+    def summarize_conversation(self, summary, turns, language="en"):
+        return self._post("/v1/summaries", {
+            "summary": summary,
+            "turns": [list(turn) for turn in turns],
+            "language": language,
+        })["summary"]
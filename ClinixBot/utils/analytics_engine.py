@@ -0,0 +1,404 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.telemetry import telemetry
+
+
+def downsample_series(x, y, max_points):
+    """
+    使用LTTB(Largest-Triangle-Three-Buckets)算法对序列降采样
+
+    保留首尾点，每个桶中选出与前一个选中点、下一个桶均值构成最大三角形面积的点，
+    点数大幅减少时仍能保留峰谷形状。返回选中点的下标数组。
+    """
+    n = len(y)
+    if max_points is None or max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    selected = np.empty(max_points, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # 首尾之外的点均分为max_points-2个桶
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    prev = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+        else:
+            next_start, next_end = n - 1, n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[prev] - next_x) * (y[start:end] - y[prev])
+            - (x[prev] - x[start:end]) * (next_y - y[prev])
+        )
+        prev = start + int(np.argmax(area))
+        selected[i + 1] = prev
+
+    return selected
+
+
+class AnalyticsEngine:
+    """嵌入式分析引擎：把就诊记录载入带索引的SQLite表，筛选条件下推为SQL查询"""
+
+    # 列名映射：DataFrame列 -> records表列
+    COLUMN_MAP = {
+        'Admit Date': 'admit_date',
+        'Medical Condition': 'condition',
+        'Gender': 'gender',
+        'Age Group': 'age_group',
+        'Bill Amount': 'bill_amount',
+        'Stay Duration': 'stay_duration',
+    }
+
+    def __init__(self, data, db_path=":memory:", cache_size=128):
+        """
+        data: 经过DataProcessor预处理的DataFrame
+        db_path: SQLite数据库路径，默认使用内存数据库
+        cache_size: 查询结果LRU缓存的最大筛选组合数
+        """
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Streamlit会在不同线程中重跑脚本，连接由锁保护共享使用
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._init_schema()
+        self._load(data)
+        self.options = self._load_filter_options()
+
+    def _init_schema(self):
+        """创建记录表及筛选所需的索引"""
+        cursor = self._conn.cursor()
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS records (
+            admit_date TEXT,
+            admit_yearmonth TEXT,
+            condition TEXT,
+            gender TEXT,
+            age_group TEXT,
+            bill_amount REAL,
+            stay_duration REAL
+        )
+        ''')
+
+        # 常用筛选维度的索引，疾病+日期的组合索引覆盖最常见的切片
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_date ON records (admit_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_condition_date ON records (condition, admit_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_gender ON records (gender)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_age_group ON records (age_group)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_bill ON records (bill_amount)')
+
+        # 按月份和疾病物化的汇总表，新记录到达时增量累加而不是重新计算
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_rollup (
+            year_month TEXT,
+            condition TEXT,
+            admissions INTEGER,
+            bill_sum REAL,
+            stay_sum REAL,
+            stay_count INTEGER,
+            PRIMARY KEY (year_month, condition)
+        )
+        ''')
+        self._conn.commit()
+
+    def _to_frame(self, data):
+        """将DataFrame转换为records表的列布局"""
+        df = pd.DataFrame(index=data.index)
+        for source, target in self.COLUMN_MAP.items():
+            df[target] = data[source] if source in data.columns else None
+
+        admit_dates = pd.to_datetime(df['admit_date'], errors='coerce')
+        df['admit_date'] = admit_dates.dt.strftime('%Y-%m-%d')
+        df['admit_yearmonth'] = admit_dates.dt.strftime('%Y-%m')
+        df['age_group'] = df['age_group'].astype('object')
+
+        columns = ['admit_date', 'admit_yearmonth', 'condition', 'gender', 'age_group', 'bill_amount', 'stay_duration']
+        return df[columns]
+
+    @staticmethod
+    def _rollup_rows(frame):
+        """只对本批新记录按月份和疾病聚合"""
+        frame = frame.dropna(subset=['admit_yearmonth', 'condition'])
+        rollup = frame.groupby(['admit_yearmonth', 'condition']).agg(
+            admissions=('condition', 'size'),
+            bill_sum=('bill_amount', 'sum'),
+            stay_sum=('stay_duration', 'sum'),
+            stay_count=('stay_duration', 'count'),
+        ).reset_index()
+        return [
+            (ym, cond, int(adm), float(bill), float(stay), int(cnt))
+            for ym, cond, adm, bill, stay, cnt in rollup.itertuples(index=False, name=None)
+        ]
+
+    def append_records(self, data):
+        """
+        追加一批新记录
+
+        原始记录批量写入records表；月度汇总只对新批次聚合，再累加到monthly_rollup，
+        已有月份不会重新计算。
+        """
+        frame = self._to_frame(data)
+        rows = frame.astype('object').where(frame.notna(), None).itertuples(index=False, name=None)
+        rollup_rows = self._rollup_rows(frame)
+
+        with self._lock:
+            self._conn.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self._conn.executemany('''
+            INSERT INTO monthly_rollup (year_month, condition, admissions, bill_sum, stay_sum, stay_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (year_month, condition) DO UPDATE SET
+                admissions = admissions + excluded.admissions,
+                bill_sum = bill_sum + excluded.bill_sum,
+                stay_sum = stay_sum + excluded.stay_sum,
+                stay_count = stay_count + excluded.stay_count
+            ''', rollup_rows)
+            self._conn.commit()
+            # 数据变化后已缓存的查询结果全部失效
+            self._cache.clear()
+
+        if hasattr(self, "options"):
+            self.options = self._load_filter_options()
+
+    def _load(self, data):
+        """初次载入记录并收集查询规划统计信息"""
+        self.append_records(data)
+        with self._lock:
+            self._conn.execute('ANALYZE')
+            self._conn.commit()
+
+    def _load_filter_options(self):
+        """读取筛选控件的可选值和取值范围"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            conditions = [r[0] for r in cursor.execute(
+                'SELECT DISTINCT condition FROM records WHERE condition IS NOT NULL ORDER BY condition')]
+            genders = [r[0] for r in cursor.execute(
+                'SELECT DISTINCT gender FROM records WHERE gender IS NOT NULL ORDER BY gender')]
+            age_groups = [r[0] for r in cursor.execute(
+                'SELECT DISTINCT age_group FROM records WHERE age_group IS NOT NULL ORDER BY age_group')]
+            min_date, max_date, min_bill, max_bill = cursor.execute(
+                'SELECT MIN(admit_date), MAX(admit_date), MIN(bill_amount), MAX(bill_amount) FROM records'
+            ).fetchone()
+
+        return {
+            "conditions": conditions,
+            "genders": genders,
+            "age_groups": age_groups,
+            "date_range": (min_date, max_date),
+            "bill_range": (min_bill or 0.0, max_bill or 0.0),
+        }
+
+    @staticmethod
+    def _filter_key(filters):
+        """将筛选条件规范化为可哈希的缓存键"""
+        filters = filters or {}
+        date_range = filters.get("date_range") or (None, None)
+        bill_range = filters.get("bill_range") or (None, None)
+        return (
+            str(date_range[0]) if date_range[0] else None,
+            str(date_range[1]) if date_range[1] else None,
+            tuple(sorted(filters.get("conditions") or [])),
+            tuple(sorted(filters.get("genders") or [])),
+            tuple(sorted(filters.get("age_groups") or [])),
+            bill_range[0],
+            bill_range[1],
+        )
+
+    @staticmethod
+    def _build_where(key):
+        """根据缓存键生成WHERE子句和参数"""
+        start_date, end_date, conditions, genders, age_groups, bill_min, bill_max = key
+        clauses = []
+        params = []
+
+        if conditions:
+            clauses.append(f"condition IN ({', '.join('?' * len(conditions))})")
+            params.extend(conditions)
+        if start_date:
+            clauses.append("admit_date >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append("admit_date <= ?")
+            params.append(end_date)
+        if genders:
+            clauses.append(f"gender IN ({', '.join('?' * len(genders))})")
+            params.extend(genders)
+        if age_groups:
+            clauses.append(f"age_group IN ({', '.join('?' * len(age_groups))})")
+            params.extend(age_groups)
+        if bill_min is not None:
+            clauses.append("bill_amount >= ?")
+            params.append(bill_min)
+        if bill_max is not None:
+            clauses.append("bill_amount <= ?")
+            params.append(bill_max)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(self, filters=None, top_n=10):
+        """
+        按筛选条件查询仪表盘所需的汇总结果
+
+        filters: 包含date_range、conditions、genders、age_groups、bill_range的字典
+        返回包含summary、condition_counts、avg_bill_by_condition的字典
+        """
+        key = self._filter_key(filters) + (top_n,)
+
+        with telemetry.span("analytics.query") as span:
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    span.set(cache_hit=True)
+                    return self._cache[key]
+                span.set(cache_hit=False)
+
+                where, params = self._build_where(key[:-1])
+                cursor = self._conn.cursor()
+
+                total, avg_bill, avg_stay, unique_conditions = cursor.execute(
+                    f'SELECT COUNT(*), AVG(bill_amount), AVG(stay_duration), COUNT(DISTINCT condition) FROM records {where}',
+                    params
+                ).fetchone()
+
+                condition_counts = pd.read_sql_query(
+                    f'''
+                    SELECT condition, COUNT(*) AS patients FROM records {where}
+                    GROUP BY condition ORDER BY patients DESC LIMIT ?
+                    ''',
+                    self._conn,
+                    params=params + [top_n]
+                )
+
+                avg_bill_by_condition = pd.read_sql_query(
+                    f'''
+                    SELECT condition, AVG(bill_amount) AS avg_bill FROM records {where}
+                    GROUP BY condition ORDER BY avg_bill DESC LIMIT ?
+                    ''',
+                    self._conn,
+                    params=params + [top_n]
+                )
+
+                result = {
+                    "summary": {
+                        "total_patients": total,
+                        "avg_bill": avg_bill,
+                        "avg_stay": avg_stay,
+                        "unique_conditions": unique_conditions,
+                    },
+                    "condition_counts": condition_counts,
+                    "avg_bill_by_condition": avg_bill_by_condition,
+                }
+
+                self._cache[key] = result
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+                return result
+
+    def monthly_trends(self, metric="admissions", conditions=None, date_range=None, max_points=None,
+                       genders=None, age_groups=None, bill_range=None):
+        """
+        按疾病拆分的月度趋势序列
+
+        metric: admissions(入院人数)、bill(账单总额)或avg_stay(平均住院天数)
+        max_points: 单条序列超过该点数时在服务端用LTTB降采样
+        只按疾病和日期筛选时读取月度汇总表；汇总表不含性别、年龄组和账单金额维度，
+        带这些筛选时改为直接聚合records表，与仪表盘其他面板的筛选结果一致
+        返回包含year_month、condition、value列的DataFrame
+        """
+        rollup_expressions = {
+            "admissions": "SUM(admissions)",
+            "bill": "SUM(bill_sum)",
+            "avg_stay": "SUM(stay_sum) / NULLIF(SUM(stay_count), 0)",
+        }
+        record_expressions = {
+            "admissions": "COUNT(*)",
+            "bill": "SUM(bill_amount)",
+            "avg_stay": "AVG(stay_duration)",
+        }
+        if metric not in rollup_expressions:
+            raise ValueError(f"不支持的趋势指标: {metric}")
+
+        filter_key = self._filter_key({
+            "date_range": date_range,
+            "conditions": conditions,
+            "genders": genders,
+            "age_groups": age_groups,
+            "bill_range": bill_range,
+        })
+        start_date, end_date, conditions, genders, age_groups, bill_min, bill_max = filter_key
+        use_records = bool(genders or age_groups or bill_min is not None or bill_max is not None)
+        key = ("trend", metric, filter_key, max_points)
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+            if use_records:
+                where, params = self._build_where(filter_key)
+                sql = f'''
+                SELECT admit_yearmonth AS year_month, condition, {record_expressions[metric]} AS value
+                FROM records {where}
+                GROUP BY condition, admit_yearmonth
+                ORDER BY condition, admit_yearmonth
+                '''
+            else:
+                clauses = []
+                params = []
+                if conditions:
+                    clauses.append(f"condition IN ({', '.join('?' * len(conditions))})")
+                    params.extend(conditions)
+                if start_date:
+                    clauses.append("year_month >= ?")
+                    params.append(start_date[:7])
+                if end_date:
+                    clauses.append("year_month <= ?")
+                    params.append(end_date[:7])
+                where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+                sql = f'''
+                SELECT year_month, condition, {rollup_expressions[metric]} AS value
+                FROM monthly_rollup {where}
+                GROUP BY condition, year_month
+                ORDER BY condition, year_month
+                '''
+
+            trends = pd.read_sql_query(sql, self._conn, params=params)
+
+            # 序列点数超过图表可显示的数量时降采样
+            if max_points:
+                parts = []
+                for _, series in trends.groupby('condition', sort=False):
+                    if len(series) > max_points:
+                        series = series.iloc[downsample_series(np.arange(len(series)), series['value'].fillna(0), max_points)]
+                    parts.append(series)
+                if parts:
+                    trends = pd.concat(parts, ignore_index=True)
+
+            self._cache[key] = trends
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+            return trends
+
+    def top_conditions(self, n=5):
+        """按累计入院人数返回前n个疾病"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT condition FROM monthly_rollup GROUP BY condition ORDER BY SUM(admissions) DESC LIMIT ?',
+                (n,)
+            ).fetchall()
+        return [r[0] for r in rows]
@@ -0,0 +1,196 @@
+import csv
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+class CapacitySnapshot:
+    """
+    某一版本的医院容量快照(只读)
+
+    beds_available、wait_minutes与医院数据行一一对齐，可以直接用空间索引返回的
+    下标做向量化筛选和排序。快照创建后不再修改，更新时生成新快照整体替换。
+    """
+
+    def __init__(self, version, ids, beds_available, wait_minutes, updated_at):
+        self.version = version
+        self.ids = ids
+        self.beds_available = beds_available
+        self.wait_minutes = wait_minutes
+        self.updated_at = updated_at
+
+        for array in (beds_available, wait_minutes, updated_at):
+            array.flags.writeable = False
+
+
+class CapacityFeed:
+    """
+    医院床位和等待时间的实时数据接入
+
+    后台线程轮询投递目录(默认data/capacity_feed)中的.csv/.jsonl文件，
+    每行一条{hospital_id, beds_available, wait_minutes, updated_at}更新，字段可缺省。
+    更新以写时复制方式应用：复制数组、修改、生成新版本快照后替换引用，
+    读取方只需读取snapshot属性，不需要加锁。
+    """
+
+    def __init__(self, hospitals, feed_dir="data/capacity_feed", poll_interval=0.5):
+        """
+        hospitals: 包含id、beds_available、wait_minutes列的DataFrame，行顺序与空间索引一致
+        """
+        self.feed_dir = feed_dir
+        self.poll_interval = poll_interval
+
+        ids = hospitals["id"].tolist()
+        self._positions = {hospital_id: i for i, hospital_id in enumerate(ids)}
+        self._snapshot = CapacitySnapshot(
+            version=0,
+            ids=ids,
+            beds_available=hospitals["beds_available"].fillna(0).to_numpy(dtype=np.int32).copy(),
+            wait_minutes=hospitals["wait_minutes"].fillna(np.inf).to_numpy(dtype=np.float64).copy(),
+            updated_at=np.zeros(len(ids), dtype=np.float64),
+        )
+
+        self._write_lock = threading.Lock()
+        self._seen_files = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def snapshot(self):
+        """当前容量快照"""
+        return self._snapshot
+
+    @staticmethod
+    def _parse_time(value):
+        """把更新时间解析为Unix时间戳，支持数字和ISO格式"""
+        if value in (None, ""):
+            return time.time()
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return datetime.fromisoformat(str(value)).timestamp()
+
+    def _parse_update(self, update):
+        """
+        校验一条更新，返回(行号, 时间戳, 床位数, 等待分钟)，缺省字段为None；未知医院返回None
+
+        字段格式错误时抛出ValueError
+        """
+        if not isinstance(update, dict):
+            raise ValueError(f"更新不是对象: {update!r}")
+        position = self._positions.get(update.get("hospital_id"))
+        if position is None:
+            return None
+        timestamp = self._parse_time(update.get("updated_at"))
+
+        beds = update.get("beds_available")
+        if beds not in (None, ""):
+            value = float(beds)
+            if not value.is_integer() or value < 0:
+                raise ValueError(f"无效的床位数: {beds!r}")
+            beds = int(value)
+        else:
+            beds = None
+
+        wait = update.get("wait_minutes")
+        if wait not in (None, ""):
+            wait = float(wait)
+            if np.isnan(wait) or wait < 0:
+                raise ValueError(f"无效的等待时间: {update.get('wait_minutes')!r}")
+        else:
+            wait = None
+        return position, timestamp, beds, wait
+
+    def apply_deltas(self, updates):
+        """
+        应用一批容量更新，返回新快照版本号
+
+        updates: 字典序列，未知医院和比当前数据更旧的更新会被忽略，格式错误的更新记录日志后跳过
+        """
+        with self._write_lock:
+            current = self._snapshot
+            beds = current.beds_available.copy()
+            wait = current.wait_minutes.copy()
+            updated_at = current.updated_at.copy()
+            changed = False
+
+            for update in updates:
+                try:
+                    parsed = self._parse_update(update)
+                except (TypeError, ValueError, OverflowError) as e:
+                    print(f"跳过无效的容量更新 {update!r}: {e}")
+                    continue
+                if parsed is None:
+                    continue
+                position, timestamp, new_beds, new_wait = parsed
+                if timestamp < updated_at[position]:
+                    continue
+
+                if new_beds is not None:
+                    beds[position] = new_beds
+                if new_wait is not None:
+                    wait[position] = new_wait
+                updated_at[position] = timestamp
+                changed = True
+
+            if changed:
+                self._snapshot = CapacitySnapshot(current.version + 1, current.ids, beds, wait, updated_at)
+            return self._snapshot.version
+
+    def _read_file(self, path):
+        """读取一个投递文件中的全部更新"""
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".csv"):
+                return list(csv.DictReader(f))
+            return [json.loads(line) for line in f if line.strip()]
+
+    def poll_once(self):
+        """扫描投递目录，应用新增或修改过的文件"""
+        if not os.path.isdir(self.feed_dir):
+            return self._snapshot.version
+
+        updates, read = [], {}
+        for entry in sorted(os.scandir(self.feed_dir), key=lambda e: e.name):
+            if not entry.is_file() or not entry.name.endswith((".csv", ".jsonl")):
+                continue
+            mtime = entry.stat().st_mtime
+            if self._seen_files.get(entry.name) == mtime:
+                continue
+            try:
+                updates.extend(self._read_file(entry.path))
+                read[entry.name] = mtime
+            except (OSError, ValueError) as e:
+                # 文件可能还在写入中，下次轮询重试
+                print(f"读取容量更新文件 {entry.name} 时出错: {e}")
+
+        version = self.apply_deltas(updates) if updates else self._snapshot.version
+        # 应用成功后才标记为已处理，应用过程中出错时下次轮询重新读取
+        self._seen_files.update(read)
+        return version
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            # 单次轮询出错不能终止后台线程，否则之后的更新都不会再被应用
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"轮询容量更新时出错: {e}")
+
+    def start(self):
+        """启动后台轮询线程"""
+        if self._thread is None:
+            self.poll_once()
+            self._thread = threading.Thread(target=self._run, name="clinixbot-capacity-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止后台轮询线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 2)
+            self._thread = None
@@ -0,0 +1,201 @@
+import re
+import threading
+
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+_encoding = None
+
+
+def count_tokens(text):
+    """计算文本的token数，tiktoken不可用(如离线无法下载编码表)时按字符数估算"""
+    global _encoding
+    if not text:
+        return 0
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"加载tiktoken编码时出错，改用估算: {e}")
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    # 中日韩字符约每字一个token，其余约每4个字符一个token
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_tokens(text, max_tokens, keep="head"):
+    """把文本截断到max_tokens以内，keep="tail"时保留末尾"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding:
+        tokens = _encoding.encode(text)
+        tokens = tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:]
+        return _encoding.decode(tokens)
+
+    # 估算模式下按比例截断字符
+    ratio = max_tokens / count_tokens(text)
+    length = max(int(len(text) * ratio), 1)
+    return text[:length] if keep == "head" else text[-length:]
+
+
+class ConversationMemory:
+    """
+    多轮对话记忆
+
+    保留最近几轮原文和更早对话的滚动摘要。超出recent_turns的旧对话每fold_batch轮
+    合并进摘要一次(增量更新，不重新处理全部历史)，构建提示词时在max_tokens预算内
+    依次放入当前输入、摘要和最近的对话，提示词长度不随对话轮数线性增长。
+    调用模型的摘要在后台线程中进行，不占用用户这一轮的响应时间；合并完成前，
+    待合并的对话以抽取式摘要的形式参与构建查询。
+    """
+
+    # 每轮记忆中机器人回复只保留开头部分(通常是初步诊断)，完整回复已持久化到数据库
+    RESPONSE_TOKENS = 80
+    # 检索查询中附带的摘要长度，检索只需要当前症状和少量上下文
+    RETRIEVAL_SUMMARY_TOKENS = 100
+
+    def __init__(self, summarizer=None, max_tokens=1200, recent_turns=3, summary_tokens=300, fold_batch=2):
+        """
+        summarizer: 可选的摘要函数summarizer(旧摘要, [(用户消息, 回复)], 语言) -> 新摘要，
+                    为None或调用失败时使用抽取式摘要
+        """
+        self.summarizer = summarizer
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.summary_tokens = summary_tokens
+        self.fold_batch = fold_batch
+
+        self.summary = ""
+        self.recent = []
+        self.language = "en"
+        self.turn_count = 0
+
+        # 已移出最近窗口、等待后台合并进摘要的对话
+        self._pending = []
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def _compact(self, user_message, bot_response):
+        return (
+            " ".join(str(user_message).split()),
+            truncate_tokens(" ".join(str(bot_response).split()), self.RESPONSE_TOKENS),
+        )
+
+    def _extractive_summary(self, summary, turns):
+        """不调用模型的摘要：追加用户描述，超出预算时丢弃最早的内容"""
+        parts = [summary] if summary else []
+        parts.extend(user_message for user_message, _ in turns)
+        return truncate_tokens("; ".join(parts), self.summary_tokens, keep="tail")
+
+    def _summarize(self, summary, turns, language):
+        """把对话合并进摘要，返回新摘要；模型摘要不可用时使用抽取式摘要"""
+        if self.summarizer:
+            try:
+                new_summary = self.summarizer(summary, turns, language)
+                if new_summary:
+                    return truncate_tokens(new_summary.strip(), self.summary_tokens)
+            except Exception as e:
+                print(f"更新对话摘要时出错: {e}")
+        return self._extractive_summary(summary, turns)
+
+    def _fold_pending(self):
+        """后台线程：依次合并待处理的对话，直到没有新的待合并对话"""
+        while True:
+            with self._lock:
+                turns = list(self._pending)
+                if not turns:
+                    self._worker = None
+                    return
+                summary, language = self.summary, self.language
+            new_summary = self._summarize(summary, turns, language)
+            with self._lock:
+                self.summary = new_summary
+                del self._pending[:len(turns)]
+
+    def _fold(self, turns):
+        """把移出最近窗口的对话交给后台线程合并进摘要"""
+        with self._lock:
+            self._pending.extend(turns)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._fold_pending, name="clinixbot-summary", daemon=True)
+                self._worker.start()
+
+    def wait(self, timeout=None):
+        """等待后台摘要完成"""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def current_summary(self):
+        """当前可用的摘要，后台合并未完成时附加待合并对话的抽取式摘要"""
+        with self._lock:
+            if self._pending:
+                return self._extractive_summary(self.summary, self._pending)
+            return self.summary
+
+    def add_turn(self, user_message, bot_response, language=None, summarize=True):
+        """
+        记录一轮对话
+
+        summarize: 为False时旧对话只做抽取式合并，用于从数据库恢复历史等不希望调用模型的场景
+        """
+        if language:
+            self.language = language
+        self.recent.append(self._compact(user_message, bot_response))
+        self.turn_count += 1
+
+        # 攒够fold_batch轮再合并，减少摘要调用次数
+        if len(self.recent) >= self.recent_turns + self.fold_batch:
+            folded = self.recent[:-self.recent_turns]
+            self.recent = self.recent[-self.recent_turns:]
+            if summarize:
+                self._fold(folded)
+            else:
+                with self._lock:
+                    self._pending.extend(folded)
+                    self.summary = self._extractive_summary(self.summary, self._pending)
+                    del self._pending[:]
+
+    def build_retrieval_query(self, user_input):
+        """
+        检索用的查询：当前输入加简短摘要，不包含对话原文和段落标题
+
+        对话原文会把检索拉向之前讨论过的疾病，向量检索只需要当前症状和少量上下文
+        """
+        summary = self.current_summary()
+        if not summary:
+            return user_input
+        return f"{user_input}\n{truncate_tokens(summary, self.RETRIEVAL_SUMMARY_TOKENS, keep='tail')}"
+
+    def build_query(self, user_input):
+        """
+        构建提示词中带上下文的问题：当前输入 + 摘要 + 最近对话(从新到旧直到用完token预算)
+
+        没有历史时直接返回原始输入
+        """
+        current_summary = self.current_summary()
+        if not current_summary and not self.recent:
+            return user_input
+
+        budget = self.max_tokens - count_tokens(user_input)
+        sections = []
+
+        if current_summary and budget > 0:
+            summary = truncate_tokens(current_summary, min(self.summary_tokens, budget), keep="tail")
+            sections.append(f"Earlier conversation summary: {summary}")
+            budget -= count_tokens(sections[-1])
+
+        recent_lines = []
+        for user_message, bot_response in reversed(self.recent):
+            line = f"Patient: {user_message}\nAssistant: {bot_response}"
+            cost = count_tokens(line)
+            if cost > budget:
+                break
+            recent_lines.insert(0, line)
+            budget -= cost
+        if recent_lines:
+            sections.append("Recent conversation:\n" + "\n".join(recent_lines))
+
+        sections.append(f"Current message: {user_input}")
+        return "\n\n".join(sections)
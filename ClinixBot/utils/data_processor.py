@@ -2,12 +2,14 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 import re
+from utils.telemetry import telemetry
 
 class DataProcessor:
     def __init__(self):
         """初始化数据处理器"""
         pass
     
+    @telemetry.traced("data.preprocess")
     def preprocess_data(self, data):
         """预处理医疗数据"""
         # 创建数据副本，避免修改原始数据
@@ -1,102 +1,360 @@
+import hashlib
+import secrets
 import sqlite3
 import pandas as pd
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
 class DatabaseManager:
-    def __init__(self, db_path="./data/clinixbot.db"):
+    # 连接级PRAGMA：WAL模式下写入不阻塞读取，NORMAL同步在WAL下仍可保证一致性
+    PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,       # 负数表示KB，约16MB页缓存
+        "mmap_size": 268435456,     # 256MB内存映射读取
+        "temp_store": "MEMORY",
+    }
+
+    def __init__(self, db_path="./data/clinixbot.db", busy_timeout=5.0, max_retries=3, statement_cache_size=128,
+                 pool_size=8):
         self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.max_retries = max_retries
+        self.statement_cache_size = statement_cache_size
+        self.pool_size = pool_size
+
+        # 有上限的连接池：Streamlit每次重跑都在新线程中执行，按线程持有连接会随重跑不断泄漏。
+        # 连接只在一次读/写期间借出，用完归还；同一线程嵌套使用时复用已借出的连接
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._local = threading.local()
+
         self._init_db()
-    
+
+    def _connect(self):
+        """创建并配置一个新连接"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            cached_statements=self.statement_cache_size,  # 复用已编译的预处理语句
+            check_same_thread=False,
+            isolation_level=None  # 自动提交模式，写事务由_transaction显式开启
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        for name, value in self.PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """从连接池借出一个连接，池中没有空闲连接且已达上限时等待归还"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._connections_lock:
+                create = self._created < self.pool_size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._connections_lock:
+                        self._created -= 1
+                    raise
+                with self._connections_lock:
+                    self._connections.append(conn)
+            else:
+                conn = self._pool.get()
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._pool.put(conn)
+
+    @contextmanager
+    def _cursor(self, row_factory=None):
+        """获取只读游标"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            if row_factory:
+                cursor.row_factory = row_factory
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        写事务：BEGIN IMMEDIATE提前获取写锁，锁竞争时由busy_timeout等待，
+        仍然失败时按指数退避重试
+        """
+        with self._connection() as conn:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    break
+                except sqlite3.OperationalError as e:
+                    if "locked" not in str(e) or attempt == self.max_retries:
+                        raise
+                    time.sleep(0.05 * (2 ** attempt))
+
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def close(self):
+        """关闭连接池中创建的所有连接"""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+            self._created = 0
+        self._pool = queue.LifoQueue()
+        self._local = threading.local()
+
     def _init_db(self):
         """初始化数据库"""
         # 检查数据库文件夹是否存在
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        
-        # 连接数据库
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 创建用户表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            name TEXT,
-            email TEXT,
-            dob TEXT,
-            gender TEXT,
-            created_at TEXT
-        )
-        ''')
-        
-        # 创建对话历史表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_history (
-            chat_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            timestamp TEXT,
-            user_message TEXT,
-            bot_response TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-        ''')
-        
-        # 创建诊断记录表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS diagnoses (
-            diagnosis_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            chat_id INTEGER,
-            symptoms TEXT,
-            diagnosis TEXT,
-            recommended_treatments TEXT,
-            timestamp TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (user_id),
-            FOREIGN KEY (chat_id) REFERENCES chat_history (chat_id)
-        )
-        ''')
-        
-        # 保存更改并关闭连接
-        conn.commit()
-        conn.close()
-    
+
+        with self._transaction() as cursor:
+            # 创建用户表
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                name TEXT,
+                email TEXT,
+                dob TEXT,
+                gender TEXT,
+                created_at TEXT
+            )
+            ''')
+
+            # 创建对话历史表
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_history (
+                chat_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                timestamp TEXT,
+                user_message TEXT,
+                bot_response TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+            ''')
+
+            # 创建诊断记录表
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS diagnoses (
+                diagnosis_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                chat_id INTEGER,
+                symptoms TEXT,
+                diagnosis TEXT,
+                recommended_treatments TEXT,
+                timestamp TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (user_id),
+                FOREIGN KEY (chat_id) REFERENCES chat_history (chat_id)
+            )
+            ''')
+
+            # 会话令牌表：只保存令牌的哈希，令牌本身只出现在用户的URL中
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                token_hash TEXT PRIMARY KEY,
+                user_id TEXT,
+                created_at TEXT,
+                expires_at TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+            ''')
+
+            # 按用户分页读取历史的组合索引，chat_id作为同一时间戳下的排序键
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_chat_history_user_time
+            ON chat_history (user_id, timestamp, chat_id)
+            ''')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_diagnoses_user_time
+            ON diagnoses (user_id, timestamp)
+            ''')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_diagnoses_chat
+            ON diagnoses (chat_id)
+            ''')
+
+    @staticmethod
+    def timestamp_now():
+        """当前时间戳，精确到微秒以保证同一用户的记录有序"""
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+
     def add_user(self, user_id, name, email, dob, gender):
         """添加新用户"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-            INSERT INTO users (user_id, name, email, dob, gender, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, name, email, dob, gender, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-            
-            conn.commit()
+            with self._transaction() as cursor:
+                cursor.execute('''
+                INSERT INTO users (user_id, name, email, dob, gender, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', (user_id, name, email, dob, gender, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
             return True
         except Exception as e:
             print(f"添加用户时出错: {e}")
             return False
-        finally:
-            conn.close()
-    
-    def get_chat_history(self, user_id, limit=10):
-        """获取用户聊天历史"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
+
+    @staticmethod
+    def _hash_token(token):
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def create_session(self, user_id, ttl_days=30):
+        """为用户生成服务端随机会话令牌并返回，令牌在ttl_days天后失效"""
+        token = secrets.token_urlsafe(32)
+        now = datetime.now()
         try:
-            cursor.execute('''
-            SELECT * FROM chat_history 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-            ''', (user_id, limit))
-            
-            history = cursor.fetchall()
-            return [dict(row) for row in history]
+            with self._transaction() as cursor:
+                cursor.execute('''
+                INSERT INTO sessions (token_hash, user_id, created_at, expires_at)
+                VALUES (?, ?, ?, ?)
+                ''', (self._hash_token(token), user_id, now.strftime('%Y-%m-%d %H:%M:%S'),
+                      (now + timedelta(days=ttl_days)).strftime('%Y-%m-%d %H:%M:%S')))
+            return token
+        except Exception as e:
+            print(f"创建会话时出错: {e}")
+            return None
+
+    def resolve_session(self, token):
+        """返回有效令牌对应的user_id，令牌不存在或已过期时返回None"""
+        if not token:
+            return None
+        try:
+            with self._cursor() as cursor:
+                row = cursor.execute(
+                    'SELECT user_id FROM sessions WHERE token_hash = ? AND expires_at > ?',
+                    (self._hash_token(token), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                ).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            print(f"读取会话时出错: {e}")
+            return None
+
+    def save_chat_turn(self, user_id, user_message, bot_response, timestamp=None):
+        """保存一轮对话，返回chat_id"""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute('''
+                INSERT INTO chat_history (user_id, timestamp, user_message, bot_response)
+                VALUES (?, ?, ?, ?)
+                ''', (user_id, timestamp or self.timestamp_now(), user_message, bot_response))
+                return cursor.lastrowid
+        except Exception as e:
+            print(f"保存聊天记录时出错: {e}")
+            return None
+
+    def save_diagnosis(self, user_id, symptoms, diagnosis, recommended_treatments=None, chat_id=None, timestamp=None):
+        """保存诊断记录，返回diagnosis_id"""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute('''
+                INSERT INTO diagnoses (user_id, chat_id, symptoms, diagnosis, recommended_treatments, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', (user_id, chat_id, symptoms, diagnosis, recommended_treatments, timestamp or self.timestamp_now()))
+                return cursor.lastrowid
+        except Exception as e:
+            print(f"保存诊断记录时出错: {e}")
+            return None
+
+    def write_log_batch(self, chat_rows, diagnosis_rows):
+        """
+        在一个事务内批量写入对话和诊断记录
+
+        chat_rows: (user_id, timestamp, user_message, bot_response)
+        diagnosis_rows: (user_id, user_id, chat_timestamp, symptoms, diagnosis, recommended_treatments, timestamp)，
+        chat_id通过(user_id, timestamp)索引查找对应的对话轮次
+        """
+        with self._transaction() as cursor:
+            if chat_rows:
+                cursor.executemany('''
+                INSERT INTO chat_history (user_id, timestamp, user_message, bot_response)
+                VALUES (?, ?, ?, ?)
+                ''', chat_rows)
+            if diagnosis_rows:
+                cursor.executemany('''
+                INSERT INTO diagnoses (user_id, chat_id, symptoms, diagnosis, recommended_treatments, timestamp)
+                VALUES (?, (SELECT chat_id FROM chat_history WHERE user_id = ? AND timestamp = ?), ?, ?, ?, ?)
+                ''', diagnosis_rows)
+
+    def get_chat_history(self, user_id, limit=10, before=None):
+        """
+        获取用户聊天历史，按时间倒序
+
+        before: 上一页最后一条记录的(timestamp, chat_id)，用于键集分页；
+        为None时返回最新一页。通过索引定位起点，翻页成本与页码无关。
+        """
+        try:
+            with self._cursor(row_factory=sqlite3.Row) as cursor:
+                if before is None:
+                    cursor.execute('''
+                    SELECT * FROM chat_history
+                    WHERE user_id = ?
+                    ORDER BY timestamp DESC, chat_id DESC
+                    LIMIT ?
+                    ''', (user_id, limit))
+                else:
+                    cursor.execute('''
+                    SELECT * FROM chat_history
+                    WHERE user_id = ? AND (timestamp, chat_id) < (?, ?)
+                    ORDER BY timestamp DESC, chat_id DESC
+                    LIMIT ?
+                    ''', (user_id, before[0], before[1], limit))
+
+                history = cursor.fetchall()
+                return [dict(row) for row in history]
         except Exception as e:
             print(f"获取聊天历史时出错: {e}")
             return []
-        finally:
-            conn.close()
\ No newline at end of file
+
+    def get_diagnoses(self, user_id, limit=10, before=None):
+        """获取用户诊断记录，按时间倒序，before为上一页最后一条的(timestamp, diagnosis_id)"""
+        try:
+            with self._cursor(row_factory=sqlite3.Row) as cursor:
+                if before is None:
+                    cursor.execute('''
+                    SELECT * FROM diagnoses
+                    WHERE user_id = ?
+                    ORDER BY timestamp DESC, diagnosis_id DESC
+                    LIMIT ?
+                    ''', (user_id, limit))
+                else:
+                    cursor.execute('''
+                    SELECT * FROM diagnoses
+                    WHERE user_id = ? AND (timestamp, diagnosis_id) < (?, ?)
+                    ORDER BY timestamp DESC, diagnosis_id DESC
+                    LIMIT ?
+                    ''', (user_id, before[0], before[1], limit))
+
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"获取诊断记录时出错: {e}")
+            return []
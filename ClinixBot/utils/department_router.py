@@ -0,0 +1,180 @@
+from collections import deque
+
+import pandas as pd
+
+
+class AhoCorasick:
+    """多模式字符串匹配自动机，一次线性扫描找出文本中出现的所有模式"""
+
+    def __init__(self, patterns):
+        """patterns: (模式字符串, 附加数据)序列，模式按小写匹配"""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for pattern, payload in patterns:
+            self._add(pattern.lower(), payload)
+        self._build_failure_links()
+
+    def _add(self, pattern, payload):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), payload))
+
+    def _build_failure_links(self):
+        """按广度优先构建失配指针，并合并后缀状态的输出"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text):
+        """逐个返回(起始位置, 结束位置, 附加数据)"""
+        state = 0
+        for i, char in enumerate(text.lower()):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, payload in self._output[state]:
+                yield i - length + 1, i + 1, payload
+
+
+class DepartmentRouter:
+    """
+    症状/疾病到就诊科室的路由索引
+
+    中英文症状词和疾病名(包括就诊记录中出现的全部疾病)编译成一个Aho-Corasick自动机，
+    对诊断文本做一次线性扫描即可得到按得分排序的推荐科室。
+    """
+
+    # 人工整理的科室-关键词映射，科室名与医院查找页面的科室选项一致
+    CURATED_TERMS = {
+        "急诊科": [
+            "emergency", "severe bleeding", "unconscious", "difficulty breathing", "shortness of breath", "poisoning",
+            "急诊", "大出血", "昏迷", "呼吸困难", "中毒",
+        ],
+        "内科": [
+            "common cold", "cold", "influenza", "flu", "fever", "cough", "pneumonia", "bronchitis", "asthma",
+            "chronic obstructive pulmonary disease", "copd", "sinusitis", "covid-19", "covid", "gastroenteritis",
+            "diarrhea", "vomiting", "diabetes", "chronic kidney disease", "urinary tract infection", "allergies",
+            "allergy", "cancer",
+            "感冒", "流感", "发烧", "发热", "咳嗽", "肺炎", "支气管炎", "哮喘", "慢阻肺", "慢性阻塞性肺疾病", "鼻窦炎",
+            "新冠", "胃肠炎", "腹泻", "呕吐", "糖尿病", "肾病", "尿路感染", "过敏", "癌症", "肿瘤",
+        ],
+        "外科": [
+            "burns", "burn", "wound", "laceration", "appendicitis", "hernia",
+            "烧伤", "烫伤", "伤口", "割伤", "阑尾炎", "疝气",
+        ],
+        "儿科": [
+            "child", "children", "infant", "baby", "pediatric",
+            "儿童", "小儿", "婴儿", "宝宝",
+        ],
+        "妇产科": [
+            "pregnancy", "pregnant", "menstrual", "gynecologic",
+            "怀孕", "妊娠", "月经", "妇科",
+        ],
+        "神经科": [
+            "migraine", "headache", "epilepsy", "seizure", "stroke", "parkinson's disease", "parkinson",
+            "alzheimer's disease", "alzheimer", "multiple sclerosis", "dementia", "dizziness", "numbness",
+            "anxiety", "depression",
+            "偏头痛", "头痛", "癫痫", "中风", "脑卒中", "帕金森", "阿尔茨海默", "多发性硬化", "痴呆", "头晕", "麻木",
+            "焦虑", "抑郁",
+        ],
+        "心脏科": [
+            "heart disease", "heart attack", "myocardial infarction", "coronary", "arrhythmia", "hypertension",
+            "high blood pressure", "chest pain", "palpitations",
+            "心脏病", "冠心病", "心肌梗死", "心律失常", "高血压", "胸痛", "心悸",
+        ],
+        "骨科": [
+            "fracture", "sprain", "arthritis", "osteoporosis", "back pain", "joint pain",
+            "骨折", "扭伤", "关节炎", "骨质疏松", "腰痛", "关节痛",
+        ],
+        "眼科": [
+            "eye", "eyes", "conjunctivitis", "vision", "glaucoma", "cataract",
+            "眼睛", "眼部", "结膜炎", "视力", "青光眼", "白内障",
+        ],
+        "皮肤科": [
+            "skin infection", "rash", "eczema", "dermatitis", "acne", "itching",
+            "皮疹", "湿疹", "皮炎", "痤疮", "皮肤感染", "瘙痒",
+        ],
+    }
+
+    # 就诊记录中的疾病名比一般症状词更具体，权重更高
+    SYMPTOM_WEIGHT = 1.0
+    CONDITION_WEIGHT = 2.0
+
+    def __init__(self, conditions=None):
+        """
+        conditions: 就诊记录中出现的疾病名列表，按人工映射确定科室后作为高权重模式加入
+        """
+        curated = AhoCorasick(
+            (term, (department, self.SYMPTOM_WEIGHT))
+            for department, terms in self.CURATED_TERMS.items()
+            for term in terms
+        )
+
+        patterns = {}
+        for department, terms in self.CURATED_TERMS.items():
+            for term in terms:
+                patterns[term.lower()] = (department, self.SYMPTOM_WEIGHT)
+
+        # 记录中的疾病名用人工映射扫描一遍，取得分最高的科室
+        for condition in conditions or []:
+            condition = str(condition).strip().lower()
+            ranked = self._rank(curated, condition)
+            if condition and ranked:
+                patterns[condition] = (ranked[0][0], self.CONDITION_WEIGHT)
+
+        self.departments = list(self.CURATED_TERMS)
+        self._matcher = AhoCorasick(patterns.items())
+
+    @classmethod
+    def from_records(cls, csv_path):
+        """从就诊记录CSV的Medical Condition列构建"""
+        conditions = pd.read_csv(csv_path, usecols=["Medical Condition"])["Medical Condition"].dropna().unique()
+        return cls(conditions.tolist())
+
+    @staticmethod
+    def _is_boundary(text, start, end):
+        """英文模式要求整词匹配，避免"cold"命中"scold"；中文不做要求"""
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not (before.isascii() and before.isalnum()) and not (after.isascii() and after.isalnum())
+
+    @classmethod
+    def _rank(cls, matcher, text):
+        scores = {}
+        length = max(len(text), 1)
+        # 同一段文本只保留最长的重叠匹配，如"chronic kidney disease"不再重复计"kidney"
+        matches = sorted(matcher.iter_matches(text), key=lambda m: (m[0], -(m[1] - m[0])))
+        covered_until = -1
+        for start, end, (department, weight) in matches:
+            if end <= covered_until:
+                continue
+            if text[start].isascii() and not cls._is_boundary(text, start, end):
+                continue
+            covered_until = end
+            # 越靠前的匹配(通常是初步诊断部分)权重越高
+            scores[department] = scores.get(department, 0.0) + weight * (1.5 - start / length)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def route(self, text):
+        """对诊断文本做一次扫描，返回按得分降序排列的[(科室, 得分)]"""
+        if not text:
+            return []
+        return self._rank(self._matcher, text.lower())
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """计算一个点到一组点的球面距离(公里)，lats/lngs为NumPy数组"""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlng = np.radians(lngs) - np.radians(lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class FacilityIndex:
+    """
+    医疗机构空间索引
+
+    按经纬度网格(默认0.1度，约11公里)分桶，半径查询只取覆盖查询范围的网格中的候选点，
+    再用向量化的haversine计算精确距离，查询成本与候选数量而非机构总数相关。
+    """
+
+    def __init__(self, facilities, cell_size=0.1):
+        """
+        facilities: 至少包含lat、lng列的DataFrame
+        cell_size: 网格边长(度)
+        """
+        self.facilities = facilities.reset_index(drop=True)
+        self.cell_size = cell_size
+        self.lats = self.facilities["lat"].to_numpy(dtype=np.float64)
+        self.lngs = self.facilities["lng"].to_numpy(dtype=np.float64)
+        self._mask_cache = {}
+        self._positions = None
+        self._build_grid()
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        """从CSV文件加载机构数据"""
+        return cls(pd.read_csv(path), **kwargs)
+
+    def __len__(self):
+        return len(self.facilities)
+
+    def _cell_ids(self, lats, lngs):
+        rows = np.floor(lats / self.cell_size).astype(np.int64)
+        cols = np.floor(lngs / self.cell_size).astype(np.int64)
+        return rows, cols
+
+    def _build_grid(self):
+        """将每个机构的下标按所在网格分组"""
+        rows, cols = self._cell_ids(self.lats, self.lngs)
+        order = np.lexsort((cols, rows))
+        keys = np.stack([rows[order], cols[order]], axis=1)
+
+        self._grid = {}
+        if len(order) == 0:
+            return
+
+        # 排序后相同网格的下标连续，按边界切分
+        boundaries = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+        for chunk in np.split(np.arange(len(order)), boundaries):
+            row, col = keys[chunk[0]]
+            self._grid[(int(row), int(col))] = order[chunk]
+
+    def _candidates(self, lat, lng, radius_km):
+        """返回覆盖查询圆外接矩形的网格中的所有机构下标"""
+        lat_span = radius_km / KM_PER_DEGREE
+        # 高纬度地区同样距离对应更大的经度跨度
+        lng_span = radius_km / (KM_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+
+        row_min, col_min = self._cell_ids(np.array(lat - lat_span), np.array(lng - lng_span))
+        row_max, col_max = self._cell_ids(np.array(lat + lat_span), np.array(lng + lng_span))
+
+        parts = []
+        for row in range(int(row_min), int(row_max) + 1):
+            for col in range(int(col_min), int(col_max) + 1):
+                cell = self._grid.get((row, col))
+                if cell is not None:
+                    parts.append(cell)
+
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(parts)
+
+    def query(self, lat, lng, radius_km, k=None, mask=None):
+        """
+        半径查询，按距离升序返回(下标数组, 距离数组)
+
+        k: 只返回距离最近的k个
+        mask: 与facilities等长的布尔数组，只保留mask为True的机构
+        """
+        candidates = self._candidates(lat, lng, radius_km)
+        if mask is not None and len(candidates):
+            candidates = candidates[mask[candidates]]
+
+        distances = haversine_km(lat, lng, self.lats[candidates], self.lngs[candidates])
+        within = distances <= radius_km
+        candidates, distances = candidates[within], distances[within]
+
+        # 只需要前k个时先用argpartition缩小排序范围
+        if k is not None and len(candidates) > k:
+            nearest = np.argpartition(distances, k - 1)[:k]
+            candidates, distances = candidates[nearest], distances[nearest]
+
+        order = np.argsort(distances, kind="stable")
+        return candidates[order], distances[order]
+
+    def contains_mask(self, column, text):
+        """返回column列包含text(不区分大小写)的布尔数组，结果按(列, 文本)缓存"""
+        key = (column, text.lower())
+        if key not in self._mask_cache:
+            values = self.facilities[column].fillna("").astype(str).str.lower()
+            self._mask_cache[key] = values.str.contains(key[1], regex=False).to_numpy()
+        return self._mask_cache[key]
+
+    def mask_for_ids(self, ids, id_column="id"):
+        """返回id在ids中的机构的布尔数组，用于与其他索引的结果求交集"""
+        if self._positions is None:
+            self._positions = {value: i for i, value in enumerate(self.facilities[id_column])}
+        mask = np.zeros(len(self.facilities), dtype=bool)
+        positions = [self._positions[i] for i in ids if i in self._positions]
+        mask[positions] = True
+        return mask
+
+    def query_records(self, lat, lng, radius_km, k=None, mask=None):
+        """半径查询，返回带distance字段(公里，保留一位小数)的字典列表"""
+        positions, distances = self.query(lat, lng, radius_km, k=k, mask=mask)
+        records = self.facilities.iloc[positions].to_dict("records")
+        for record, distance in zip(records, distances):
+            record["distance"] = round(float(distance), 1)
+        return records
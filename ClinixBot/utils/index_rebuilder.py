@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+# 发布前用于验证新索引的查询，覆盖中英文输入
+SMOKE_QUERIES = (
+    "fever, cough and sore throat",
+    "chest pain and shortness of breath",
+    "头痛，恶心，怕光",
+    "腹痛腹泻",
+)
+
+
+class IndexValidationError(Exception):
+    """新版本索引未通过发布前验证"""
+
+
+class IndexRebuilder:
+    """
+    后台重建MedicalRAGModel的向量索引
+
+    后台线程每poll_interval秒检查一次数据CSV是否变化(大小、修改时间或向量化模型)，
+    设置了rebuild_interval时还会按该间隔定期重建。新版本先写到版本目录但不激活，
+    用冒烟查询验证后再原子地切换CURRENT并替换模型中的检索索引引用；
+    正在进行的请求在旧版本上完成，验证失败的版本被删除，线上继续使用旧版本。
+    多个进程各自运行重建器时，通过构建锁保证只有一个进程实际重建，其余进程从CURRENT获取新版本。
+    """
+
+    def __init__(self, model, poll_interval=30.0, rebuild_interval=None, smoke_queries=SMOKE_QUERIES,
+                 min_count_ratio=0.5, k=5):
+        """
+        model: 使用VectorIndexStore的MedicalRAGModel
+        min_count_ratio: 新版本文档数低于当前版本的该比例时拒绝发布(防止CSV写到一半时被读取)
+        """
+        self.model = model
+        self.poll_interval = poll_interval
+        self.rebuild_interval = rebuild_interval
+        self.smoke_queries = smoke_queries
+        self.min_count_ratio = min_count_ratio
+        self.k = k
+        self.last_rebuild = time.monotonic()
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, model):
+        """
+        CLINIXBOT_INDEX_POLL_SECONDS     检查数据变化的间隔，默认30秒
+        CLINIXBOT_INDEX_REBUILD_SECONDS  定期重建的间隔，未设置时只在数据变化时重建
+        """
+        rebuild_interval = os.getenv("CLINIXBOT_INDEX_REBUILD_SECONDS")
+        return cls(
+            model,
+            poll_interval=float(os.getenv("CLINIXBOT_INDEX_POLL_SECONDS", "30")),
+            rebuild_interval=float(rebuild_interval) if rebuild_interval else None,
+        )
+
+    def _due(self, source):
+        if self.model.index_is_stale(source):
+            return True
+        return self.rebuild_interval is not None and time.monotonic() - self.last_rebuild >= self.rebuild_interval
+
+    def validate(self, index, current=None):
+        """用冒烟查询检查新版本，不通过时抛出IndexValidationError"""
+        if not len(index):
+            raise IndexValidationError("索引为空")
+        if current is not None and len(index) < len(current) * self.min_count_ratio:
+            raise IndexValidationError(f"文档数从{len(current)}降到{len(index)}")
+
+        for query in self.smoke_queries:
+            embedding = np.asarray(self.model.embeddings.embed_query(query), dtype=np.float32)
+            if embedding.shape[0] != index.vectors.shape[1]:
+                raise IndexValidationError(f"查询向量维度{embedding.shape[0]}与索引维度{index.vectors.shape[1]}不一致")
+            results = index.search(embedding, self.k)
+            if len(results) < min(self.k, len(index)) or not all(np.isfinite(d) for _, d in results):
+                raise IndexValidationError(f"查询“{query}”没有返回有效结果")
+            # 确认命中的文档可以正常解码
+            for i, _ in results:
+                index.document(i)
+
+    def rebuild_once(self, force=False):
+        """
+        需要时重建并发布新版本，返回新版本号；无需重建或验证失败时返回None
+        """
+        store = self.model.index_store
+        try:
+            source = self.model.index_source()
+            if not force and not self._due(source):
+                return None
+
+            seen_version = store.current_version()
+            with store.build_lock():
+                # 等锁期间其他进程可能已经发布了新版本
+                if not force and (store.current_version() != seen_version or not self._due(source)):
+                    self.last_rebuild = time.monotonic()
+                    return None
+
+                current = store.current()
+                version = self.model.publish_vector_store(source, activate=False)
+                index = store.open_version(version)
+                try:
+                    self.validate(index, current)
+                except IndexValidationError:
+                    store.discard(version)
+                    raise
+                self.model.activate_index(version, index)
+                self.last_rebuild = time.monotonic()
+                self.last_error = None
+                return version
+        except Exception as e:
+            self.last_error = e
+            self.last_rebuild = time.monotonic()  # 定期重建失败后也等到下一个周期
+            print(f"重建向量索引时出错: {e}")
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.rebuild_once()
+
+    def start(self):
+        """启动后台重建线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="clinixbot-index-rebuilder", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止后台重建线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 2)
+            self._thread = None
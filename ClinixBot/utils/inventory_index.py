@@ -0,0 +1,106 @@
+import re
+import threading
+
+import pandas as pd
+
+
+class InventoryIndex:
+    """
+    药房库存倒排索引
+
+    以规范化的药物通用名为键，映射到{药房ID: (库存数量, 价格, 更新时间)}。
+    品牌名、中文名等别名通过同义词表映射到通用名；库存更新按药物写时复制，
+    读取方拿到的始终是完整的一份字典，不需要加锁。
+    """
+
+    # 剂量、剂型等对匹配无意义的修饰
+    _DOSAGE_PATTERN = re.compile(r"\d+(\.\d+)?\s*(mg|g|ml|mcg|μg|iu|毫克|克|毫升|片|粒|%)", re.IGNORECASE)
+    _PUNCT_PATTERN = re.compile(r"[^\w\s]+")
+    _SPLIT_PATTERN = re.compile(r"[()（）/、,，;；]+")
+
+    def __init__(self, inventory=None, synonyms=None):
+        """
+        inventory: 包含pharmacy_id、medication、quantity、price、updated_at列的DataFrame
+        synonyms: 包含alias、canonical列的DataFrame
+        """
+        self._synonyms = {}
+        self._index = {}
+        self._versions = {}  # (药房ID, 通用名) -> 最近一次更新时间，缺货后仍保留以忽略过期更新
+        self._write_lock = threading.Lock()
+
+        if synonyms is not None:
+            for alias, canonical in synonyms[["alias", "canonical"]].itertuples(index=False, name=None):
+                self._synonyms[self._clean(alias)] = self._clean(canonical)
+
+        if inventory is not None:
+            self.apply_updates(inventory)
+
+    @classmethod
+    def from_csv(cls, inventory_path, synonyms_path=None):
+        """从库存CSV和同义词CSV加载"""
+        synonyms = pd.read_csv(synonyms_path) if synonyms_path else None
+        return cls(pd.read_csv(inventory_path), synonyms)
+
+    @classmethod
+    def _clean(cls, name):
+        """小写并去除剂量、标点和多余空格"""
+        name = cls._DOSAGE_PATTERN.sub(" ", str(name).lower())
+        name = cls._PUNCT_PATTERN.sub(" ", name)
+        return " ".join(name.split())
+
+    def normalize(self, name):
+        """
+        将药物名称解析为索引中的通用名
+
+        依次尝试完整名称、括号和斜杠等分隔出的各部分(如"布洛芬（Ibuprofen）")
+        以及其中的单词(如"Tylenol Extra Strength")，返回第一个能识别的通用名；
+        都无法识别时返回清洗后的完整名称。
+        """
+        if not name:
+            return ""
+
+        pieces = [self._clean(name)] + [self._clean(p) for p in self._SPLIT_PATTERN.split(str(name)) if p.strip()]
+        pieces += [word for piece in pieces for word in piece.split()]
+        for piece in pieces:
+            canonical = self._synonyms.get(piece, piece)
+            if canonical in self._index:
+                return canonical
+        return self._synonyms.get(self._clean(name), self._clean(name))
+
+    def apply_updates(self, updates):
+        """
+        增量应用库存更新，无需全量重建
+
+        updates: DataFrame或(pharmacy_id, medication, quantity, price, updated_at)元组序列；
+        较旧的更新会被忽略，数量为0表示缺货并从索引中移除
+        """
+        if isinstance(updates, pd.DataFrame):
+            updates = updates[["pharmacy_id", "medication", "quantity", "price", "updated_at"]].itertuples(index=False, name=None)
+
+        # 先按药物分组，每种药物只复制一次
+        grouped = {}
+        for pharmacy_id, medication, quantity, price, updated_at in updates:
+            canonical = self._synonyms.get(self._clean(medication), self._clean(medication))
+            grouped.setdefault(canonical, []).append((pharmacy_id, int(quantity), float(price), str(updated_at)))
+
+        with self._write_lock:
+            for canonical, rows in grouped.items():
+                stock = dict(self._index.get(canonical, {}))
+                for pharmacy_id, quantity, price, updated_at in rows:
+                    version = self._versions.get((pharmacy_id, canonical))
+                    if version and version > updated_at:
+                        continue
+                    self._versions[(pharmacy_id, canonical)] = updated_at
+                    if quantity > 0:
+                        stock[pharmacy_id] = (quantity, price, updated_at)
+                    else:
+                        stock.pop(pharmacy_id, None)
+                self._index[canonical] = stock
+
+    def stock_for(self, medication):
+        """返回有该药物库存的{药房ID: (数量, 价格, 更新时间)}"""
+        return self._index.get(self.normalize(medication), {})
+
+    def medications(self):
+        """索引中的所有通用名"""
+        return sorted(self._index)
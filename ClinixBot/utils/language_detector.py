@@ -0,0 +1,153 @@
+import re
+
+# 文字类别编码，每个字符通过查表映射为一个类别字符
+_OTHER, _HAN, _KANA, _HANGUL, _LATIN, _CYRILLIC, _ARABIC = "0HKGLCA"
+
+# (起始码位, 结束码位, 类别)
+_SCRIPT_RANGES = [
+    (0x0041, 0x005A, _LATIN), (0x0061, 0x007A, _LATIN),
+    (0x00C0, 0x00FF, _LATIN), (0x0100, 0x024F, _LATIN),
+    (0x0400, 0x04FF, _CYRILLIC),
+    (0x0600, 0x06FF, _ARABIC),
+    (0x1100, 0x11FF, _HANGUL), (0x3130, 0x318F, _HANGUL), (0xAC00, 0xD7AF, _HANGUL),
+    (0x3040, 0x30FF, _KANA), (0x31F0, 0x31FF, _KANA),
+    (0x3400, 0x4DBF, _HAN), (0x4E00, 0x9FFF, _HAN), (0xF900, 0xFAFF, _HAN),
+]
+_SCRIPT_TABLE_SIZE = 0x10000
+
+
+def _build_script_table():
+    """预先生成基本多文种平面的码位-类别表，配合str.translate在C层完成逐字符分类"""
+    table = [_OTHER] * _SCRIPT_TABLE_SIZE
+    for start, end, script in _SCRIPT_RANGES:
+        table[start:end + 1] = [script] * (end - start + 1)
+    # 超出表长的码位(如表情符号)查表时抛出IndexError，str.translate会保留原字符，不计入任何类别
+    return "".join(table)
+
+
+_SCRIPT_TABLE = _build_script_table()
+_WORD_PATTERN = re.compile(r"[a-zà-ÿ]+")
+
+# 拉丁字母语言的常见词和字符三元组特征
+_LATIN_PROFILES = {
+    "en": {
+        "words": {"the", "and", "i", "my", "have", "is", "of", "to", "a", "in", "it", "with", "for", "pain",
+                  "feel", "been", "since", "days", "fever", "what", "should", "take", "do", "am", "head"},
+        "trigrams": {" th", "the", "he ", "ing", "ng ", " an", "and", "nd ", " ha", "ave", "ion", "ent",
+                     " my", "my ", " fe", "ver", "er "},
+    },
+    "es": {
+        "words": {"el", "la", "de", "que", "y", "en", "los", "las", "un", "una", "por", "con", "me", "mi",
+                  "dolor", "tengo", "es", "para", "desde", "fiebre", "cabeza", "días"},
+        "trigrams": {" de", "de ", "que", "ue ", " la", "la ", "ión", "ón ", " el", "os ", "as ", "ngo",
+                     " te", "ent", "dol", "lor"},
+    },
+    "fr": {
+        "words": {"le", "la", "les", "de", "des", "et", "je", "j", "ai", "est", "un", "une", "mal", "depuis",
+                  "pour", "avec", "mon", "ma", "fièvre", "tête", "jours", "que", "pas"},
+        "trigrams": {" le", "le ", "es ", " de", "de ", "ent", " je", "je ", "ai ", " la", "ion", "eur",
+                     "our", "ère", "ête", " ma"},
+    },
+    "de": {
+        "words": {"der", "die", "das", "und", "ich", "habe", "ist", "nicht", "ein", "eine", "mit", "seit",
+                  "schmerzen", "kopf", "fieber", "tagen", "mein", "meine", "zu", "auf"},
+        "trigrams": {"ich", "ch ", "sch", "der", "die", "ie ", "en ", "und", "nd ", "ein", "ber", " ha",
+                     "abe", "ung", "ten"},
+    },
+}
+
+
+
+def _build_feature_index(kind):
+    """特征 -> 具有该特征的语言列表，打分时每个特征只查一次字典"""
+    index = {}
+    for language, profile in _LATIN_PROFILES.items():
+        for feature in profile[kind]:
+            index.setdefault(feature, []).append(language)
+    return index
+
+
+_WORD_INDEX = _build_feature_index("words")
+_TRIGRAM_INDEX = _build_feature_index("trigrams")
+
+# 一个汉字/假名/谚文字符承载的信息量约相当于几个拉丁字母，按此加权以公平比较混合文本
+_SCRIPT_WEIGHTS = {_HAN: 3.0, _KANA: 3.0, _HANGUL: 2.5, _LATIN: 1.0, _CYRILLIC: 1.0, _ARABIC: 1.0}
+
+
+class LanguageDetector:
+    """
+    轻量级语言识别
+
+    先用预编译的码位表把文本逐字符映射为文字类别并计数，按文字区分中文、日文、韩文、
+    俄文、阿拉伯文；拉丁字母文本再用常见词和字符三元组特征区分英语、西班牙语、法语、德语。
+    只做查表和集合查找，短文本的识别在微秒级完成。
+    """
+
+    def __init__(self, default="en"):
+        self.default = default
+
+    @staticmethod
+    def _script_counts(text):
+        """统计各文字类别的字符数"""
+        classes = text.translate(_SCRIPT_TABLE)
+        return {script: classes.count(script) for script in _SCRIPT_WEIGHTS}
+
+    @staticmethod
+    def _latin_scores(text):
+        """按常见词和三元组特征为拉丁字母语言打分"""
+        words = _WORD_PATTERN.findall(text.lower())
+        scores = dict.fromkeys(_LATIN_PROFILES, 0.0)
+        if not words:
+            return scores
+
+        for word in words:
+            for language in _WORD_INDEX.get(word, ()):
+                scores[language] += 2.0
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                for language in _TRIGRAM_INDEX.get(padded[i:i + 3], ()):
+                    scores[language] += 0.5
+        return scores
+
+    def distribution(self, text):
+        """
+        返回文本中各语言所占比例，按比例降序排列的[(语言, 比例)]
+
+        混合语言文本(如"我头痛，还有fever")会得到多个语言
+        """
+        if not text:
+            return []
+
+        counts = self._script_counts(text)
+        weighted = {
+            "zh": counts[_HAN] * _SCRIPT_WEIGHTS[_HAN],
+            "ja": counts[_KANA] * _SCRIPT_WEIGHTS[_KANA],
+            "ko": counts[_HANGUL] * _SCRIPT_WEIGHTS[_HANGUL],
+            "ru": counts[_CYRILLIC] * _SCRIPT_WEIGHTS[_CYRILLIC],
+            "ar": counts[_ARABIC] * _SCRIPT_WEIGHTS[_ARABIC],
+        }
+        # 日文夹杂汉字，出现假名时汉字计入日文
+        if counts[_KANA]:
+            weighted["ja"] += weighted.pop("zh")
+
+        if counts[_LATIN]:
+            latin_scores = self._latin_scores(text)
+            # 特征不足以明显区分时(如只有一个药名)归为英语
+            best = max(latin_scores, key=latin_scores.get)
+            if latin_scores[best] < latin_scores["en"] + 1.0:
+                best = "en"
+            weighted[best] = weighted.get(best, 0.0) + counts[_LATIN] * _SCRIPT_WEIGHTS[_LATIN]
+
+        total = sum(weighted.values())
+        if not total:
+            return []
+        return sorted(
+            ((language, weight / total) for language, weight in weighted.items() if weight),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+
+    def detect(self, text):
+        """返回文本的主要语言，无法识别时返回默认语言"""
+        distribution = self.distribution(text)
+        return distribution[0][0] if distribution else self.default
@@ -1,3 +1,6 @@
+import string
+
+
 class LanguageUtils:
     # 中英文文本字典
     translations = {
@@ -63,10 +66,18 @@ class LanguageUtils:
                 "en": "Please describe your symptoms:",
                 "zh": "请描述您的症状:"
             },
+            "load_earlier": {
+                "en": "Load earlier messages",
+                "zh": "加载更早的消息"
+            },
             "analyzing": {
                 "en": "ClinixBot is analyzing your symptoms...",
                 "zh": "ClinixBot正在分析您的症状..."
             },
+            "provisional_diagnosis": {
+                "en": "Quick assessment: possibly {} ({}% confidence). ClinixBot is preparing a detailed analysis...",
+                "zh": "快速评估：可能是{}(置信度{}%)，ClinixBot正在生成详细分析..."
+            },
             "generating_recommendations": {
                 "en": "Generating medication recommendations...",
                 "zh": "正在生成用药建议..."
@@ -160,7 +171,7 @@ class LanguageUtils:
                 "zh": "下单"
             },
             "no_pharmacy_found": {
-                "en": "No pharmacies found within {} kilometers",
+                "en": "No pharmacies found within {} kilometers that carry {}",
                 "zh": "在半径 {}公里内未找到提供{}的药房"
             },
             "try_again": {
@@ -270,19 +281,68 @@ class LanguageUtils:
         }
     }
     
+    # 支持的界面语言，缺少翻译时回退到FALLBACK_LANGUAGE
+    LANGUAGES = ("en", "zh")
+    FALLBACK_LANGUAGE = "en"
+    
+    # 以下索引由_build()在导入时根据translations生成
+    _tables = {}      # 语言 -> {(类别, 键): 文本}
+    _templates = {}   # 语言 -> {(类别, 键): 预绑定的str.format}，只包含带占位符的文本
+    _label_index = {} # (类别, 任一语言的文本) -> 键
+    
+    @classmethod
+    def _build(cls):
+        """把嵌套的translations编译为按语言的扁平表，缺失的翻译和占位符不一致在此统一报告一次"""
+        formatter = string.Formatter()
+        problems = []
+        
+        for language in cls.LANGUAGES:
+            cls._tables[language] = {}
+            cls._templates[language] = {}
+        
+        for category, entries in cls.translations.items():
+            for key, texts in entries.items():
+                placeholders = {}
+                for language in cls.LANGUAGES:
+                    text = texts.get(language)
+                    if text is None:
+                        problems.append(f"{category}.{key} 缺少 {language} 翻译")
+                        text = texts.get(cls.FALLBACK_LANGUAGE, f"{category}.{key}")
+                    
+                    cls._tables[language][(category, key)] = text
+                    cls._label_index[(category, text)] = key
+                    
+                    fields = [field for _, field, _, _ in formatter.parse(text) if field is not None]
+                    if fields:
+                        cls._templates[language][(category, key)] = text.format
+                    placeholders[language] = len(fields)
+                
+                if len(set(placeholders.values())) > 1:
+                    problems.append(f"{category}.{key} 各语言占位符数量不一致: {placeholders}")
+        
+        for problem in problems:
+            print(f"翻译表问题: {problem}")
+    
     @staticmethod
     def get_text(category, key, language, *args):
         """获取指定类别和语言的文本"""
-        try:
-            text = LanguageUtils.translations[category][key][language]
-            
-            # 如果有格式化参数，应用它们
-            if args:
-                return text.format(*args)
-            return text
-        except KeyError:
-            # 如果找不到翻译，返回英文版本或键名
-            try:
-                return LanguageUtils.translations[category][key]["en"]
-            except KeyError:
-                return f"{category}.{key}"
\ No newline at end of file
+        # 未注册的语言统一回退，文本表和格式化模板使用同一个语言
+        if language not in LanguageUtils._tables:
+            language = LanguageUtils.FALLBACK_LANGUAGE
+        text = LanguageUtils._tables[language].get((category, key))
+        if text is None:
+            return f"{category}.{key}"
+        
+        # 如果有格式化参数，使用预绑定的模板
+        if args:
+            template = LanguageUtils._templates.get(language, {}).get((category, key))
+            return template(*args) if template else text
+        return text
+    
+    @staticmethod
+    def key_for_label(category, label):
+        """根据界面上显示的文本(任一语言)反查翻译键，用于把导航选项映射回视图"""
+        return LanguageUtils._label_index.get((category, label))
+
+
+LanguageUtils._build()
@@ -0,0 +1,156 @@
+import atexit
+import queue
+import threading
+import time
+
+
+class AsyncLogWriter:
+    """
+    聊天和诊断日志的异步批量写入器
+
+    调用方只把记录放入有界内存队列后立即返回；后台线程在累积到batch_size条
+    或距上次写入超过flush_interval秒时，用一次executemany事务批量写入SQLite。
+    队列已满时直接丢弃新记录并计数，保证用户请求永远不等待磁盘。
+    """
+
+    def __init__(self, db, max_queue_size=10000, batch_size=200, flush_interval=0.5, high_watermark=0.8):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.high_watermark = int(max_queue_size * high_watermark)
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "batches": 0,
+            "backpressure_events": 0,
+            "max_queue_depth": 0,
+        }
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="clinixbot-log-writer", daemon=True)
+        self._thread.start()
+
+        # 进程退出前写完队列中剩余的记录
+        atexit.register(self.close)
+
+    def _count(self, name, value=1):
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def _enqueue(self, kind, row):
+        """非阻塞入队，队列满时丢弃"""
+        try:
+            self._queue.put_nowait((kind, row))
+        except queue.Full:
+            self._count("dropped")
+            return False
+
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], depth)
+            # 队列深度超过高水位说明写入跟不上，记录一次背压
+            if depth >= self.high_watermark:
+                self._stats["backpressure_events"] += 1
+        return True
+
+    def log_chat_turn(self, user_id, user_message, bot_response, timestamp=None):
+        """
+        记录一轮对话，返回该轮的时间戳
+
+        chat_id要到写入后才确定，诊断记录通过(user_id, 时间戳)关联到这一轮对话。
+        """
+        timestamp = timestamp or self.db.timestamp_now()
+        self._enqueue("chat", (user_id, timestamp, user_message, bot_response))
+        return timestamp
+
+    def log_diagnosis(self, user_id, symptoms, diagnosis, recommended_treatments=None, chat_timestamp=None):
+        """记录一次诊断，chat_timestamp为对应对话轮次的时间戳"""
+        self._enqueue("diagnosis", (
+            user_id, user_id, chat_timestamp, symptoms, diagnosis, recommended_treatments, self.db.timestamp_now()
+        ))
+
+    def _write(self, batch):
+        """将一批记录写入数据库"""
+        chat_rows = [row for kind, row in batch if kind == "chat"]
+        diagnosis_rows = [row for kind, row in batch if kind == "diagnosis"]
+        try:
+            self.db.write_log_batch(chat_rows, diagnosis_rows)
+            self._count("written", len(batch))
+            self._count("batches")
+        except Exception as e:
+            print(f"批量写入日志时出错: {e}")
+            self._count("failed", len(batch))
+
+    def _drain(self, max_items):
+        """从队列取出最多max_items条记录"""
+        batch = []
+        while len(batch) < max_items:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """后台写入循环：达到批量大小或超过刷新间隔时写入"""
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                batch.extend(self._drain(self.batch_size - len(batch)))
+
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout=None):
+        """阻塞直到当前队列中的记录全部写入"""
+        if not self._thread.is_alive():
+            self._flush_remaining()
+            return
+        done = threading.Event()
+
+        def wait():
+            self._queue.join()
+            done.set()
+
+        threading.Thread(target=wait, daemon=True).start()
+        done.wait(timeout)
+
+    def _flush_remaining(self):
+        """写入线程停止后同步写完剩余记录"""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def close(self):
+        """停止后台线程并写完剩余记录"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval * 4 + 5)
+        self._flush_remaining()
+
+    def stats(self):
+        """返回写入计数器快照"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        return stats
@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+
+import folium
+from folium.plugins import FastMarkerCluster
+
+from utils.telemetry import telemetry
+
+# 弹窗HTML中的距离占位符，打开弹窗时在浏览器端按当前用户的位置计算
+DISTANCE_PLACEHOLDER = "{distance}"
+
+# 客户端聚合的标记回调：每个点只是数组中的一行，不生成单独的Python Marker对象。
+# 缓存的地图被同一网格内的所有用户共享，弹窗中的距离不能写死，在打开时计算
+_MARKER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 8, color: row[3], fillColor: row[3], fillOpacity: 0.8, weight: 2
+    });
+    marker.bindPopup(function () {
+        var user = window.clinixUserLocation;
+        var km = user ? (L.latLng(user).distanceTo(marker.getLatLng()) / 1000).toFixed(1) : "?";
+        return row[2].replace("%s", km);
+    });
+    return marker;
+};
+""" % DISTANCE_PLACEHOLDER
+
+# 每次请求追加的用户图层：用户的精确位置和标记不进入共享缓存
+_USER_LOCATION_SCRIPT = "<script>window.clinixUserLocation = [{lat}, {lng}];</script>"
+_USER_MARKER_SCRIPT = """<script>
+(function () {{
+    var map = {map_name};
+    map.setView([{lat}, {lng}], map.getZoom());
+    L.marker([{lat}, {lng}], {{icon: L.AwesomeMarkers.icon({{icon: "home", markerColor: "red", prefix: "glyphicon"}})}})
+        .bindPopup("您的位置").addTo(map);
+}})();
+</script>"""
+
+
+class MapRenderer:
+    """
+    查找页面的地图渲染缓存
+
+    同一位置网格和筛选条件下的地图HTML只生成一次，之后直接复用；
+    标记数据作为一个数组交给Leaflet在浏览器端聚合，地图只加载前max_markers个
+    (按距离排序)结果，更多结果按页追加。
+    缓存的部分不含任何单个用户的数据：用户标记和地图中心在每次请求时追加，
+    弹窗中的距离用DISTANCE_PLACEHOLDER占位，由浏览器按用户位置计算。
+    """
+
+    def __init__(self, cache_size=256, grid_size=0.005, max_markers=500):
+        """
+        grid_size: 位置网格边长(度)，约500米，同一网格内的用户共享地图缓存
+        max_markers: 每页加载到地图上的标记数上限
+        """
+        self.grid_size = grid_size
+        self.max_markers = max_markers
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cell(self, location):
+        """返回位置所在网格的编号"""
+        return (round(location["lat"] / self.grid_size), round(location["lng"] / self.grid_size))
+
+    def _cell_center(self, cell):
+        return [cell[0] * self.grid_size, cell[1] * self.grid_size]
+
+    def visible_count(self, total, pages=1):
+        """当前页数下地图上显示的标记数量"""
+        return min(total, self.max_markers * pages)
+
+    def render_html(self, location, filters, points, pages=1, zoom_start=13):
+        """
+        返回地图HTML
+
+        location: 用户位置，按网格取整作为地图中心
+        filters: 可哈希的筛选条件，与网格一起作为缓存键
+        points: 按距离排序的(纬度, 经度, 弹窗HTML, 颜色, 机构ID)列表，弹窗中的距离用DISTANCE_PLACEHOLDER
+        pages: 已加载的标记页数
+        """
+        points = points[:self.visible_count(len(points), pages)]
+        key = (self.cell(location), filters, pages)
+        # 同一缓存键下结果集和弹窗内容可能随库存、床位等数据变化，用标记数据校验缓存是否仍然有效
+        signature = tuple(tuple(point) for point in points)
+
+        with telemetry.span("map.render") as span:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached and cached[0] == signature:
+                    self._cache.move_to_end(key)
+                    span.set(cache_hit=True)
+                    return self._with_user_layer(cached[1], cached[2], location)
+            span.set(cache_hit=False, markers=len(points))
+
+            center = self._cell_center(key[0])
+            m = folium.Map(location=center, zoom_start=zoom_start)
+
+            if points:
+                FastMarkerCluster(
+                    [list(point[:4]) for point in points],
+                    callback=_MARKER_CALLBACK
+                ).add_to(m)
+
+            # 与folium_static相同，包装成Figure后渲染为完整页面交给components.html显示
+            html = folium.Figure().add_child(m).render()
+
+            with self._lock:
+                self._cache[key] = (signature, html, m.get_name())
+                self._cache.move_to_end(key)
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+            return self._with_user_layer(html, m.get_name(), location)
+
+    @staticmethod
+    def _with_user_layer(html, map_name, location):
+        """在共享的地图HTML上追加当前用户的位置标记，并把地图中心移到用户位置"""
+        lat, lng = float(location["lat"]), float(location["lng"])
+        head = _USER_LOCATION_SCRIPT.format(lat=lat, lng=lng)
+        tail = _USER_MARKER_SCRIPT.format(map_name=map_name, lat=lat, lng=lng)
+        html = html.replace("<head>", "<head>" + head, 1)
+        end = html.rfind("</html>")
+        return html[:end] + tail + html[end:] if end >= 0 else html + tail
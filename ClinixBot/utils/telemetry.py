@@ -0,0 +1,278 @@
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 耗时直方图的桶上界(秒)，覆盖从微秒级的缓存命中到数十秒的模型调用
+DEFAULT_BUCKETS = (
+    0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+_current_span = contextvars.ContextVar("clinixbot_current_span", default=None)
+
+
+class Histogram:
+    """固定桶的耗时直方图，内存占用与观测次数无关，分位数按桶内线性插值估算"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为+Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """估算分位数(与Prometheus的histogram_quantile相同的插值方式)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class Span:
+    """一次计时区间，可以嵌套，并可附带token数、缓存命中等属性"""
+
+    recording = True
+
+    def __init__(self, telemetry, name, attributes):
+        self._telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.parent = None
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self._token = _current_span.set(self)
+        self._started = time.perf_counter()
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._started
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # 生成器中的span可能在另一个上下文里结束(如StreamingResponse逐段在线程池中迭代)
+            _current_span.set(self.parent)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self._telemetry._finish(self)
+        return False
+
+
+class _NoopSpan:
+    """关闭遥测时使用的空实现，所有调用共享同一个实例"""
+
+    recording = False
+
+    def set(self, **attributes):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Telemetry:
+    """
+    轻量级链路计时和指标
+
+    通过环境变量开启:
+        CLINIXBOT_TELEMETRY=prometheus,jsonl   导出方式，可只选其一；未设置时为关闭状态
+        CLINIXBOT_METRICS_PORT=9464            Prometheus文本格式的/metrics端口
+        CLINIXBOT_TRACE_PATH=logs/traces.jsonl 按大小滚动的span日志
+    关闭时span()直接返回共享的空对象，调用方的开销只有一次属性判断。
+    """
+
+    def __init__(self, exporters=(), metrics_port=9464, trace_path="logs/traces.jsonl",
+                 trace_max_bytes=10 * 1024 * 1024, trace_backups=5):
+        self.enabled = bool(exporters)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._trace_logger = None
+        self._server = None
+
+        if "jsonl" in exporters:
+            self._trace_logger = self._create_trace_logger(trace_path, trace_max_bytes, trace_backups)
+        if "prometheus" in exporters:
+            self._start_metrics_server(metrics_port)
+
+    @classmethod
+    def from_env(cls):
+        exporters = [name.strip() for name in os.getenv("CLINIXBOT_TELEMETRY", "").split(",") if name.strip()]
+        return cls(
+            exporters=exporters,
+            metrics_port=int(os.getenv("CLINIXBOT_METRICS_PORT", "9464")),
+            trace_path=os.getenv("CLINIXBOT_TRACE_PATH", "logs/traces.jsonl"),
+        )
+
+    @staticmethod
+    def _create_trace_logger(path, max_bytes, backups):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        logger = logging.getLogger(f"clinixbot.traces.{path}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        if not logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        return logger
+
+    def _start_metrics_server(self, port):
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                data = telemetry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="clinixbot-metrics", daemon=True).start()
+        except OSError as e:
+            # 端口被占用(如同一台机器上的另一个进程)时只导出到其他目标
+            print(f"启动指标端口 {port} 时出错: {e}")
+
+    def span(self, name, **attributes):
+        """
+        创建计时区间，用作上下文管理器:
+
+            with telemetry.span("rag.llm", language="zh") as span:
+                ...
+                span.set(tokens_in=120, tokens_out=300)
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def traced(self, name):
+        """函数装饰器形式的span"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _finish(self, span):
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = Histogram()
+            histogram.observe(span.duration)
+
+            for key in ("tokens_in", "tokens_out"):
+                if key in span.attributes:
+                    counter_key = (span.name, key)
+                    self._counters[counter_key] = self._counters.get(counter_key, 0) + span.attributes[key]
+            if "cache_hit" in span.attributes:
+                counter_key = (span.name, "cache_hits" if span.attributes["cache_hit"] else "cache_misses")
+                self._counters[counter_key] = self._counters.get(counter_key, 0) + 1
+
+        if self._trace_logger:
+            self._trace_logger.info(json.dumps({
+                "span": span.name,
+                "parent": span.parent.name if span.parent else None,
+                "start": round(span.start_time, 6),
+                "duration_ms": round(span.duration * 1000, 3),
+                **span.attributes,
+            }, ensure_ascii=False, default=str))
+
+    def snapshot(self):
+        """各span的次数、总耗时和p50/p95/p99(秒)"""
+        with self._lock:
+            return {
+                name: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+                for name, histogram in self._histograms.items()
+            }
+
+    def prometheus_text(self):
+        """Prometheus文本格式的全部指标"""
+        lines = [
+            "# HELP clinixbot_span_duration_seconds Duration of instrumented spans.",
+            "# TYPE clinixbot_span_duration_seconds histogram",
+        ]
+        # 桶计数和分位数都在锁内读取，避免与并发的observe()交错
+        with self._lock:
+            histograms = {
+                name: (h.buckets, list(h.counts), h.count, h.sum, [(q, h.quantile(q)) for q in (0.5, 0.95, 0.99)])
+                for name, h in self._histograms.items()
+            }
+            counters = dict(self._counters)
+
+        quantile_lines = []
+        for name, (buckets, counts, count, total, quantiles) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'clinixbot_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'clinixbot_span_duration_seconds_sum{{span="{name}"}} {total}')
+            lines.append(f'clinixbot_span_duration_seconds_count{{span="{name}"}} {count}')
+            for q, value in quantiles:
+                quantile_lines.append(
+                    f'clinixbot_span_duration_quantile_seconds{{span="{name}",quantile="{q}"}} {value}'
+                )
+
+        lines.append("# HELP clinixbot_span_duration_quantile_seconds Estimated latency quantiles per span.")
+        lines.append("# TYPE clinixbot_span_duration_quantile_seconds gauge")
+        lines.extend(quantile_lines)
+
+        lines.append("# HELP clinixbot_span_total Token and cache counters per span.")
+        lines.append("# TYPE clinixbot_span_total counter")
+        for (name, key), value in sorted(counters.items()):
+            lines.append(f'clinixbot_span_total{{span="{name}",kind="{key}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+# 进程内共享的实例
+telemetry = Telemetry.from_env()
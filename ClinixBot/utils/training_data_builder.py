@@ -0,0 +1,135 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_SYSTEM_PROMPT = "你是ClinixBot，一个专业的医疗诊断助手，根据患者的症状提供初步诊断和治疗建议。"
+
+
+def _json_escape(series):
+    """对字符串列做JSON转义(不含两侧引号)，只对去重后的取值调用json.dumps"""
+    values = series.fillna("").astype(str)
+    uniques = pd.unique(values)
+    escaped = {value: json.dumps(value, ensure_ascii=False)[1:-1] for value in uniques}
+    return values.map(escaped)
+
+
+class TrainingDataBuilder:
+    """
+    微调数据集构建器
+
+    按块读取就诊记录CSV，用向量化的字符串拼接生成聊天格式的训练样本并直接写入JSONL，
+    内存占用只与块大小和不重复样本数有关。相同(疾病, 医生备注, 治疗)的样本只保留一条并计数，
+    每条样本的出现次数写入计数文件，训练时可据此加权或按次数重复，不丢失原始分布；
+    训练集/验证集按样本哈希划分，同一份数据每次构建结果相同。
+    """
+
+    KEY_COLUMNS = ["Medical Condition", "Doctor's Notes", "Treatments"]
+
+    def __init__(self, system_prompt=DEFAULT_SYSTEM_PROMPT, chunk_size=200000, validation_fraction=0.1):
+        self.system_prompt = system_prompt
+        self.chunk_size = chunk_size
+        self.validation_fraction = validation_fraction
+
+    def _compose_lines(self, chunk):
+        """把一块记录拼接成JSONL行，转义后的片段直接拼接仍是合法的JSON字符串"""
+        condition = _json_escape(chunk["Medical Condition"])
+        notes = _json_escape(chunk["Doctor's Notes"])
+        treatments = _json_escape(chunk["Treatments"])
+
+        system = json.dumps(self.system_prompt, ensure_ascii=False)
+        prefix = '{"messages": [{"role": "system", "content": ' + system + '}, {"role": "user", "content": "'
+        symptoms = "患者描述症状: " + condition + "相关症状。" + notes
+        middle = '"}, {"role": "assistant", "content": "'
+        # 换行在JSON字符串中写作转义的\n
+        response = "初步诊断: " + condition + "\\n建议治疗: " + treatments
+        return prefix + symptoms + middle + response + '"}]}\n'
+
+    @staticmethod
+    def _merge_counts(seen, counts, hashes, hash_counts):
+        """合并跨块的样本哈希计数，seen保持有序以便用searchsorted查找"""
+        merged, inverse = np.unique(np.concatenate([seen, hashes]), return_inverse=True)
+        merged_counts = np.bincount(inverse, weights=np.concatenate([counts, hash_counts])).astype(np.int64)
+        return merged, merged_counts
+
+    @staticmethod
+    def _write_counts(counts_path, seen, counts, written):
+        """
+        写入计数文件：每行对应数据集中的一条样本(split, line, hash, count)
+
+        line是样本在对应JSONL文件中的行号(从0开始)，count是该样本在原始记录中的出现次数
+        """
+        frames = []
+        for split, hashes in written.items():
+            hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+            frames.append(pd.DataFrame({
+                "split": split,
+                "line": np.arange(len(hashes)),
+                "hash": hashes,
+                "count": counts[np.searchsorted(seen, hashes)],
+            }))
+        pd.concat(frames, ignore_index=True).to_csv(counts_path, index=False)
+
+    def build(self, csv_path, train_path="training_data.jsonl", validation_path="validation_data.jsonl",
+              counts_path="training_counts.csv"):
+        """
+        构建数据集并写入train_path和validation_path，返回统计信息
+
+        validation_path为None时全部写入训练集；counts_path为None时不写计数文件
+        """
+        started = time.perf_counter()
+        seen = np.empty(0, dtype=np.uint64)
+        counts = np.empty(0, dtype=np.int64)
+        stats = {"rows": 0, "train": 0, "validation": 0}
+        # 按写入顺序记录各数据集中样本的哈希，构建结束后再查出最终计数
+        written = {"train": [], "validation": []}
+        # 划分阈值：哈希取模后小于阈值的进入验证集
+        buckets = 10000
+        threshold = int(buckets * self.validation_fraction) if validation_path else 0
+
+        train_file = open(train_path, "w", encoding="utf-8")
+        validation_file = open(validation_path, "w", encoding="utf-8") if validation_path else None
+        try:
+            for chunk in pd.read_csv(csv_path, usecols=self.KEY_COLUMNS, chunksize=self.chunk_size):
+                stats["rows"] += len(chunk)
+
+                hashes = pd.util.hash_pandas_object(chunk[self.KEY_COLUMNS], index=False).to_numpy()
+                unique_hashes, first_positions, hash_counts = np.unique(
+                    hashes, return_index=True, return_counts=True
+                )
+
+                # 只写入之前的块中没有出现过的样本
+                is_new = ~np.isin(unique_hashes, seen, assume_unique=True)
+                seen, counts = self._merge_counts(seen, counts, unique_hashes, hash_counts)
+
+                new_positions = np.sort(first_positions[is_new])
+                if not len(new_positions):
+                    continue
+                lines = self._compose_lines(chunk.iloc[new_positions])
+                in_validation = (hashes[new_positions] % buckets) < threshold
+
+                train_file.write("".join(lines[~in_validation]))
+                stats["train"] += int((~in_validation).sum())
+                written["train"].append(hashes[new_positions][~in_validation])
+                if validation_file:
+                    validation_file.write("".join(lines[in_validation]))
+                    stats["validation"] += int(in_validation.sum())
+                    written["validation"].append(hashes[new_positions][in_validation])
+        finally:
+            train_file.close()
+            if validation_file:
+                validation_file.close()
+
+        if counts_path:
+            self._write_counts(counts_path, seen, counts, written)
+
+        stats["unique"] = int(len(seen))
+        stats["duplicates"] = stats["rows"] - stats["unique"]
+        stats["duplicated_examples"] = int((counts > 1).sum())
+        stats["max_count"] = int(counts.max()) if len(counts) else 0
+        stats["train_path"] = train_path
+        stats["validation_path"] = validation_path
+        stats["counts_path"] = counts_path
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        return stats
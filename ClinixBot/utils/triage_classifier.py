@@ -0,0 +1,438 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold
+
+# 每种疾病的中英文常见症状描述，补充就诊记录中偏治疗方案的医生备注，
+# 使模型能直接处理患者的症状描述。疾病名与就诊记录的Medical Condition列一致。
+SYMPTOM_TERMS = {
+    "Allergies": {
+        "en": ["sneezing and itchy watery eyes", "runny nose after contact with pollen or pets", "hives and itching",
+               "allergic reaction", "seasonal allergy symptoms"],
+        "zh": ["打喷嚏，眼睛痒流泪", "接触花粉或宠物后流鼻涕", "荨麻疹，皮肤瘙痒", "过敏反应", "季节性过敏"],
+    },
+    "Alzheimer's Disease": {
+        "en": ["memory loss and confusion", "forgetting recent events and names", "getting lost in familiar places",
+               "difficulty with thinking and judgment in an elderly person"],
+        "zh": ["记忆力减退，糊涂", "忘记最近的事情和人名", "在熟悉的地方迷路", "老人思维和判断能力下降"],
+    },
+    "Anxiety": {
+        "en": ["constant worry and nervousness", "racing heart and restlessness when stressed", "panic attacks",
+               "trouble sleeping because of worry"],
+        "zh": ["总是担心，紧张不安", "压力大时心跳加快，坐立不安", "惊恐发作", "因为担心睡不着"],
+    },
+    "Arthritis": {
+        "en": ["joint pain and stiffness in the morning", "swollen painful knees", "aching joints in hands",
+               "joint pain that gets worse with activity"],
+        "zh": ["早上关节疼痛僵硬", "膝盖肿痛", "手指关节疼", "活动后关节痛加重"],
+    },
+    "Asthma": {
+        "en": ["wheezing and shortness of breath", "chest tightness at night", "coughing when exercising",
+               "attacks of breathlessness triggered by cold air"],
+        "zh": ["喘息，气短", "夜间胸闷", "运动时咳嗽", "遇冷空气就喘不上气"],
+    },
+    "Bronchitis": {
+        "en": ["persistent cough with mucus", "cough with yellow phlegm and chest discomfort",
+               "productive cough after a cold", "wheezing and coughing up phlegm"],
+        "zh": ["持续咳嗽有痰", "咳黄痰，胸部不适", "感冒后一直咳痰", "咳嗽带痰，喘鸣"],
+    },
+    "Burns": {
+        "en": ["burned my hand on the stove", "blistering skin after scalding", "red painful skin after hot water",
+               "burn injury"],
+        "zh": ["手被炉子烫伤", "烫伤后起水泡", "被开水烫红，很疼", "烧伤"],
+    },
+    "COVID-19": {
+        "en": ["fever and dry cough with loss of taste and smell", "tested positive for covid",
+               "fever, fatigue and loss of smell", "shortness of breath after covid exposure"],
+        "zh": ["发烧干咳，失去味觉和嗅觉", "新冠检测阳性", "发热乏力，闻不到味道", "接触新冠后呼吸困难"],
+    },
+    "Cancer": {
+        "en": ["unexplained weight loss and a lump", "a growing mass", "night sweats and weight loss",
+               "tumor diagnosed"],
+        "zh": ["不明原因体重下降，摸到肿块", "肿块越来越大", "盗汗，消瘦", "诊断出肿瘤"],
+    },
+    "Chronic Kidney Disease": {
+        "en": ["swollen ankles and foamy urine", "reduced urine output and fatigue", "high creatinine",
+               "kidney function decline"],
+        "zh": ["脚踝水肿，尿里有泡沫", "尿量减少，乏力", "肌酐升高", "肾功能下降"],
+    },
+    "Chronic Obstructive Pulmonary Disease": {
+        "en": ["long term smoker with chronic cough and breathlessness", "shortness of breath getting worse over years",
+               "chronic cough with sputum every morning", "copd"],
+        "zh": ["长期吸烟，慢性咳嗽气短", "气短多年逐渐加重", "每天早上咳痰", "慢阻肺"],
+    },
+    "Common Cold": {
+        "en": ["runny nose, sneezing and sore throat", "stuffy nose and mild cough", "caught a cold",
+               "mild fever with a runny nose"],
+        "zh": ["流鼻涕，打喷嚏，喉咙痛", "鼻塞，轻微咳嗽", "感冒了", "低烧流鼻涕"],
+    },
+    "Depression": {
+        "en": ["feeling sad and hopeless for weeks", "loss of interest in everything", "no energy and low mood",
+               "can't enjoy anything and sleep badly"],
+        "zh": ["几周来一直情绪低落，绝望", "对什么都没兴趣", "没精神，心情低落", "开心不起来，睡不好"],
+    },
+    "Diabetes": {
+        "en": ["always thirsty and urinating often", "high blood sugar", "weight loss with excessive thirst",
+               "blurry vision and frequent urination"],
+        "zh": ["总是口渴，尿频", "血糖高", "体重下降，口渴多饮", "视力模糊，小便多"],
+    },
+    "Epilepsy": {
+        "en": ["seizures with shaking", "blackouts and convulsions", "episodes of staring and unresponsiveness",
+               "had a fit"],
+        "zh": ["抽搐发作", "突然昏倒抽筋", "发呆叫不应", "羊癫疯发作"],
+    },
+    "Fracture": {
+        "en": ["fell and my arm looks deformed", "broken bone", "can't put weight on my leg after a fall",
+               "severe pain and swelling after a fall, heard a crack"],
+        "zh": ["摔倒后手臂变形", "骨头断了", "摔倒后腿不能着地", "摔伤后剧痛肿胀，听到咔嚓声"],
+    },
+    "Gastroenteritis": {
+        "en": ["vomiting and diarrhea", "stomach cramps with diarrhea", "food poisoning", "nausea, vomiting and fever"],
+        "zh": ["上吐下泻", "肚子绞痛，拉肚子", "食物中毒", "恶心呕吐，发烧"],
+    },
+    "Heart Disease": {
+        "en": ["chest pain when walking", "pressure in the chest spreading to the arm", "palpitations and chest pain",
+               "heart problems"],
+        "zh": ["走路时胸痛", "胸口压迫感，放射到手臂", "心悸胸痛", "心脏不好"],
+    },
+    "Hypertension": {
+        "en": ["high blood pressure", "headache and high blood pressure readings", "blood pressure 160 over 100",
+               "dizziness with elevated blood pressure"],
+        "zh": ["血压高", "头痛，血压偏高", "血压160/100", "头晕，血压升高"],
+    },
+    "Influenza": {
+        "en": ["high fever, body aches and chills", "sudden fever with muscle pain", "flu symptoms",
+               "fever, headache and exhaustion"],
+        "zh": ["高烧，全身酸痛，发冷", "突然发烧，肌肉疼", "流感症状", "发烧头痛，浑身无力"],
+    },
+    "Migraine": {
+        "en": ["one sided headache with nausea", "throbbing headache and sensitivity to light",
+               "headache with visual aura", "severe recurring headaches"],
+        "zh": ["一侧头痛伴恶心", "搏动性头痛，怕光", "头痛前眼前有闪光", "反复剧烈头痛"],
+    },
+    "Multiple Sclerosis": {
+        "en": ["numbness and tingling in limbs", "vision problems and weakness that come and go",
+               "balance problems and fatigue", "muscle spasms and numbness"],
+        "zh": ["四肢麻木刺痛", "视力问题和无力时好时坏", "走路不稳，疲劳", "肌肉痉挛，麻木"],
+    },
+    "Parkinson's Disease": {
+        "en": ["hand tremor at rest", "slow movement and stiffness", "shuffling walk and tremor",
+               "shaking hands and small handwriting"],
+        "zh": ["静止时手抖", "动作缓慢，僵硬", "小碎步，手抖", "手抖，写字越来越小"],
+    },
+    "Pneumonia": {
+        "en": ["high fever, cough and chest pain when breathing", "cough with fever and difficulty breathing",
+               "crackles in the lungs", "lung infection"],
+        "zh": ["高烧咳嗽，呼吸时胸痛", "咳嗽发烧，呼吸困难", "肺部有啰音", "肺部感染"],
+    },
+    "Sinusitis": {
+        "en": ["facial pain and pressure around the nose", "blocked nose with thick yellow discharge",
+               "headache behind the eyes and stuffy nose", "sinus infection"],
+        "zh": ["面部疼痛，鼻子周围胀", "鼻塞，流黄脓鼻涕", "眼睛后面痛，鼻塞", "鼻窦炎"],
+    },
+    "Skin Infection": {
+        "en": ["red swollen warm skin", "infected cut with pus", "painful red patch spreading on the leg",
+               "boil on the skin"],
+        "zh": ["皮肤红肿发热", "伤口感染流脓", "腿上红斑扩散，疼痛", "皮肤长疖子"],
+    },
+    "Sprain": {
+        "en": ["twisted my ankle", "swollen ankle after twisting it", "pain in my wrist after a fall, can still move it",
+               "sprained knee playing sports"],
+        "zh": ["扭伤了脚踝", "脚踝扭了，肿了", "摔倒后手腕疼，还能动", "运动时膝盖扭伤"],
+    },
+    "Stroke": {
+        "en": ["sudden weakness on one side of the body", "face drooping and slurred speech",
+               "sudden numbness of arm and trouble speaking", "sudden loss of balance and vision"],
+        "zh": ["突然一侧身体无力", "口角歪斜，说话含糊", "突然手臂麻木，说不出话", "突然站不稳，看不清"],
+    },
+    "Urinary Tract Infection": {
+        "en": ["burning pain when urinating", "need to urinate often and urgently", "cloudy urine and lower belly pain",
+               "painful urination"],
+        "zh": ["小便时有烧灼感", "尿频尿急", "尿液浑浊，小腹痛", "尿痛"],
+    },
+}
+
+# 疾病的中文名，用于中文界面的快速答复
+CONDITION_NAMES_ZH = {
+    "Allergies": "过敏", "Alzheimer's Disease": "阿尔茨海默病", "Anxiety": "焦虑症", "Arthritis": "关节炎",
+    "Asthma": "哮喘", "Bronchitis": "支气管炎", "Burns": "烧烫伤", "COVID-19": "新冠肺炎", "Cancer": "癌症",
+    "Chronic Kidney Disease": "慢性肾病", "Chronic Obstructive Pulmonary Disease": "慢性阻塞性肺疾病",
+    "Common Cold": "普通感冒", "Depression": "抑郁症", "Diabetes": "糖尿病", "Epilepsy": "癫痫", "Fracture": "骨折",
+    "Gastroenteritis": "胃肠炎", "Heart Disease": "心脏病", "Hypertension": "高血压", "Influenza": "流感",
+    "Migraine": "偏头痛", "Multiple Sclerosis": "多发性硬化", "Parkinson's Disease": "帕金森病", "Pneumonia": "肺炎",
+    "Sinusitis": "鼻窦炎", "Skin Infection": "皮肤感染", "Sprain": "扭伤", "Stroke": "中风",
+    "Urinary Tract Infection": "尿路感染",
+}
+
+
+# 需要尽快就医的危险信号(胸痛、卒中表现等)。出现时不给出快速答复：
+# 分类器对这类描述可能给出看似确定但危险的错误疾病(如把胸痛判为哮喘)
+RED_FLAG_TERMS = {
+    "en": [
+        r"chest (pain|pressure|tightness)", r"pain in (my|the) chest", r"crushing", r"face (is )?droop",
+        r"slurred speech", r"trouble speaking", r"can'?t speak", r"(weak|numb)(ness)? on one side",
+        r"one side of (my|the) (body|face)", r"worst headache", r"sudden severe headache", r"passed out",
+        r"faint(ed|ing)", r"unconscious", r"can'?t breathe", r"difficulty breathing", r"struggling to breathe",
+        r"coughing (up )?blood", r"vomiting blood", r"severe bleeding", r"suicid", r"kill myself", r"seizure",
+    ],
+    "zh": [
+        "胸痛", "胸口痛", "胸口疼", "胸口压", "口角歪斜", "嘴歪", "说话含糊", "说不出话", "一侧身体", "半身",
+        "突然剧烈头痛", "晕倒", "昏迷", "失去意识", "喘不上气", "呼吸困难", "咳血", "吐血", "呕血", "大出血",
+        "自杀", "不想活", "抽搐",
+    ],
+}
+_RED_FLAG_PATTERN = re.compile("|".join(
+    [rf"\b{term}" for term in RED_FLAG_TERMS["en"]] + RED_FLAG_TERMS["zh"]
+), re.IGNORECASE)
+
+
+def has_red_flag(text):
+    """文本中是否出现危险信号"""
+    return bool(text) and _RED_FLAG_PATTERN.search(text) is not None
+
+
+class TriageClassifier:
+    """
+    症状描述到疾病的本地快速分类器
+
+    字符n-gram的TF-IDF加多项逻辑回归，中文不需要分词，对错别字也较稳健。
+    训练数据为就诊记录的医生备注和治疗方式，加上SYMPTOM_TERMS中的中英文症状描述。
+    输出概率经过温度缩放校准，温度在留出的症状描述上拟合，更接近患者输入的分布。
+    推理时不经过scikit-learn的稀疏矩阵流程，直接按词表取系数行加权求和，单条文本约几十微秒。
+    训练好的参数可以用save()/load()保存为npz，各工作进程加载同一份结果，不必各自重新训练。
+    """
+
+    CURATED_WEIGHT = 3.0
+    C = 10.0
+    NGRAM_RANGE = (1, 3)
+    # 保存格式或训练方式变化时递增，旧的保存结果随之失效
+    FORMAT_VERSION = 1
+
+    def __init__(self, threshold=0.9, top_k=3, symptom_terms=None):
+        """
+        threshold: 第一名的置信度达到该值时provisional()才给出快速答复。
+                   在留出的患者口语化描述上(benchmarks/eval_triage.py)，0.6时快速答复的准确率只有约77%，
+                   0.9时约95%、覆盖约13%的查询；快速答复宁可少给也不能给错
+        symptom_terms: 训练用的症状描述词表，默认SYMPTOM_TERMS(离线评估时传入去掉测试短语的子集)
+        """
+        self.threshold = threshold
+        self.top_k = top_k
+        self.symptom_terms = SYMPTOM_TERMS if symptom_terms is None else symptom_terms
+        self.vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=self.NGRAM_RANGE, sublinear_tf=True, dtype=np.float32)
+        self.classes = []
+        self.temperature = 1.0
+        self._analyzer = None
+        self._vocabulary = None
+        self._idf = None
+        self._coef = None
+        self._intercept = None
+
+    @classmethod
+    def from_records(cls, csv_path, **kwargs):
+        """从就诊记录CSV训练"""
+        records = pd.read_csv(csv_path, usecols=["Medical Condition", "Doctor's Notes", "Treatments"])
+        records = records.dropna(subset=["Medical Condition"])
+        texts = (records["Doctor's Notes"].fillna("") + " " + records["Treatments"].fillna("")).tolist()
+        labels = records["Medical Condition"].tolist()
+
+        classifier = cls(**kwargs)
+        classifier.fit(texts, labels)
+        return classifier
+
+    def fingerprint(self, csv_path):
+        """训练输入(记录文件、症状词表、超参数)的摘要，用作保存结果的文件名"""
+        stat = os.stat(csv_path)
+        inputs = {
+            "format": self.FORMAT_VERSION,
+            "data_path": os.path.abspath(csv_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "symptom_terms": self.symptom_terms,
+            "params": [self.CURATED_WEIGHT, self.C, list(self.NGRAM_RANGE)],
+        }
+        return hashlib.sha256(json.dumps(inputs, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def from_records_cached(cls, csv_path, cache_dir, **kwargs):
+        """
+        从cache_dir加载与当前训练输入一致的保存结果，没有时训练并保存
+
+        调用方负责跨进程加锁，避免多个进程同时训练
+        """
+        classifier = cls(**kwargs)
+        path = os.path.join(cache_dir, f"triage_{classifier.fingerprint(csv_path)}.npz")
+        if os.path.exists(path):
+            try:
+                return classifier.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"加载分诊分类器 {path} 时出错，重新训练: {e}")
+
+        classifier = cls.from_records(csv_path, **kwargs)
+        classifier.save(path)
+        # 训练输入变化后旧的保存结果不会再用到
+        for name in os.listdir(cache_dir):
+            if name.startswith("triage_") and name.endswith(".npz") and os.path.join(cache_dir, name) != path:
+                os.remove(os.path.join(cache_dir, name))
+        return classifier
+
+    def save(self, path):
+        """把推理需要的参数写入npz，先写临时文件再原子替换"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        vocabulary = np.empty(len(self._vocabulary), dtype=object)
+        for gram, column in self._vocabulary.items():
+            vocabulary[column] = gram
+        staging = f"{path}.tmp"
+        with open(staging, "wb") as f:
+            np.savez(
+                f,
+                format=np.array(self.FORMAT_VERSION),
+                classes=np.array(self.classes, dtype=str),
+                vocabulary=vocabulary.astype(str),
+                idf=self._idf,
+                coef=self._coef,
+                intercept=self._intercept,
+                temperature=np.array(self.temperature),
+            )
+        os.replace(staging, path)
+
+    def load(self, path):
+        """加载save()保存的参数，阈值等推理设置仍使用构造参数"""
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format"]) != self.FORMAT_VERSION:
+                raise ValueError(f"保存格式版本不一致: {int(data['format'])}")
+            self.classes = data["classes"].tolist()
+            self._vocabulary = {gram: column for column, gram in enumerate(data["vocabulary"].tolist())}
+            self._idf = data["idf"]
+            self._coef = data["coef"]
+            self._intercept = data["intercept"]
+            self.temperature = float(data["temperature"])
+        self._analyzer = self.vectorizer.build_analyzer()
+        return self
+
+    def _curated_samples(self, conditions):
+        """疾病的中英文名称和每条症状描述各作为一条样本"""
+        texts, labels = [], []
+        for condition in conditions:
+            terms = self.symptom_terms.get(condition, {})
+            phrases = [condition, CONDITION_NAMES_ZH.get(condition, "")] + terms.get("en", []) + terms.get("zh", [])
+            phrases = [phrase for phrase in phrases if phrase]
+            texts.extend(phrases)
+            labels.extend([condition] * len(phrases))
+        return texts, labels
+
+    @staticmethod
+    def _deduplicate(texts, labels, weight):
+        """记录中的医生备注大量重复，相同(文本, 疾病)合并为一条并累加权重，训练快很多"""
+        counts = Counter(zip(texts, labels))
+        return [text for text, _ in counts], [label for _, label in counts], [count * weight for count in counts.values()]
+
+    def _train(self, features, labels, weights):
+        model = LogisticRegression(C=self.C, max_iter=2000)
+        return model.fit(features, labels, sample_weight=weights)
+
+    def fit(self, texts, labels):
+        """训练分类器并拟合校准温度"""
+        record_texts, record_labels, record_weights = self._deduplicate(texts, labels, 1.0)
+        curated_texts, curated_labels = self._curated_samples(sorted(set(record_labels)))
+        curated_weights = [self.CURATED_WEIGHT] * len(curated_texts)
+
+        all_texts = record_texts + curated_texts
+        all_labels = record_labels + curated_labels
+        features = self.vectorizer.fit_transform(all_texts)
+        model = self._train(features, all_labels, record_weights + curated_weights)
+
+        self.classes = list(model.classes_)
+        self._analyzer = self.vectorizer.build_analyzer()
+        self._vocabulary = self.vectorizer.vocabulary_
+        self._idf = self.vectorizer.idf_.astype(np.float32)
+        self._coef = np.ascontiguousarray(model.coef_.T, dtype=np.float32)
+        self._intercept = model.intercept_.astype(np.float32)
+
+        self.temperature = self._calibrate(features, record_labels, record_weights, curated_labels, curated_weights)
+        return self
+
+    def _calibrate(self, features, record_labels, record_weights, curated_labels, curated_weights):
+        """
+        对症状描述做3折交叉验证：每折用全部记录和其余描述训练，取留出描述的logits拟合温度
+        """
+        n_records = len(record_labels)
+        record_rows = np.arange(n_records)
+        curated_rows = np.arange(n_records, n_records + len(curated_labels))
+        labels = np.array(record_labels + curated_labels, dtype=object)
+        weights = np.array(record_weights + curated_weights)
+
+        logits = np.zeros((len(curated_rows), len(self.classes)))
+        folds = StratifiedKFold(n_splits=3, shuffle=True, random_state=0)
+        for train, test in folds.split(curated_rows, labels[curated_rows]):
+            rows = np.concatenate([record_rows, curated_rows[train]])
+            model = self._train(features[rows], labels[rows], weights[rows])
+            logits[test] = model.decision_function(features[curated_rows[test]])
+
+        targets = np.searchsorted(self.classes, labels[curated_rows])
+        return self._fit_temperature(logits, targets)
+
+    @staticmethod
+    def _fit_temperature(logits, targets):
+        """网格搜索使负对数似然最小的温度"""
+        best_temperature, best_loss = 1.0, np.inf
+        for temperature in np.linspace(0.25, 4.0, 61):
+            scaled = logits / temperature
+            scaled -= scaled.max(axis=1, keepdims=True)
+            log_probs = scaled - np.log(np.exp(scaled).sum(axis=1, keepdims=True))
+            loss = -log_probs[np.arange(len(targets)), targets].mean()
+            if loss < best_loss:
+                best_temperature, best_loss = float(temperature), loss
+        return best_temperature
+
+    def probabilities(self, text):
+        """全部疾病的校准后概率，顺序与classes一致"""
+        # 与TfidfVectorizer.transform相同的计算：次线性词频 × idf，再做L2归一化
+        counts = Counter(self._analyzer(text))
+        ids, tf = [], []
+        for gram, count in counts.items():
+            column = self._vocabulary.get(gram)
+            if column is not None:
+                ids.append(column)
+                tf.append(count)
+
+        logits = self._intercept.copy()
+        if ids:
+            weights = (1.0 + np.log(np.asarray(tf, dtype=np.float32))) * self._idf[ids]
+            weights /= np.sqrt(weights @ weights)
+            logits += weights @ self._coef[ids]
+
+        logits /= self.temperature
+        logits -= logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+    def predict(self, text, top_k=None):
+        """返回按置信度降序的[(疾病, 概率)]"""
+        if not text or self._coef is None:
+            return []
+        probabilities = self.probabilities(text)
+        top = np.argsort(probabilities)[::-1][:top_k or self.top_k]
+        return [(self.classes[i], float(probabilities[i])) for i in top]
+
+    def provisional(self, text):
+        """第一名置信度达到阈值且没有危险信号时返回(疾病, 概率)，否则返回None"""
+        if has_red_flag(text):
+            return None
+        ranked = self.predict(text, top_k=1)
+        if ranked and ranked[0][1] >= self.threshold:
+            return ranked[0]
+        return None
+
+    @staticmethod
+    def condition_name(condition, language="en"):
+        """疾病的显示名称"""
+        if language == "zh":
+            return CONDITION_NAMES_ZH.get(condition, condition)
+        return condition
@@ -0,0 +1,375 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+from langchain.docstore.document import Document
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+# 检索用向量的存储精度: none为float32；float16减半；int8为按维度的标量量化，约为四分之一。
+# numpy中float16转换较慢，float16主要用于节省内存；int8在节省内存的同时粗排更快
+QUANTIZATIONS = ("none", "float16", "int8")
+# 量化检索先取k * RERANK_FACTOR个候选，再用磁盘上的float32向量精排
+RERANK_FACTOR = 10
+# 量化向量分块转换为float32计算，块放得进CPU缓存，也限制单次检索的临时内存
+SEARCH_BLOCK_ROWS = 1024
+
+
+def quantize(vectors, quantization):
+    """
+    把float32向量转换为检索用编码，返回(codes, scale, offset)
+
+    int8: 每个维度按最小/最大值线性映射到[-127, 127]，x ≈ offset + scale * code
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if quantization == "float16":
+        return vectors.astype(np.float16), None, None
+    if quantization == "int8":
+        low = vectors.min(axis=0) if len(vectors) else np.zeros(vectors.shape[1], dtype=np.float32)
+        high = vectors.max(axis=0) if len(vectors) else np.zeros(vectors.shape[1], dtype=np.float32)
+        offset = (high + low) / 2
+        scale = np.maximum((high - low) / 254, np.finfo(np.float32).tiny)
+        codes = np.clip(np.rint((vectors - offset) / scale), -127, 127).astype(np.int8)
+        return codes, scale.astype(np.float32), offset.astype(np.float32)
+    raise ValueError(f"未知的量化方式: {quantization}")
+
+
+class MappedVectorIndex:
+    """
+    某一版本的只读向量索引
+
+    一个版本目录包含:
+        vectors.npy    float32向量矩阵 (n, d)
+        norms.npy      每行的平方范数，用于计算L2距离
+        docs.bin       文档JSON({page_content, metadata})依次拼接的UTF-8字节
+        offsets.npy    每个文档在docs.bin中的起止位置 (n + 1)
+        manifest.json  版本号、数量、维度、量化方式和数据来源
+    量化版本另有:
+        codes.npy      float16或int8编码 (n, d)
+        scale.npy, offset.npy  int8编码的按维度缩放参数
+    所有数组以只读内存映射方式打开，多个工作进程共享操作系统页缓存中的同一份数据；
+    文档只在被检索到时才解码。量化版本的粗排只读取编码，float32向量只有精排的候选行会被读入内存。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest["version"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.quantization = self.manifest.get("quantization", "none")
+        self.codes = self.scale = self.offset = None
+        if self.quantization != "none":
+            self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+        if self.quantization == "int8":
+            self.scale = np.load(os.path.join(path, "scale.npy"))
+            self.offset = np.load(os.path.join(path, "offset.npy"))
+        self._docs = np.memmap(os.path.join(path, "docs.bin"), dtype=np.uint8, mode="r") \
+            if os.path.getsize(os.path.join(path, "docs.bin")) else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def document(self, i):
+        """按下标解码一个文档"""
+        record = json.loads(self._docs[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8"))
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def field_rows(self, field):
+        """
+        按文档中"字段: 值"行分组的下标，如field_rows("Medical Condition")["Migraine"]
+
+        首次调用时解码全部文档，结果按版本缓存在实例上
+        """
+        cache = self.__dict__.setdefault("_field_rows", {})
+        if field not in cache:
+            prefix = f"{field}: "
+            groups = {}
+            for i in range(len(self)):
+                for line in self.document(i).page_content.splitlines():
+                    if line.startswith(prefix):
+                        groups.setdefault(line[len(prefix):].strip(), []).append(i)
+                        break
+            cache[field] = {value: np.asarray(rows, dtype=np.int64) for value, rows in groups.items()}
+        return cache[field]
+
+    def _exact_distances(self, query, rows=None):
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        norms = self.norms if rows is None else self.norms[rows]
+        # ||x - q||^2 = ||x||^2 - 2x·q + ||q||^2
+        return norms - 2 * (vectors @ query) + float(query @ query)
+
+    def _approximate_distances(self, query, rows=None):
+        """用量化编码估算L2距离，分块转换为float32计算"""
+        if self.quantization == "int8":
+            # x·q ≈ offset·q + code·(scale * q)
+            base, weights = float(self.offset @ query), self.scale * query
+        else:
+            base, weights = 0.0, query
+        count = len(self) if rows is None else len(rows)
+        dots = np.empty(count, dtype=np.float32)
+        buffer = np.empty((min(count, SEARCH_BLOCK_ROWS), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            block = slice(start, start + SEARCH_BLOCK_ROWS)
+            codes = self.codes[block] if rows is None else self.codes[rows[block]]
+            decoded = buffer[:len(codes)]
+            np.copyto(decoded, codes, casting="unsafe")
+            dots[block] = decoded @ weights
+        norms = self.norms if rows is None else self.norms[rows]
+        return norms - 2 * (dots + base) + float(query @ query)
+
+    @staticmethod
+    def _top(distances, k):
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        return top[np.argsort(distances[top], kind="stable")]
+
+    def search(self, embedding, k=5, candidates=None, rerank_factor=RERANK_FACTOR):
+        """
+        返回与查询向量L2距离最小的k个(下标, 距离)，与FAISS IndexFlatL2的排序一致
+
+        candidates: 只在这些下标中检索(预筛选)，为None时检索全部文档
+        rerank_factor: 量化版本粗排保留的候选倍数，返回的距离总是按float32向量精确计算
+        """
+        if not len(self):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        rows = None if candidates is None else np.asarray(candidates, dtype=np.int64)
+        if rows is not None and not len(rows):
+            return []
+
+        if self.codes is None:
+            distances = self._exact_distances(query, rows)
+            top = self._top(distances, k)
+            positions = top if rows is None else rows[top]
+            return [(int(i), float(distances[j])) for i, j in zip(positions, top)]
+
+        approximate = self._approximate_distances(query, rows)
+        shortlist = self._top(approximate, k * max(rerank_factor, 1))
+        shortlist = np.sort(shortlist if rows is None else rows[shortlist])  # 按行号顺序读取磁盘
+        distances = self._exact_distances(query, shortlist)
+        top = self._top(distances, k)
+        return [(int(shortlist[j]), float(distances[j])) for j in top]
+
+    def memory_footprint(self):
+        """检索时需要常驻内存的字节数(粗排数据)，以及磁盘上float32向量的字节数"""
+        search_arrays = [self.norms] + ([self.codes] if self.codes is not None else [self.vectors])
+        search_arrays += [array for array in (self.scale, self.offset) if array is not None]
+        return {
+            "quantization": self.quantization,
+            "search_bytes": int(sum(array.nbytes for array in search_arrays)),
+            "full_precision_bytes": int(self.vectors.nbytes),
+        }
+
+    def similarity_search_by_vector(self, embedding, k=4, candidates=None):
+        """与langchain VectorStore相同的接口，另支持candidates预筛选"""
+        return [self.document(i) for i, _ in self.search(embedding, k, candidates)]
+
+
+def _write_version(path, vectors, documents, manifest):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(documents), -1)
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    np.save(os.path.join(path, "norms.npy"), np.einsum("ij,ij->i", vectors, vectors))
+
+    if manifest["quantization"] != "none":
+        codes, scale, offset = quantize(vectors, manifest["quantization"])
+        np.save(os.path.join(path, "codes.npy"), codes)
+        if scale is not None:
+            np.save(os.path.join(path, "scale.npy"), scale)
+            np.save(os.path.join(path, "offset.npy"), offset)
+
+    offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+    with open(os.path.join(path, "docs.bin"), "wb") as f:
+        for i, doc in enumerate(documents):
+            data = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata},
+                              ensure_ascii=False).encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+class VectorIndexStore:
+    """
+    按版本发布的向量索引目录
+
+        <root>/versions/<版本号>/   每个版本写入临时目录后整体重命名，发布后不再修改
+        <root>/CURRENT             当前版本号，先写临时文件再os.replace原子替换
+
+    发布方(构建索引的进程)调用publish()；各工作进程通过current()读取，
+    最多每refresh_interval秒检查一次CURRENT，发现新版本时打开新的内存映射并替换引用，
+    正在使用旧版本的请求不受影响。
+    """
+
+    def __init__(self, root, refresh_interval=5.0, keep_versions=3, quantization="none"):
+        """
+        quantization: 发布新版本时检索向量的存储精度，见QUANTIZATIONS
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"未知的量化方式: {quantization}")
+        self.quantization = quantization
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self.keep_versions = keep_versions
+        self._index = None
+        self._checked_at = 0.0
+
+    @property
+    def versions_dir(self):
+        return os.path.join(self.root, VERSIONS_DIR)
+
+    def current_version(self):
+        """CURRENT中记录的版本号，尚未发布时返回None"""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current(self):
+        """当前版本的索引，尚未发布时返回None"""
+        now = time.monotonic()
+        if self._index is None or now - self._checked_at >= self.refresh_interval:
+            self._checked_at = now
+            version = self.current_version()
+            if version and (self._index is None or self._index.version != version):
+                try:
+                    self._index = MappedVectorIndex(os.path.join(self.versions_dir, version))
+                except (OSError, ValueError, KeyError) as e:
+                    # 版本目录被清理或损坏时继续使用已打开的版本
+                    print(f"打开向量索引版本 {version} 时出错: {e}")
+        return self._index
+
+    def manifest(self):
+        """当前版本的manifest，尚未发布时返回None"""
+        version = self.current_version()
+        if not version:
+            return None
+        try:
+            with open(os.path.join(self.versions_dir, version, "manifest.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def build_lock(self):
+        """跨进程的构建锁，多个工作进程同时启动时只有一个构建索引"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".build.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def publish(self, vectors, documents, source=None, activate=True):
+        """
+        写入新版本，默认同时切换CURRENT，返回版本号
+
+        vectors: (n, d)向量矩阵，documents: 与之一一对应的langchain Document
+        source: 记录到manifest中的数据来源信息，用于判断索引是否需要重建
+        activate: 为False时只写入版本目录，验证通过后再调用activate()切换
+        """
+        if len(vectors) != len(documents):
+            raise ValueError(f"向量数({len(vectors)})与文档数({len(documents)})不一致")
+
+        os.makedirs(self.versions_dir, exist_ok=True)
+        version = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        staging = os.path.join(self.versions_dir, f".{version}.tmp")
+        os.makedirs(staging)
+        try:
+            _write_version(staging, vectors, documents, {
+                "version": version,
+                "count": len(documents),
+                "dimensions": int(np.shape(vectors)[1]) if len(vectors) else 0,
+                "quantization": self.quantization,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "source": source or {},
+            })
+            os.rename(staging, os.path.join(self.versions_dir, version))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        if activate:
+            self.activate(version)
+        return version
+
+    def open_version(self, version):
+        """打开指定版本(不切换CURRENT)，用于发布前的验证"""
+        return MappedVectorIndex(os.path.join(self.versions_dir, version))
+
+    def activate(self, version, index=None):
+        """
+        把CURRENT原子地指向version
+
+        index: 已打开的该版本索引，传入时本进程立即换用，不必等待下一次检查
+        """
+        pointer = os.path.join(self.root, f".{CURRENT_FILE}.tmp")
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer, os.path.join(self.root, CURRENT_FILE))
+
+        if index is not None:
+            # 单次引用赋值，正在检索的请求仍持有旧索引并在旧版本上完成
+            self._index = index
+            self._checked_at = time.monotonic()
+        self._prune(version)
+
+    def discard(self, version):
+        """删除未激活的版本(如验证失败)"""
+        if version != self.current_version():
+            shutil.rmtree(os.path.join(self.versions_dir, version), ignore_errors=True)
+
+    def _prune(self, current):
+        """删除较旧的版本，只保留最近keep_versions个；已映射旧版本的进程在Linux上仍可继续读取"""
+        versions = sorted(name for name in os.listdir(self.versions_dir) if not name.startswith("."))
+        for name in versions[:-self.keep_versions]:
+            if name != current:
+                shutil.rmtree(os.path.join(self.versions_dir, name), ignore_errors=True)
+
+
+class EmbeddingCache:
+    """
+    查询向量的LRU缓存，相同问题不再重复请求向量化接口
+
+    向量按dtype(默认float16)存储，占用为float32的一半；取出时转换回float32。
+    """
+
+    def __init__(self, max_entries=2048, dtype=np.float16):
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        with self._lock:
+            vector = self._entries.get(text)
+            if vector is None:
+                return None
+            self._entries.move_to_end(text)
+        return vector.astype(np.float32)
+
+    def put(self, text, vector):
+        with self._lock:
+            self._entries[text] = np.asarray(vector, dtype=self.dtype)
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)